@@ -0,0 +1,244 @@
+# agent/admission.py
+"""
+Admission control for /ws/voice/, decided before accept() and before any
+DB or upstream work, so that an overload spike is turned away at the door
+instead of slowing down every call already in progress.
+
+A new session needs, in this order:
+
+  1. fewer than ADMISSION_MAX_SESSIONS_PER_USER sessions for its user_id
+     in this process (else refused at once: the user's own calls won't end
+     for a while)
+  2. one of ADMISSION_MAX_SESSIONS slots in this process; when all are
+     taken it queues (at most ADMISSION_MAX_QUEUED) for a slot to free up
+  3. a token from the fleet-wide bucket in Redis, refilled at
+     ADMISSION_RATE_PER_S up to ADMISSION_BURST; when it's empty the
+     session waits for the next token
+
+Waiting is bounded by ADMISSION_QUEUE_TIMEOUT_S, which has to stay below
+Daphne's WebSocket handshake timeout (5 s by default). Refused sessions
+are accepted and closed at once with the reason's code in CLOSE_CODES
+(Daphne drops close reasons, so the code is all the client gets). 0 turns
+each limit off. Without
+Redis the bucket admits everyone (and retries Redis after
+ADMISSION_RETRY_S).
+"""
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import redis
+import redis.asyncio
+
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_SESSIONS = int(os.getenv("ADMISSION_MAX_SESSIONS", "0"))
+ADMISSION_MAX_SESSIONS_PER_USER = int(os.getenv("ADMISSION_MAX_SESSIONS_PER_USER", "0"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "100"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "2"))
+# new sessions per second across all workers sharing the Redis
+ADMISSION_RATE_PER_S = float(os.getenv("ADMISSION_RATE_PER_S", "0"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "20"))
+ADMISSION_REDIS_URL = os.getenv(
+    "ADMISSION_REDIS_URL",
+    "" if os.getenv("CHANNEL_LAYER") == "memory" else os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+)
+ADMISSION_RETRY_S = 30.0
+
+BUCKET_KEY = "agent:admission:bucket"
+
+# refusal reason -> close code (4029: like HTTP 429)
+CLOSE_CODES = {"busy": 4029, "rate_limited": 4030, "user_limit": 4031}
+
+# refill by elapsed (Redis) time, take one token if there is one;
+# returns {taken, seconds until the next token}
+_TAKE_TOKEN = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local taken = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  taken = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {taken, tostring((1 - tokens) / rate)}
+"""
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_sessions: int = ADMISSION_MAX_SESSIONS,
+        max_per_user: int = ADMISSION_MAX_SESSIONS_PER_USER,
+        max_queued: int = ADMISSION_MAX_QUEUED,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_S,
+        rate: float = ADMISSION_RATE_PER_S,
+        burst: int = ADMISSION_BURST,
+        url: str = ADMISSION_REDIS_URL,
+    ):
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        self.url = url
+
+        self.active = 0
+        self.per_user: Dict[str, int] = {}
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._take = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {}
+        self.redis_errors = 0
+
+    async def admit(self, user_id: str) -> Optional[str]:
+        """
+        None when the session may go ahead (then release(user_id) exactly
+        once when it ends), else why not.
+        """
+        if self.max_per_user and self.per_user.get(user_id, 0) >= self.max_per_user:
+            return self._reject("user_limit")
+        # counted from here, so a burst of connects from one user is too
+        self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.queue_timeout
+        try:
+            if not await self._acquire_slot(deadline):
+                self._forget_user(user_id)
+                return self._reject("busy")
+        except asyncio.CancelledError:
+            self._forget_user(user_id)
+            raise
+        try:
+            taken = await self._take_token(deadline)
+        except asyncio.CancelledError:
+            self.release(user_id)
+            raise
+        if not taken:
+            self.release(user_id)
+            return self._reject("rate_limited")
+
+        if loop.time() > started:
+            ADMISSION_WAIT.observe(loop.time() - started)
+        self.admitted += 1
+        return None
+
+    def release(self, user_id: str):
+        self._forget_user(user_id)
+        self._release_slot()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "redis_errors": self.redis_errors,
+        }
+
+    # ---- per-process slots ----
+
+    async def _acquire_slot(self, deadline: float) -> bool:
+        if not self.max_sessions or (self.active < self.max_sessions and not self._waiters):
+            self.active += 1
+            ADMISSION_ACTIVE.set(self.active)
+            return True
+        loop = asyncio.get_running_loop()
+        if len(self._waiters) >= self.max_queued or deadline <= loop.time():
+            return False
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        ADMISSION_QUEUED.inc()
+        try:
+            # the slot is handed over by _release_slot, already counted
+            await asyncio.wait_for(waiter, deadline - loop.time())
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()  # handed over just as the client gave up
+            raise
+        finally:
+            ADMISSION_QUEUED.dec()
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return  # the slot goes straight to the next in line
+        self.active -= 1
+        ADMISSION_ACTIVE.set(self.active)
+
+    # ---- fleet-wide token bucket ----
+
+    async def _take_token(self, deadline: float) -> bool:
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = self._conn()
+            if conn is None:
+                return True
+            try:
+                taken, wait = await self._take(keys=[BUCKET_KEY], args=[self.rate, self.burst], client=conn)
+            except (redis.RedisError, OSError) as e:
+                self.redis_errors += 1
+                self._redis_down_until = time.monotonic() + ADMISSION_RETRY_S
+                logger.warning("Admission: Redis unavailable for %s s, not rate limiting: %s", ADMISSION_RETRY_S, e)
+                return True
+            if taken:
+                return True
+            wait = float(wait)
+            if loop.time() + wait > deadline:
+                return False
+            await asyncio.sleep(wait)
+
+    def _conn(self):
+        if not self.rate or not self.url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.asyncio.Redis.from_url(
+                self.url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+            self._take = self._redis.register_script(_TAKE_TOKEN)
+        return self._redis
+
+    def _forget_user(self, user_id: str):
+        count = self.per_user.get(user_id, 0) - 1
+        if count > 0:
+            self.per_user[user_id] = count
+        else:
+            self.per_user.pop(user_id, None)
+
+    def _reject(self, reason: str) -> str:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        ADMISSION_REJECTED.labels(reason).inc()
+        return reason
+
+
+admission = AdmissionController()
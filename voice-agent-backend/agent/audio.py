@@ -0,0 +1,210 @@
+# agent/audio.py
+import os
+import asyncio
+import logging
+from math import gcd
+from typing import Callable, Awaitable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Realtime API "pcm16" = 16-bit little-endian mono at 24 kHz
+UPSTREAM_SAMPLE_RATE = 24000
+BYTES_PER_SAMPLE = 2
+
+# Uplink coalescing: batch the tiny AudioWorklet frames (128 samples / ~8 ms)
+# into larger input_audio_buffer.append events.
+UPLINK_FRAME_MS = int(os.getenv("UPLINK_FRAME_MS", "40"))
+UPLINK_MAX_LATENCY_MS = int(os.getenv("UPLINK_MAX_LATENCY_MS", "60"))
+
+# What we assume about the browser until start_session says otherwise
+# (VoiceChat.vue captures with AudioContext({ sampleRate: 16000 }))
+DEFAULT_CLIENT_INPUT_RATE = int(os.getenv("CLIENT_INPUT_SAMPLE_RATE", "16000"))
+DEFAULT_CLIENT_OUTPUT_RATE = int(
+    os.getenv("CLIENT_OUTPUT_SAMPLE_RATE", str(UPSTREAM_SAMPLE_RATE))
+)
+RESAMPLER_TAPS_PER_PHASE = int(os.getenv("RESAMPLER_TAPS_PER_PHASE", "16"))
+
+
+class UplinkCoalescer:
+    """
+    Collects incoming PCM16 frames and hands them to `flush_cb` in batches of
+    roughly `frame_ms` of audio. Anything left in the buffer is flushed after
+    `max_latency_ms` so a trailing partial frame never waits forever.
+    `frame_ms=0` disables batching (every frame is forwarded as-is).
+    """
+
+    def __init__(
+        self,
+        flush_cb: Callable[[bytes], Awaitable[None]],
+        sample_rate: int = UPSTREAM_SAMPLE_RATE,
+        frame_ms: int = UPLINK_FRAME_MS,
+        max_latency_ms: int = UPLINK_MAX_LATENCY_MS,
+    ):
+        self.flush_cb = flush_cb
+        self.frame_ms = frame_ms
+        self.max_latency_ms = max_latency_ms
+        self.target_bytes = sample_rate * BYTES_PER_SAMPLE * frame_ms // 1000
+        self.target_bytes -= self.target_bytes % BYTES_PER_SAMPLE
+
+        self._buf = bytearray()
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_task: Optional[asyncio.Task] = None
+
+        # counters for tuning message rate vs. added latency
+        self.frames_in = 0
+        self.frames_out = 0
+        self.bytes_in = 0
+        self.timer_flushes = 0
+        self.timer_flush_errors = 0
+
+    async def push(self, pcm_bytes: bytes):
+        self.frames_in += 1
+        self.bytes_in += len(pcm_bytes)
+        # frames wait while a batch is being sent, so none pile onto the
+        # next one beyond target_bytes (and order is kept)
+        async with self._lock:
+            self._buf += pcm_bytes
+            if len(self._buf) >= self.target_bytes:
+                self._cancel_timer()
+                await self._send_buffered()
+                return
+        if self._timer is None and self.max_latency_ms > 0:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(
+                self.max_latency_ms / 1000, self._on_timer
+            )
+
+    async def flush(self):
+        self._cancel_timer()
+        async with self._lock:
+            await self._send_buffered()
+
+    async def _send_buffered(self):
+        if not self._buf:
+            return
+        data = bytes(self._buf)
+        self._buf.clear()
+        self.frames_out += 1
+        await self.flush_cb(data)
+
+    def close(self):
+        self._cancel_timer()
+        # a timer flush already running must not send into a closed bridge
+        if self._timer_task is not None and self._timer_task is not asyncio.current_task():
+            self._timer_task.cancel()
+        self._timer_task = None
+        self._buf.clear()
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_out": self.frames_out,
+            "bytes_in": self.bytes_in,
+            "timer_flushes": self.timer_flushes,
+            "timer_flush_errors": self.timer_flush_errors,
+            "buffered_bytes": len(self._buf),
+        }
+
+    def _on_timer(self):
+        self._timer = None
+        self.timer_flushes += 1
+        self._timer_task = asyncio.create_task(self._flush_on_timer())
+
+    async def _flush_on_timer(self):
+        # nobody awaits this task, so a failed send is reported here
+        try:
+            await self.flush()
+        except Exception as e:
+            self.timer_flush_errors += 1
+            logger.warning("Uplink timer flush failed, batch dropped: %s", e)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class StreamingResampler:
+    """
+    Rational polyphase resampler for PCM16 mono streams.
+
+    Filter history, output phase and any odd trailing byte are kept between
+    calls, so a stream split into arbitrary chunks resamples exactly like the
+    whole stream would (no clicks at chunk boundaries).
+    """
+
+    def __init__(
+        self,
+        src_rate: int,
+        dst_rate: int,
+        taps_per_phase: int = RESAMPLER_TAPS_PER_PHASE,
+    ):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        g = gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        self.passthrough = self.up == self.down
+
+        self._taps = taps_per_phase
+        self._history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self._pos = (taps_per_phase - 1) * self.up
+        self._odd = b""
+
+        if not self.passthrough:
+            self._bank = self._design_bank()
+
+    def _design_bank(self) -> np.ndarray:
+        up, taps = self.up, self._taps
+        n = up * taps
+        # low-pass at the lower of the two Nyquist rates (upsampled domain)
+        cutoff = 1.0 / max(self.up, self.down)
+        t = np.arange(n) - (n - 1) / 2
+        h = cutoff * np.sinc(cutoff * t) * np.kaiser(n, 8.0)
+        h *= up / h.sum()
+        # bank[p, m] multiplies x[i - (taps - 1) + m] for output phase p
+        bank = h.reshape(taps, up).T[:, ::-1]
+        return np.ascontiguousarray(bank, dtype=np.float32)
+
+    def process(self, pcm_bytes: bytes) -> bytes:
+        if self.passthrough:
+            return pcm_bytes
+
+        data = self._odd + pcm_bytes
+        if len(data) % 2:
+            self._odd = data[-1:]
+            data = data[:-1]
+        else:
+            self._odd = b""
+        if not data:
+            return b""
+
+        x = np.concatenate(
+            (self._history, np.frombuffer(data, dtype="<i2").astype(np.float32))
+        )
+        hist = self._taps - 1
+        total = len(x) * self.up
+        count = -(-(total - self._pos) // self.down) if total > self._pos else 0
+
+        if count:
+            t = self._pos + np.arange(count) * self.down
+            idx = t // self.up
+            windows = np.lib.stride_tricks.sliding_window_view(x, self._taps)
+            y = np.einsum("ij,ij->i", windows[idx - hist], self._bank[t % self.up])
+            self._pos = int(t[-1]) + self.down
+        else:
+            y = np.empty(0, dtype=np.float32)
+
+        # shift positions so the kept history starts at index 0 again
+        self._pos -= (len(x) - hist) * self.up
+        self._history = x[-hist:].copy() if hist else x[:0]
+
+        return np.clip(np.rint(y), -32768, 32767).astype("<i2").tobytes()
+
+    def reset(self):
+        self._history[:] = 0
+        self._pos = (self._taps - 1) * self.up
+        self._odd = b""
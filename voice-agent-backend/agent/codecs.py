@@ -0,0 +1,119 @@
+# agent/codecs.py
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from .audio import UPSTREAM_SAMPLE_RATE, BYTES_PER_SAMPLE
+
+try:
+    import opuslib
+except Exception:  # opuslib raises a bare Exception when libopus is missing
+    opuslib = None
+
+OPUS_AVAILABLE = opuslib is not None
+
+# Opus runs natively at 24 kHz, so no resampling is needed on either side
+OPUS_SAMPLE_RATE = UPSTREAM_SAMPLE_RATE
+OPUS_FRAME_MS = int(os.getenv("OPUS_FRAME_MS", "20"))
+OPUS_BITRATE = int(os.getenv("OPUS_BITRATE", "24000"))
+OPUS_MIN_BITRATE = 6000
+OPUS_MAX_BITRATE = 128000
+OPUS_POOL_SIZE = int(os.getenv("OPUS_POOL_SIZE", "64"))
+
+# largest packet we accept from a client: 120 ms
+_MAX_DECODE_SAMPLES = OPUS_SAMPLE_RATE * 120 // 1000
+
+
+class OpusSessionCodec:
+    """
+    Encoder/decoder pair for one voice session.
+
+    decode(): one client Opus packet -> PCM16 @ 24 kHz (ready for the bridge)
+    encode(): PCM16 @ 24 kHz from the bridge -> list of Opus packets; the
+              remainder that doesn't fill a frame waits for the next call.
+    """
+
+    def __init__(self, bitrate: int = OPUS_BITRATE, frame_ms: int = OPUS_FRAME_MS):
+        if opuslib is None:
+            raise RuntimeError("Opus support needs opuslib and libopus installed")
+        self.frame_samples = OPUS_SAMPLE_RATE * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * BYTES_PER_SAMPLE
+        self.encoder = opuslib.Encoder(OPUS_SAMPLE_RATE, 1, opuslib.APPLICATION_VOIP)
+        self.decoder = opuslib.Decoder(OPUS_SAMPLE_RATE, 1)
+        self._pending = bytearray()
+        self.set_bitrate(bitrate)
+
+    def set_bitrate(self, bitrate: int):
+        self.bitrate = max(OPUS_MIN_BITRATE, min(OPUS_MAX_BITRATE, int(bitrate)))
+        self.encoder.bitrate = self.bitrate
+
+    def decode(self, packet: bytes) -> bytes:
+        try:
+            return self.decoder.decode(packet, _MAX_DECODE_SAMPLES)
+        except opuslib.OpusError:
+            # corrupt/truncated packet from the client: drop it
+            return b""
+
+    def encode(self, pcm_bytes: bytes) -> List[bytes]:
+        self._pending += pcm_bytes
+        packets = []
+        while len(self._pending) >= self.frame_bytes:
+            frame = bytes(self._pending[: self.frame_bytes])
+            del self._pending[: self.frame_bytes]
+            packets.append(self.encoder.encode(frame, self.frame_samples))
+        return packets
+
+    def flush(self) -> Tuple[List[bytes], int]:
+        """Encodes the tail of a response, padded with silence so nothing is
+        dropped. Returns the packets and how many PCM bytes of them were real
+        audio (what the client will actually have played)."""
+        tail = len(self._pending)
+        if not tail:
+            return [], 0
+        self._pending += b"\x00" * (self.frame_bytes - tail)
+        return self.encode(b""), tail
+
+    def discard_pending(self):
+        # drop a half-filled frame (barge-in) without touching codec state
+        self._pending.clear()
+
+    def reset(self):
+        self._pending.clear()
+        self.encoder.reset_state()
+        self.decoder.reset_state()
+
+
+class OpusCodecPool:
+    """
+    Process-wide free list of OpusSessionCodec objects so call setup doesn't
+    allocate fresh libopus state every time. Codecs are reset on release.
+    """
+
+    def __init__(self, max_size: int = OPUS_POOL_SIZE):
+        self.max_size = max_size
+        self._free: List[OpusSessionCodec] = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, bitrate: int = OPUS_BITRATE) -> Optional[OpusSessionCodec]:
+        if not OPUS_AVAILABLE:
+            return None
+        with self._lock:
+            codec = self._free.pop() if self._free else None
+        if codec is None:
+            codec = OpusSessionCodec(bitrate)
+            self.created += 1
+        else:
+            codec.set_bitrate(bitrate)
+            self.reused += 1
+        return codec
+
+    def release(self, codec: OpusSessionCodec):
+        codec.reset()
+        with self._lock:
+            if len(self._free) < self.max_size:
+                self._free.append(codec)
+
+
+opus_pool = OpusCodecPool()
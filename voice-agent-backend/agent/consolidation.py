@@ -0,0 +1,334 @@
+# agent/consolidation.py
+import os
+import re
+import hashlib
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MemoryType, UserMemory, UserProfile
+from .retrieval import embed_memories, memory_indexes
+from .prompt_cache import memory_cache
+
+# n-gram Jaccard similarity above which two memories of the same type are
+# treated as the same memory
+MEMORY_SIMILARITY_THRESHOLD = float(os.getenv("MEMORY_SIMILARITY_THRESHOLD", "0.6"))
+MEMORY_NGRAM = 3
+MEMORY_MAX_IMPORTANCE = 10
+# newest history summaries kept as they are; older ones are rolled into one
+HISTORY_SUMMARIES_KEPT = int(os.getenv("HISTORY_SUMMARIES_KEPT", "5"))
+HISTORY_ROLLUP_MAX_CHARS = int(os.getenv("HISTORY_ROLLUP_MAX_CHARS", "2000"))
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACE = re.compile(r"\s+")
+# words that don't change what a memory says ("User prefers" == "prefers")
+_STOPWORDS = {"the", "a", "an", "user", "user's", "users", "they", "he", "she", "is", "are", "to"}
+
+
+def normalize(text: str) -> str:
+    text = _NON_WORD.sub(" ", text.lower())
+    return " ".join(w for w in _SPACE.split(text) if w and w not in _STOPWORDS)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode()).hexdigest()
+
+
+def ngrams(text: str, n: int = MEMORY_NGRAM) -> Set[str]:
+    norm = normalize(text)
+    if len(norm) <= n:
+        return {norm}
+    return {norm[i:i + n] for i in range(len(norm) - n + 1)}
+
+
+def similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Candidate:
+    __slots__ = ("key", "hash", "grams", "seq")
+
+    def __init__(self, key, content: str):
+        self.key = key  # a stored row's pk, or the new memory itself
+        self.hash = content_hash(content)
+        self.grams = ngrams(content)
+        self.seq = 0
+
+
+class _Matcher:
+    """
+    The memory a text restates, among those added so far of the same type:
+    same normalized text, else the best n-gram similarity >= the threshold.
+    Only memories sharing an n-gram with the text are scored (an inverted
+    index per type), so a lookup doesn't compare against every row.
+    """
+
+    def __init__(self):
+        self._by_hash: Dict[Tuple[str, str], _Candidate] = {}
+        self._by_gram: Dict[Tuple[str, str], List[_Candidate]] = {}
+        self._added = 0
+
+    def add(self, type_: str, candidate: _Candidate):
+        self._added += 1
+        candidate.seq = self._added
+        self._by_hash.setdefault((type_, candidate.hash), candidate)
+        for gram in candidate.grams:
+            self._by_gram.setdefault((type_, gram), []).append(candidate)
+
+    def replace(self, type_: str, candidate: _Candidate, content: str):
+        """The memory behind `candidate` now says `content`: match against that."""
+        if self._by_hash.get((type_, candidate.hash)) is candidate:
+            del self._by_hash[(type_, candidate.hash)]
+        for gram in candidate.grams:
+            self._by_gram[(type_, gram)].remove(candidate)
+        self.add(type_, _Candidate(candidate.key, content))
+
+    def match(self, type_: str, content: str) -> Optional[_Candidate]:
+        found = self._by_hash.get((type_, content_hash(content)))
+        if found is not None:
+            return found
+        grams = ngrams(content)
+        shared: Dict[int, int] = {}
+        candidates: Dict[int, _Candidate] = {}
+        for gram in grams:
+            for candidate in self._by_gram.get((type_, gram), ()):
+                key = id(candidate)
+                shared[key] = shared.get(key, 0) + 1
+                candidates[key] = candidate
+        best, best_rank = None, (MEMORY_SIMILARITY_THRESHOLD, 0)
+        for key, common in shared.items():
+            candidate = candidates[key]
+            # ties go to the one added last
+            rank = (common / (len(grams) + len(candidate.grams) - common), candidate.seq)
+            if rank >= best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+
+class ConsolidationPlan:
+    """What consolidate_memories will write, worked out without any lock."""
+
+    __slots__ = ("user_id", "created", "bumps", "stats")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.created: List[UserMemory] = []  # unsaved, embedded
+        # stored row pk -> the new memories restating it, in order
+        self.bumps: Dict[int, List[dict]] = {}
+        self.stats = {"inserted": 0, "merged": 0, "rolled_up": 0}
+
+
+def plan_consolidation(user_id: str, new_memories: List[dict]) -> ConsolidationPlan:
+    """
+    Match freshly extracted memories against the user's stored ones of the
+    same types. Reads only, outside any transaction: run it before taking
+    the write lock (apply_consolidation).
+    """
+    plan = ConsolidationPlan(user_id)
+    new_memories = [
+        dict(mem, content=(mem.get("content") or "").strip())
+        for mem in new_memories
+        if (mem.get("content") or "").strip()
+    ]
+    if not new_memories:
+        return plan
+    matcher = _Matcher()
+    stored = (
+        UserMemory.objects.filter(user_id=user_id, type__in={mem["type"] for mem in new_memories})
+        .order_by("created_at", "id")
+        .values_list("pk", "type", "content")
+    )
+    for pk, type_, content in stored.iterator():
+        matcher.add(type_, _Candidate(pk, content))
+
+    for mem in new_memories:
+        importance = int(mem.get("importance", 5))
+        match = matcher.match(mem["type"], mem["content"])
+        if match is None:
+            memory = UserMemory(user_id=user_id, type=mem["type"], content=mem["content"], importance=importance)
+            plan.created.append(memory)
+            matcher.add(mem["type"], _Candidate(memory, mem["content"]))
+            plan.stats["inserted"] += 1
+        elif isinstance(match.key, UserMemory):
+            _bump(match.key, mem["content"], importance, None)  # said twice in one batch
+            plan.stats["merged"] += 1
+        else:
+            plan.bumps.setdefault(match.key, []).append(dict(mem, importance=importance))
+            plan.stats["merged"] += 1
+        if match is not None and match.hash != content_hash(mem["content"]):
+            matcher.replace(mem["type"], match, mem["content"])
+    embed_memories(plan.created)
+    return plan
+
+
+def apply_consolidation(plan: ConsolidationPlan) -> Dict[str, int]:
+    """
+    Write a plan: bump the matched rows, insert the rest, roll up old
+    history summaries. Run inside a transaction; it only locks and reads the
+    matched rows and the (few) history summaries.
+    """
+    now = timezone.now()
+    user, _created = UserProfile.objects.get_or_create(id=plan.user_id)
+    created = list(plan.created)
+    for memory in created:
+        memory.user = user
+    touched: Dict[int, UserMemory] = {}
+
+    matched = {m.pk: m for m in UserMemory.objects.select_for_update().filter(pk__in=list(plan.bumps))}
+    reworded: List[UserMemory] = []
+    for pk, mems in plan.bumps.items():
+        memory = matched.get(pk)
+        if memory is None:
+            # folded or rolled up since the plan was made: keep what was said
+            first, mems = mems[0], mems[1:]
+            memory = UserMemory(user=user, type=first["type"], content=first["content"], importance=first["importance"])
+            created.append(memory)
+            reworded.append(memory)
+        else:
+            touched[pk] = memory
+        for mem in mems:
+            if _bump(memory, mem["content"], mem["importance"], now) and memory not in reworded:
+                reworded.append(memory)
+    embed_memories(reworded)
+
+    stats = dict(plan.stats)
+    duplicates: List[int] = []
+    stats["rolled_up"] = _roll_up(user, created, touched, duplicates, now)
+    _write(plan.user_id, created, touched, duplicates)
+    return stats
+
+
+def consolidate_memories(user_id: str, new_memories: List[dict]) -> Dict[str, int]:
+    """
+    Merge freshly extracted memories into the user's existing ones.
+
+    A new memory matching an existing one of the same type (same normalized
+    text, or n-gram similarity >= MEMORY_SIMILARITY_THRESHOLD) bumps that
+    row's importance and updated_at instead of adding a row; unless the
+    normalized text is the same, its content replaces the row's ("User is
+    35" updates "User is 34" rather than reinforcing it). History
+    summaries beyond the newest HISTORY_SUMMARIES_KEPT are rolled into the
+    oldest one. Matching runs first, without a lock; the writes then go out
+    in bulk inside one short transaction.
+    """
+    plan = plan_consolidation(user_id, new_memories)
+    with transaction.atomic():
+        return apply_consolidation(plan)
+
+
+def deduplicate_memories(user_id: str) -> Dict[str, int]:
+    """
+    Fold near-duplicates already in the table (rows stored before
+    consolidation existed) into their oldest copy, which takes the newest
+    copy's content, and roll up old history
+    summaries; `manage.py consolidate_memories`, not the per-session job.
+    The scan runs before the transaction.
+    """
+    now = timezone.now()
+    matcher = _Matcher()
+    folds: Dict[int, List[int]] = {}  # kept pk -> duplicate pks
+    stored = (
+        UserMemory.objects.filter(user_id=user_id).order_by("created_at", "id").values_list("pk", "type", "content")
+    )
+    for pk, type_, content in stored.iterator():
+        match = matcher.match(type_, content)
+        if match is None:
+            matcher.add(type_, _Candidate(pk, content))
+        else:
+            folds.setdefault(match.key, []).append(pk)
+            if match.hash != content_hash(content):
+                matcher.replace(type_, match, content)
+
+    with transaction.atomic():
+        user, _created = UserProfile.objects.get_or_create(id=user_id)
+        pks = list(folds) + [pk for dups in folds.values() for pk in dups]
+        rows = {m.pk: m for m in UserMemory.objects.select_for_update().filter(pk__in=pks)}
+        touched: Dict[int, UserMemory] = {}
+        duplicates: List[int] = []
+        reworded: List[UserMemory] = []
+        for pk, dups in folds.items():
+            kept = rows.get(pk)
+            if kept is None:
+                continue
+            for dup in (rows[d] for d in dups if d in rows):
+                if _bump(kept, dup.content, dup.importance, now) and kept not in reworded:
+                    reworded.append(kept)
+                duplicates.append(dup.pk)
+            touched[pk] = kept
+        embed_memories(reworded)
+        stats = {"deduplicated": len(duplicates)}
+        stats["rolled_up"] = _roll_up(user, [], touched, duplicates, now)
+        _write(user_id, [], touched, duplicates)
+    return stats
+
+
+def _roll_up(user, created: List[UserMemory], touched: Dict[int, UserMemory], duplicates: List[int], now) -> int:
+    # stored summaries (kept few by this) plus new ones, oldest first; a row
+    # merged into in this pass is taken as merged, not as re-read
+    summaries = [
+        touched.get(m.pk, m)
+        for m in UserMemory.objects.select_for_update()
+        .filter(user=user, type=MemoryType.HISTORY_SUMMARY)
+        .exclude(pk__in=duplicates)
+        .order_by("created_at", "id")
+    ]
+    summaries += [m for m in created if m.type == MemoryType.HISTORY_SUMMARY]
+    rollup, rolled = _roll_up_summaries(summaries, now)
+    if rollup is None:
+        return 0
+    created[:] = [m for m in created if m not in rolled]
+    rolled_ids = [m.pk for m in rolled if m.pk is not None]
+    for pk in rolled_ids:
+        touched.pop(pk, None)
+    duplicates.extend(rolled_ids)
+    embed_memories([rollup])  # rewritten
+    if rollup.pk is not None:
+        touched[rollup.pk] = rollup
+    return len(rolled)
+
+
+def _write(user_id: str, created: List[UserMemory], touched: Dict[int, UserMemory], duplicates: List[int]):
+    if duplicates:
+        UserMemory.objects.filter(pk__in=duplicates).delete()
+    UserMemory.objects.bulk_create(created)
+    # bulk_update skips auto_now, updated_at is set explicitly
+    UserMemory.objects.bulk_update(touched.values(), ["content", "importance", "embedding", "updated_at"])
+    # after commit, so a reader can't re-cache the old rows in between
+    transaction.on_commit(lambda: memory_cache.invalidate(user_id))
+    transaction.on_commit(lambda: memory_indexes.invalidate(user_id))
+
+
+def _bump(memory: UserMemory, content: str, importance: int, now) -> bool:
+    """Merges a newer restatement into `memory`; True if its content changed
+    (the caller re-embeds it)."""
+    # seen again: it matters at least as much as the LLM now says, and a bit more
+    memory.importance = min(MEMORY_MAX_IMPORTANCE, max(memory.importance, importance) + 1)
+    if now is not None:
+        memory.updated_at = now
+    # similar isn't the same: the newer wording wins, so an update ("is 35"
+    # after "is 34", "not vegetarian") replaces the old fact
+    if content_hash(content) == content_hash(memory.content):
+        return False
+    memory.content = content
+    return True
+
+
+def _roll_up_summaries(summaries: List[UserMemory], now):
+    """Folds all but the newest summaries into the oldest one.
+    Returns (rollup row, rows folded into it) or (None, [])."""
+    if len(summaries) <= HISTORY_SUMMARIES_KEPT + 1:
+        return None, []
+    old = summaries[: len(summaries) - HISTORY_SUMMARIES_KEPT]
+    rollup, rolled = old[0], old[1:]
+    parts = [rollup.content] + [m.content for m in rolled]
+    content = " ".join(parts)
+    if len(content) > HISTORY_ROLLUP_MAX_CHARS:
+        # keep the most recent history when the rollup gets long
+        content = "..." + content[-(HISTORY_ROLLUP_MAX_CHARS - 3):]
+    rollup.content = content
+    rollup.importance = max(m.importance for m in old)
+    rollup.updated_at = now
+    return rollup, rolled
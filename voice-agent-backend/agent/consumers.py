@@ -1,61 +1,170 @@
 # agent/consumers.py
 import json
+import time
+import logging
+import asyncio
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from channels.db import database_sync_to_async
-
-from .memory import (
-    get_or_create_user,
-    get_user_memories,
-    create_conversation_session,
-    add_event,
-    build_transcript,
-    update_memories_from_transcript,
+
+from .db import db_sync_to_async
+from .log import FrameLog, bind_session, new_session_context
+from .memory import aadd_events, bootstrap_session
+from .jobs import enqueue_memory_extraction
+from .realtime_bridge import RealtimeBridge, UpstreamLost
+from .event_buffer import EventWriteBuffer
+from .prompts import render_memory_block, render_system_instructions
+from .retrieval import MEMORY_PROMPT_K, memory_indexes
+from .prompt_cache import memory_cache
+from .outbound import OutboundQueue
+from .directory import session_directory, session_group, worker_group
+from .drain import CLOSE_DRAINING, worker_drain
+from .admission import CLOSE_CODES, admission
+from .recorder import start_recording
+from .metrics import (
+    ACTIVE_SESSIONS,
+    AUDIO_BYTES,
+    CONNECT_PHASE,
+    CONTROL_MESSAGES,
+    DB_WRITE,
+    DB_WRITE_ERRORS,
+    FIRST_AUDIO,
+    SESSIONS,
+)
+from .audio import (
+    StreamingResampler,
+    UPSTREAM_SAMPLE_RATE,
+    DEFAULT_CLIENT_INPUT_RATE,
+    DEFAULT_CLIENT_OUTPUT_RATE,
 )
-from .realtime_bridge import RealtimeBridge
+from .codecs import opus_pool, OPUS_BITRATE, OPUS_SAMPLE_RATE
+from .vad import EnergyVAD, TURN_DETECTION, TURN_DETECTION_MODES, SPEECH_STARTED, SPEECH_STOPPED
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+# close code when the client can't keep up (OUTBOUND_OVERFLOW_POLICY=disconnect)
+CLOSE_SLOW_CLIENT = 4008
+# ended from outside (agent.directory.end_session)
+CLOSE_ENDED = 4010
+# drained: the reply in progress was finished; reconnect (lands on another worker)
+CLOSE_DRAINED = 4011
+# the upstream connection dropped and couldn't be re-established
+CLOSE_UPSTREAM_LOST = 4012
+
+# labelled series, looked up once
+_AUDIO_IN_BYTES = AUDIO_BYTES.labels("in")
+_AUDIO_OUT_BYTES = AUDIO_BYTES.labels("out")
+_PHASES = {
+    stage: CONNECT_PHASE.labels(stage[: -len("_ms")])
+    for stage in ("db_ms", "ready_ms", "instructions_ms")
+}
 
 
 class VoiceConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
-        # user_id from query string: /ws/voice/?user_id=123
-        query = self.scope["query_string"].decode()
-        user_id = "anonymous"
-        if "user_id=" in query:
-            user_id = query.split("user_id=")[-1] or "anonymous"
-        self.user_id = user_id
+        connect_started = time.perf_counter()
+        # user_id from query string:
+        # /ws/voice/?user_id=123[&codec=opus&bitrate=24000][&turn_detection=server_vad][&record=1]
+        query = parse_qs(self.scope["query_string"].decode())
+        self.user_id = query.get("user_id", [""])[0] or "anonymous"
+        # every log record from this connection's tasks carries these
+        new_session_context(user_id=self.user_id)
 
-        await self.accept()
+        self.opus = None
+        self.ended = False
+        worker_drain.install()
+        if worker_drain.draining:
+            # this worker is going away; the client retries (elsewhere)
+            await self._refuse(CLOSE_DRAINING, "draining")
+            return
+        # before accept() and any DB or upstream work (agent.admission)
+        refused = await admission.admit(self.user_id)
+        if refused is not None:
+            logger.warning("Session refused: %s %s", refused, admission.stats())
+            await self._refuse(CLOSE_CODES[refused], refused)
+            return
+        self.admitted = True
 
-        # ---- DB operations via database_sync_to_async ----
-        self.user = await database_sync_to_async(get_or_create_user)(self.user_id)
-        memories = await database_sync_to_async(get_user_memories)(self.user_id)
-        self.session = await database_sync_to_async(create_conversation_session)(self.user)
+        try:
+            await self._start_session(query, connect_started)
+        except Exception:
+            # Channels won't call disconnect() for a failed connect: undo
+            # what was set up (admission slot first of all), then close
+            logger.exception("Session start failed")
+            await self._end_session()
+            await self.close(code=CLOSE_UPSTREAM_LOST)
 
-        memory_text = "\n".join(f"- {m}" for m in memories) or "- (no previous memories)"
-        system_instructions = f"""
-You are a friendly real-time voice assistant.
+    async def _start_session(self, query: dict, connect_started: float):
+        # per-frame events, logged as periodic summaries
+        self.audio_in_log = FrameLog(logger, "audio in")
+        self.audio_out_log = FrameLog(logger, "audio out")
+        self.text_out_log = FrameLog(logger, "text deltas out")
 
-You know these things about the user from past interactions:
-{memory_text}
+        self.turn_detection = query.get("turn_detection", [TURN_DETECTION])[0]
+        if self.turn_detection not in TURN_DETECTION_MODES:
+            self.turn_detection = TURN_DETECTION
+        # local_vad: we end the turn ourselves when the uplink goes quiet
+        self.vad = EnergyVAD() if self.turn_detection == "local_vad" else None
 
-Language rules (very important):
-- Always respond in ENGLISH only.
-- Do NOT use Spanish, Korean, or any other language unless the user clearly speaks in that language AND explicitly asks you to reply in that language.
-- If the user speaks in a mix of languages, answer ONLY in English.
-- Never start responses with '¡Claro!', 'Hola', '안녕하세요', or similar non-English greetings.
+        # Client audio format until start_session negotiates something else
+        self._set_audio_format(DEFAULT_CLIENT_INPUT_RATE, DEFAULT_CLIENT_OUTPUT_RATE)
+        if query.get("codec", [""])[0] == "opus":
+            self._enable_opus(query.get("bitrate", [OPUS_BITRATE])[0])
 
-Style:
-- Keep answers short and conversational (2–4 sentences).
-- Speak like you are talking, not writing an essay.
-"""
+        # opt-in recording for latency debugging (agent.recorder)
+        self.recorder = start_recording(
+            self.user_id,
+            query.get("record", [""])[0] == "1",
+            {"turn_detection": self.turn_detection, "worker": session_directory.worker_id},
+        )
 
+        await self.accept()
+        ACTIVE_SESSIONS.inc()
+        SESSIONS.inc()
+        self.counted_active = True
+        worker_drain.add(self)
 
+        # everything for the client goes through one bounded queue + sender task
+        self.outbound = OutboundQueue(
+            send_json=self.send_json,
+            send_bytes=self._send_bytes,
+            on_overflow=self._on_outbound_overflow,
+            on_audio_sent=self._on_audio_sent,
+        )
+        self.ai_speaking = False
+        # perf_counter() when the user's turn ended, until the first reply
+        # audio frame is on the wire to the client
+        self.turn_ended_at = None
+        # close once the reply in progress is done (session.drain)
+        self.draining = False
+        self.close_task = None
+        self.groups = []
 
+        # Upstream handshake and the DB bootstrap run concurrently; `ready`
+        # goes out as soon as the bridge is usable. If memories arrive after
+        # the bridge sent its session config, they follow in a session.update.
+        self.connect_timings = {}
+        self.session = None
+        self.memory_index = None
+        self.memory_count = 0
+        self.prompt_memories = []
+        # what the user said lately, to pick relevant memories
+        self.recent_user_turns = deque(maxlen=3)
+        # at most one memory refresh in flight, off the upstream listen loop
+        self.refresh_task = None
+        self.memories_stale = False
+        # transcript events are written behind, in whole turns
+        self.events = EventWriteBuffer(None, write=self._write_events)
+        initial_instructions = render_system_instructions(render_memory_block([]))
 
         async def on_text(text_delta: str, is_final: bool):
             # Send text delta to client
-            print("SENDING TEXT DELTA TO CLIENT:", repr(text_delta), "final?", is_final)
+            self.text_out_log.add(len(text_delta))
 
-            await self.send_json(
+            self.outbound.put_json(
                 {
                     "type": "ai_text_delta",
                     "text": text_delta,
@@ -63,66 +172,411 @@ Style:
                 }
             )
 
+            # Collect assistant fragments into one event per turn (written behind)
             if text_delta:
-                # Store assistant message fragments as events (DB write)
-                await database_sync_to_async(add_event)(
-                    self.session, "assistant", text_delta
-                )
+                self.events.add_delta("assistant", text_delta)
+            if is_final:
+                self.events.end_turn()
+                if self.draining and self.close_task is None:
+                    self.close_task = asyncio.create_task(self._close_drained())
 
         async def on_audio_chunk(pcm_bytes: bytes):
-            print("SENDING AUDIO CHUNK TO CLIENT, len:", len(pcm_bytes))
-            # Send audio to client as binary
-            await self.send(bytes_data=pcm_bytes)
+            self.audio_out_log.add(len(pcm_bytes))
+            if not self.ai_speaking:
+                self._set_ai_speaking(True)
+            # Send audio to client as binary, in the format the client asked for,
+            # tagged with the assistant item it is part of
+            item_id = self.bridge.audio_item_id
+            if self.opus is not None:
+                for packet in self.opus.encode(pcm_bytes):
+                    self.outbound.put_bytes(packet, self.opus.frame_bytes, item_id)
+                return
+            out_bytes = self.downlink_resampler.process(pcm_bytes)
+            if out_bytes:
+                self.outbound.put_bytes(out_bytes, len(pcm_bytes), item_id)
+
+        async def on_audio_done():
+            if self.opus is not None:
+                # the padding is silence: only the real tail counts as played
+                packets, tail_bytes = self.opus.flush()
+                for packet in packets:
+                    self.outbound.put_bytes(packet, tail_bytes, self.bridge.audio_item_id)
+            self._set_ai_speaking(False)
 
         self.bridge = RealtimeBridge(
-            system_instructions=system_instructions,
+            system_instructions=initial_instructions,
             on_text=on_text,
             on_audio_chunk=on_audio_chunk,
+            on_audio_done=on_audio_done,
+            on_speech_started=self._on_speech_started,
+            on_speech_stopped=self._on_speech_stopped,
+            on_user_transcript=self._on_user_transcript,
+            on_upstream_state=self._on_upstream_state,
         )
+        self.bridge.recorder = self.recorder
+
+        db_task = asyncio.create_task(self._bootstrap_db(connect_started))
+        try:
+            await self.bridge.connect(turn_detection=self.turn_detection)
+        except BaseException:
+            db_task.cancel()
+            raise
+        self.outbound.put_json({"type": "ready"})
+        self._mark("ready_ms", connect_started)
+        self.connect_timings["warm"] = self.bridge.warm
 
-        await self.bridge.connect()
-        await self.send_json({"type": "ready"})
+        instructions = await db_task
+        if self.bridge.sent_instructions != instructions:
+            await self.bridge.update_instructions(instructions)
+            self.connect_timings["late_instructions"] = True
+        self._mark("instructions_ms", connect_started)
+        logger.info("Connect timing: %s", self.connect_timings)
 
-    async def disconnect(self, close_code):
-        # On disconnect, build transcript, update memories
+    async def _refuse(self, code: int, reason: str):
+        # a close code needs an open socket: accept, then close at once
+        await self.accept()
+        await self.close(code=code, reason=reason)
+
+    async def _bootstrap_db(self, connect_started: float) -> str:
+        # one thread hop: upsert user, fetch memories, create the session row
+        self.session, cached = await db_sync_to_async(bootstrap_session)(self.user_id)
+        self._mark("db_ms", connect_started)
+        bind_session(session_id=self.session.pk)
+        if self.recorder is not None:
+            self.recorder.meta(session_id=self.session.pk)
+        self.events.set_session(self.session)
+        await self._join_groups()
+        # nothing said yet: the most important ones (cached per user)
+        self.prompt_memories = cached.memories
+        self.memory_count = cached.count
+        instructions = render_system_instructions(cached.block)
+        # picked up by bridge.connect if it hasn't sent its config yet
+        self.bridge.system_instructions = instructions
+        return instructions
+
+    async def _join_groups(self):
+        # reachable by control messages from any process (agent.directory)
+        if self.channel_layer is not None:
+            groups = [session_group(self.session.pk), worker_group(session_directory.worker_id)]
+            try:
+                await asyncio.gather(*(self.channel_layer.group_add(g, self.channel_name) for g in groups))
+                self.groups = groups
+            except Exception as e:
+                logger.warning("Joining control groups failed: %s", e)
+        session_directory.add(self.session.pk, getattr(self, "channel_name", ""), self.user_id)
+
+    def _mark(self, stage: str, since: float):
+        elapsed = time.perf_counter() - since
+        self.connect_timings[stage] = round(elapsed * 1000, 1)
+        _PHASES[stage].observe(elapsed)
+
+    async def _write_events(self, session, batch):
+        started = time.perf_counter()
         try:
-            transcript = await database_sync_to_async(build_transcript)(self.session)
-            await database_sync_to_async(update_memories_from_transcript)(
-                self.user_id, transcript
-            )
-        except Exception as e:
-            print("Memory update failed:", e)
+            await aadd_events(session, batch)
+        except Exception:
+            DB_WRITE_ERRORS.inc()
+            raise
+        DB_WRITE.observe(time.perf_counter() - started)
+
+    async def disconnect(self, close_code):
+        await self._end_session()
+
+    async def _end_session(self):
+        # On disconnect, flush pending events and queue memory extraction
+        # (run by `manage.py memory_worker`, not on this process's threads).
+        # Also run for a connect that failed half way: once, either way.
+        if self.ended:
+            return
+        self.ended = True
+        if hasattr(self, "events"):
+            await self.events.drain()
+            logger.info("Event buffer stats: %s", self.events.stats())
+            logger.info("Memory cache stats: %s", memory_cache.stats())
+        if getattr(self, "session", None) is not None:
+            session_directory.remove(self.session.pk)
+            groups = getattr(self, "groups", [])
+            # a channel layer error here must not skip the cleanup below
+            # (admission slot, drain count); a stale membership expires
+            try:
+                await asyncio.gather(*(self.channel_layer.group_discard(g, self.channel_name) for g in groups))
+            except Exception as e:
+                logger.warning("Leaving control groups failed: %s", e)
+            try:
+                await db_sync_to_async(enqueue_memory_extraction)(self.session)
+            except Exception as e:
+                logger.warning("Queueing memory extraction failed: %s", e)
+        for task in (getattr(self, "refresh_task", None), getattr(self, "close_task", None)):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
         if hasattr(self, "bridge"):
+            logger.info("Uplink stats: %s", self.bridge.uplink.stats())
             await self.bridge.close()
+        if getattr(self, "recorder", None) is not None:
+            self.recorder.close()
+            self.recorder = None
+        if hasattr(self, "outbound"):
+            logger.info("Outbound stats: %s", self.outbound.stats())
+            await self.outbound.close()
+        if self.opus is not None:
+            opus_pool.release(self.opus)
+            self.opus = None
+        if getattr(self, "counted_active", False):
+            ACTIVE_SESSIONS.dec()
+            self.counted_active = False
+        if getattr(self, "admitted", False):
+            admission.release(self.user_id)
+            self.admitted = False
+        if hasattr(self, "audio_in_log"):
+            for frame_log in (self.audio_in_log, self.audio_out_log, self.text_out_log):
+                frame_log.close()
+        # last: the final session of a draining worker stops the process
+        worker_drain.remove(self)
 
     async def receive(self, text_data=None, bytes_data=None):
+        if not hasattr(self, "bridge") or self.ended:
+            return  # refused or failed at connect, closing
         # Binary = audio frames; Text = control messages
         if bytes_data is not None:
             # Audio from client
-            print("RECEIVED AUDIO BYTES FROM CLIENT:", len(bytes_data))
-            await self.bridge.send_audio_chunk(bytes_data)
+            self.audio_in_log.add(len(bytes_data))
+            _AUDIO_IN_BYTES.inc(len(bytes_data))
+            if self.opus is not None:
+                pcm_bytes = self.opus.decode(bytes_data)
+            else:
+                pcm_bytes = self.uplink_resampler.process(bytes_data)
+            if pcm_bytes:
+                await self.bridge.send_audio_chunk(pcm_bytes)
+                if self.vad is not None:
+                    for vad_event in self.vad.process(pcm_bytes):
+                        await self._on_local_vad(vad_event)
             return
 
         if text_data is not None:
+            if self.recorder is not None:
+                self.recorder.client(text_data)
             data = json.loads(text_data)
             msg_type = data.get("type")
-            print("RECEIVED TEXT MESSAGE FROM CLIENT:", data)
+            logger.info("Client message: %s", msg_type)
 
             if msg_type == "start_session":
-                # Already connected; no-op or reset logic
+                # Already connected; negotiate the client's audio format
+                await self._negotiate_audio(data)
                 return
 
             elif msg_type == "user_transcript":
                 # If you do STT client-side and send the text
-                await database_sync_to_async(add_event)(
-                    self.session, "user", data.get("text", "")
-                )
+                if data.get("text"):
+                    self.bridge.remember("user", data["text"])
+                await self._on_user_transcript(data.get("text", ""))
+
+            elif msg_type == "barge_in":
+                await self._barge_in()
+
+            elif msg_type == "start_speaking":
+                # user started talking over a response the client didn't flag
+                if self.bridge.response_active:
+                    await self._barge_in()
 
             elif msg_type == "stop_speaking":
-                print("STOP_SPEAKING from client → committing & requesting response")
-                await self.bridge.commit_and_request_response()
+                if self.turn_detection == "server_vad":
+                    # upstream ends the turn; just don't sit on buffered audio
+                    await self.bridge.uplink.flush()
+                elif self.vad is None or self.vad.in_speech:
+                    logger.info("stop_speaking from client: committing and requesting response")
+                    if self.vad is not None:
+                        self.vad.reset()
+                    self.turn_ended_at = time.perf_counter()
+                    await self.bridge.commit_and_request_response()
 
             elif msg_type == "end_session":
                 await self.close()
 
+    # ---- control messages from the channel layer (agent.directory) ----
+
+    async def session_end(self, message):
+        CONTROL_MESSAGES.labels("end").inc()
+        logger.info("Session ended from outside: %s", message.get("reason") or "-")
+        await self.close(code=CLOSE_ENDED, reason=message.get("reason") or None)
+
+    async def session_inject(self, message):
+        CONTROL_MESSAGES.labels("inject").inc()
+        if not hasattr(self, "bridge") or self.ended:
+            return  # ending: nothing to say it to
+        logger.info("Injecting instruction (respond=%s)", message.get("respond", False))
+        try:
+            await self.bridge.inject_instruction(message["text"], respond=message.get("respond", False))
+        except UpstreamLost as e:
+            logger.warning("Injecting instruction failed: %s", e)
+
+    async def session_drain(self, message):
+        CONTROL_MESSAGES.labels("drain").inc()
+        if self.draining:
+            return
+        self.draining = True
+        self.outbound.put_json({"type": "draining"})
+        if not (self.ai_speaking or self.bridge.response_active):
+            await self._close_drained()
+        # otherwise on_text closes once the reply is final
+
+    async def _close_drained(self):
+        try:
+            await self.outbound.wait_empty()
+            logger.info("Session drained")
+            await self.close(code=CLOSE_DRAINED)
+        except Exception:
+            logger.exception("Closing the drained session failed")
+
+    async def _on_upstream_state(self, state: str):
+        # the bridge lost its upstream socket ("reconnecting"), got it back
+        # ("connected") or gave up ("lost")
+        self.outbound.put_json({"type": "upstream", "state": state})
+        if state == "reconnecting":
+            self.turn_ended_at = None
+        elif state == "lost":
+            await self.close(code=CLOSE_UPSTREAM_LOST)
+
+    async def _on_user_transcript(self, text: str):
+        # a finished user turn, from client-side STT or upstream transcription
+        self.events.end_turn()
+        self.events.add("user", text)
+        if text:
+            self.recent_user_turns.append(text)
+            # not awaited here: this runs inside the bridge's listen loop
+            self.memories_stale = True
+            if self.refresh_task is None or self.refresh_task.done():
+                self.refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        # turns that come in while a refresh runs are picked up by one more round
+        while self.memories_stale:
+            self.memories_stale = False
+            try:
+                await self._refresh_memories()
+            except UpstreamLost:
+                return
+            except Exception:
+                logger.exception("Memory refresh failed")
+
+    async def _refresh_memories(self):
+        # swap in the memories relevant to what the user is talking about
+        if self.memory_count <= MEMORY_PROMPT_K or self.bridge.ws is None:
+            return  # everything is in the prompt already, or not connected
+        if self.memory_index is None:
+            # only now, and only for users with more memories than fit
+            self.memory_index = await db_sync_to_async(memory_indexes.get)(self.user_id)
+        memories = self.memory_index.search(" ".join(self.recent_user_turns), MEMORY_PROMPT_K)
+        if set(memories) == set(self.prompt_memories):
+            return
+        self.prompt_memories = memories
+        await self.bridge.update_instructions(
+            render_system_instructions(render_memory_block(memories))
+        )
+
+    async def _on_speech_started(self):
+        # server_vad heard the user; only matters if we are talking
+        if self.ai_speaking or self.bridge.response_active:
+            await self._barge_in()
+
+    async def _on_speech_stopped(self):
+        # server_vad ended the user's turn; upstream commits and responds
+        self.turn_ended_at = time.perf_counter()
+
+    async def _on_local_vad(self, vad_event: str):
+        if vad_event == SPEECH_STARTED:
+            await self._on_speech_started()
+        elif vad_event == SPEECH_STOPPED:
+            logger.info("Local VAD end of speech: committing and requesting response")
+            self.turn_ended_at = time.perf_counter()
+            await self.bridge.commit_and_request_response()
+
+    async def _barge_in(self):
+        # stop forwarding what's queued, then cancel/truncate upstream
+        dropped = self.outbound.drop_audio()
+        if self.opus is not None:
+            self.opus.discard_pending()
+        self.downlink_resampler.reset()
+        audio_end_ms = await self.bridge.cancel_response()
+        self.turn_ended_at = None
+        self._set_ai_speaking(False)
+        logger.info("Barge-in: dropped %d queued frames, truncated at %s ms", dropped, audio_end_ms)
 
+    def _set_ai_speaking(self, value: bool):
+        self.ai_speaking = value
+        self.outbound.put_json({"type": "ai_speaking", "value": value})
+
+    def _on_audio_sent(self, played_bytes: int, item_id: Optional[str]):
+        self.bridge.mark_played(played_bytes, item_id)
+        if self.turn_ended_at is not None:
+            # includes the time the reply waited in the outbound queue
+            FIRST_AUDIO.observe(time.perf_counter() - self.turn_ended_at)
+            self.turn_ended_at = None
+
+    async def _send_bytes(self, data: bytes):
+        _AUDIO_OUT_BYTES.inc(len(data))
+        await self.send(bytes_data=data)
+
+    async def _on_outbound_overflow(self):
+        logger.warning("Client too slow, closing session: %s", self.outbound.stats())
+        await self.close(code=CLOSE_SLOW_CLIENT)
+
+    def _set_audio_format(self, input_rate: int, output_rate: int):
+        self.client_input_rate = input_rate
+        self.client_output_rate = output_rate
+        self.uplink_resampler = StreamingResampler(input_rate, UPSTREAM_SAMPLE_RATE)
+        self.downlink_resampler = StreamingResampler(UPSTREAM_SAMPLE_RATE, output_rate)
+
+    def _enable_opus(self, bitrate) -> bool:
+        try:
+            bitrate = int(bitrate)
+        except (TypeError, ValueError):
+            bitrate = OPUS_BITRATE
+        if self.opus is not None:
+            self.opus.set_bitrate(bitrate)
+            return True
+        # None when libopus isn't installed -> stay on PCM16
+        self.opus = opus_pool.acquire(bitrate)
+        return self.opus is not None
+
+    async def _negotiate_audio(self, data: dict):
+        # start_session: {"sample_rate": 16000, "output_sample_rate": 48000,
+        #                 "codec": "pcm16" | "opus", "bitrate": 24000}
+        codec = data.get("codec")
+        if codec == "opus":
+            self._enable_opus(data.get("bitrate", OPUS_BITRATE))
+        elif codec == "pcm16" and self.opus is not None:
+            opus_pool.release(self.opus)
+            self.opus = None
+
+        if self.opus is not None:
+            self.outbound.put_json(
+                {
+                    "type": "sample_rate",
+                    "input": OPUS_SAMPLE_RATE,
+                    "tts": OPUS_SAMPLE_RATE,
+                    "codec": "opus",
+                    "bitrate": self.opus.bitrate,
+                }
+            )
+            return
+
+        def pick_rate(value, default):
+            try:
+                rate = int(value)
+            except (TypeError, ValueError):
+                return default
+            return rate if rate in SUPPORTED_SAMPLE_RATES else default
+
+        input_rate = pick_rate(data.get("sample_rate"), self.client_input_rate)
+        output_rate = pick_rate(data.get("output_sample_rate"), self.client_output_rate)
+        if (input_rate, output_rate) != (self.client_input_rate, self.client_output_rate):
+            self._set_audio_format(input_rate, output_rate)
+
+        self.outbound.put_json(
+            {
+                "type": "sample_rate",
+                "input": self.client_input_rate,
+                "tts": self.client_output_rate,
+                "codec": "pcm16",
+            }
+        )
@@ -0,0 +1,24 @@
+# agent/db.py
+from django.conf import settings
+from channels.db import database_sync_to_async
+
+
+def db_sync_to_async(func):
+    """
+    database_sync_to_async with the threading the DB profile wants: one
+    thread per process for SQLite (a single writer anyway), the ASGI thread
+    pool for Postgres, where the connection pool is sized to match.
+    """
+    return database_sync_to_async(func, thread_sensitive=getattr(settings, "DB_THREAD_SENSITIVE", True))
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created hook: WAL, busy_timeout, synchronous=NORMAL."""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = dict(getattr(settings, "SQLITE_PRAGMAS", {}))
+    if connection.is_in_memory_db():
+        pragmas.pop("journal_mode", None)  # in-memory DBs have no journal to switch
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
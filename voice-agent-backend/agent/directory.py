@@ -0,0 +1,266 @@
+# agent/directory.py
+"""
+Which voice sessions are live, on which worker, and how to reach them.
+
+Every VoiceConsumer joins a per-session group and its worker's group on the
+channel layer, and is listed in a Redis-backed directory:
+
+  agent:session:<id>   hash {channel, worker, user_id, started_at}, with a TTL
+  agent:sessions       sorted set of session ids by expiry
+  agent:worker:<id>    hash {host, pid, sessions, draining, updated}, with a TTL
+
+Entries are written by one heartbeat task per process, never on the connect
+path; a crashed worker's entries expire after SESSION_DIRECTORY_TTL_S.
+
+Control messages go through the channel layer, so they reach the session in
+whichever process holds its socket (see `manage.py voice_sessions`):
+
+  end_session(id)            close the call
+  inject_instruction(id, t)  add a system message to the conversation
+  drain_session(id)          finish the reply in progress, then close so the
+                             client reconnects (to another worker)
+  drain_worker(worker_id)    the same for every session on a worker
+"""
+import os
+import re
+import time
+import socket
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import redis
+import redis.asyncio
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# with the in-memory channel layer nothing is reachable from outside anyway
+SESSION_DIRECTORY_REDIS_URL = os.getenv(
+    "SESSION_DIRECTORY_REDIS_URL",
+    "" if os.getenv("CHANNEL_LAYER") == "memory" else os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+)
+SESSION_DIRECTORY_TTL_S = int(os.getenv("SESSION_DIRECTORY_TTL_S", "60"))
+# after a Redis error, don't try again for this long
+SESSION_DIRECTORY_RETRY_S = 30.0
+
+# set by `manage.py runworkers`; host-pid otherwise
+WORKER_ID = re.sub(r"[^\w\-.]", "-", os.getenv("WORKER_ID", "") or f"{socket.gethostname()}-{os.getpid()}")[:60]
+
+SESSIONS_KEY = "agent:sessions"
+
+
+def session_group(session_id) -> str:
+    return f"voice.session.{session_id}"
+
+
+def worker_group(worker_id: str) -> str:
+    return f"voice.worker.{worker_id}"
+
+
+def _session_key(session_id) -> str:
+    return f"agent:session:{session_id}"
+
+
+def _worker_key(worker_id: str) -> str:
+    return f"agent:worker:{worker_id}"
+
+
+class SessionDirectory:
+    """
+    This process's sessions, mirrored into Redis by a heartbeat task.
+
+    add()/remove() only touch the local table and wake the task; it then
+    writes every local entry (with a fresh TTL) and deletes removed ones in
+    one pipeline. Lookups for control tools go straight to Redis.
+    """
+
+    def __init__(
+        self,
+        url: str = SESSION_DIRECTORY_REDIS_URL,
+        ttl: int = SESSION_DIRECTORY_TTL_S,
+        worker_id: str = WORKER_ID,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.worker_id = worker_id
+        self.draining = False
+        self._local: Dict[str, dict] = {}
+        self._removed: List[str] = []
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.heartbeats = 0
+        self.redis_errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def add(self, session_id, channel_name: str, user_id: str):
+        self._local[str(session_id)] = {
+            "channel": channel_name,
+            "worker": self.worker_id,
+            "user_id": user_id,
+            "started_at": f"{time.time():.3f}",
+        }
+        self._wake()
+
+    def remove(self, session_id):
+        if self._local.pop(str(session_id), None) is not None:
+            self._removed.append(str(session_id))
+            self._wake()
+
+    def set_draining(self, draining: bool = True):
+        # published with the worker entry on the next heartbeat (now)
+        self.draining = draining
+        self._wake()
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    async def lookup(self, session_id) -> Optional[dict]:
+        conn = self._conn()
+        if conn is None:
+            return self._local.get(str(session_id))
+        entry = await conn.hgetall(_session_key(session_id))
+        return _decode(entry) or None
+
+    async def sessions(self, worker_id: Optional[str] = None) -> Dict[str, dict]:
+        """Live sessions (all workers), id -> entry."""
+        conn = self._conn()
+        if conn is None:
+            entries = dict(self._local)
+        else:
+            await conn.zremrangebyscore(SESSIONS_KEY, "-inf", time.time())
+            ids = [i.decode() for i in await conn.zrange(SESSIONS_KEY, 0, -1)]
+            pipe = conn.pipeline()
+            for session_id in ids:
+                pipe.hgetall(_session_key(session_id))
+            entries = {i: _decode(e) for i, e in zip(ids, await pipe.execute()) if e}
+        if worker_id is not None:
+            entries = {i: e for i, e in entries.items() if e["worker"] == worker_id}
+        return entries
+
+    async def workers(self) -> Dict[str, dict]:
+        conn = self._conn()
+        if conn is None:
+            return {self.worker_id: self._worker_entry()}
+        keys = [k.decode() async for k in conn.scan_iter(match=_worker_key("*"))]
+        pipe = conn.pipeline()
+        for key in keys:
+            pipe.hgetall(key)
+        return {
+            key.rsplit(":", 1)[1]: _decode(entry)
+            for key, entry in zip(keys, await pipe.execute())
+            if entry
+        }
+
+    def stats(self) -> dict:
+        return {
+            "worker": self.worker_id,
+            "sessions": len(self._local),
+            "heartbeats": self.heartbeats,
+            "redis_errors": self.redis_errors,
+        }
+
+    # ---- heartbeat ----
+
+    def _wake(self):
+        if not self.enabled:
+            return
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._redis = None  # its connections belong to the old loop
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self._heartbeat()
+            if not self._local and not self._removed:
+                self._task = None
+                return  # started again by the next add()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.ttl / 3)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        conn = self._conn()
+        if conn is None:
+            return
+        removed, self._removed = self._removed, []
+        expires = time.time() + self.ttl
+        try:
+            pipe = conn.pipeline(transaction=False)
+            for session_id, entry in self._local.items():
+                pipe.hset(_session_key(session_id), mapping=entry)
+                pipe.expire(_session_key(session_id), self.ttl)
+            if self._local:
+                pipe.zadd(SESSIONS_KEY, {session_id: expires for session_id in self._local})
+            for session_id in removed:
+                pipe.delete(_session_key(session_id))
+            if removed:
+                pipe.zrem(SESSIONS_KEY, *removed)
+            pipe.hset(_worker_key(self.worker_id), mapping=self._worker_entry())
+            pipe.expire(_worker_key(self.worker_id), self.ttl)
+            await pipe.execute()
+            self.heartbeats += 1
+        except (redis.RedisError, OSError) as e:
+            self._removed = removed + self._removed
+            self.redis_errors += 1
+            self._redis_down_until = time.monotonic() + SESSION_DIRECTORY_RETRY_S
+            logger.warning("Session directory: Redis unavailable for %s s: %s", SESSION_DIRECTORY_RETRY_S, e)
+
+    def _worker_entry(self) -> dict:
+        return {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "sessions": len(self._local),
+            "draining": int(self.draining),
+            "updated": f"{time.time():.3f}",
+        }
+
+    def _conn(self):
+        if not self.url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.asyncio.Redis.from_url(
+                self.url, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self._redis
+
+
+def _decode(entry: dict) -> dict:
+    return {k.decode(): v.decode() for k, v in entry.items()}
+
+
+session_directory = SessionDirectory()
+
+
+# ---- control messages (any process with the channel layer configured) ----
+
+
+async def _send(group: str, message: dict):
+    await get_channel_layer().group_send(group, message)
+
+
+async def end_session(session_id, reason: str = ""):
+    await _send(session_group(session_id), {"type": "session.end", "reason": reason})
+
+
+async def inject_instruction(session_id, text: str, respond: bool = False):
+    await _send(session_group(session_id), {"type": "session.inject", "text": text, "respond": respond})
+
+
+async def drain_session(session_id):
+    await _send(session_group(session_id), {"type": "session.drain"})
+
+
+async def drain_worker(worker_id: str):
+    await _send(worker_group(worker_id), {"type": "session.drain"})
@@ -0,0 +1,115 @@
+# agent/drain.py
+"""
+Worker drain for deploys: on DRAIN_SIGNAL (SIGTERM by default) this process
+stops taking new voice sessions, lets the live ones finish, then shuts the
+server down the way the signal would have.
+
+  - new /ws/voice/ connections are accepted and closed at once with
+    CLOSE_DRAINING, so clients retry elsewhere;
+    /healthz answers 503 so the load balancer stops sending them
+  - live sessions carry on; after DRAIN_TIMEOUT_S they are asked to close
+    after the reply in progress (session.drain), and the process exits
+    once the last one is gone or DRAIN_GRACE_S later
+
+`manage.py runworkers` passes SIGTERM on to every worker. SIGINT still
+stops at once. The handler is installed from inside the server's event
+loop (VoiceConsumer.connect), after Daphne has set up its own.
+"""
+import os
+import signal
+import asyncio
+import logging
+import threading
+from typing import Optional, Set
+
+from .directory import session_directory
+from .metrics import WORKER_DRAINING
+
+logger = logging.getLogger(__name__)
+
+# "" = no drain, the signal stops the server as usual
+DRAIN_SIGNAL = os.getenv("DRAIN_SIGNAL", "SIGTERM")
+DRAIN_TIMEOUT_S = float(os.getenv("DRAIN_TIMEOUT_S", "600"))
+# after asking the remaining sessions to close
+DRAIN_GRACE_S = float(os.getenv("DRAIN_GRACE_S", "30"))
+
+# refused while draining: 1013 ("try again later") in the application
+# range, which is all Daphne will send
+CLOSE_DRAINING = 4013
+
+
+class WorkerDrain:
+    def __init__(
+        self,
+        signal_name: str = DRAIN_SIGNAL,
+        timeout: float = DRAIN_TIMEOUT_S,
+        grace: float = DRAIN_GRACE_S,
+    ):
+        self.signum = getattr(signal, signal_name, None) if signal_name else None
+        self.timeout = timeout
+        self.grace = grace
+        self.draining = False
+        self.sessions: Set[object] = set()  # live VoiceConsumers
+        self._installed = False
+        self._previous = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._timers = []
+
+    def install(self):
+        """Take over the drain signal; idempotent, main thread only."""
+        if self._installed or self.signum is None or threading.current_thread() is not threading.main_thread():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._previous = signal.signal(self.signum, self._on_signal)
+        self._installed = True
+
+    def add(self, consumer):
+        self.sessions.add(consumer)
+
+    def remove(self, consumer):
+        if consumer not in self.sessions:
+            return  # refused while draining
+        self.sessions.discard(consumer)
+        if self.draining and not self.sessions:
+            self.finish()
+
+    def start(self):
+        if self.draining:
+            return
+        self.draining = True
+        session_directory.set_draining()
+        WORKER_DRAINING.set(1)
+        logger.warning("Draining: %d live sessions, no new ones", len(self.sessions))
+        if not self.sessions:
+            self.finish()
+            return
+        loop = asyncio.get_running_loop()
+        self._timers.append(loop.call_later(self.timeout, self._ask_to_close))
+
+    def stats(self) -> dict:
+        return {"draining": self.draining, "sessions": len(self.sessions)}
+
+    def _on_signal(self, signum, frame):
+        # a signal handler: get onto the loop before touching anything
+        self._loop.call_soon_threadsafe(self.start)
+
+    def _ask_to_close(self):
+        logger.warning("Drain timeout: asking %d sessions to close", len(self.sessions))
+        for consumer in list(self.sessions):
+            asyncio.create_task(consumer.session_drain({"type": "session.drain"}))
+        self._timers.append(asyncio.get_running_loop().call_later(self.grace, self.finish))
+
+    def finish(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        logger.warning("Drained, stopping")
+        if not self._installed:
+            return
+        # hand the signal back to the server and let it stop as it would have
+        signal.signal(self.signum, self._previous if self._previous is not None else signal.SIG_DFL)
+        self._installed = False
+        os.kill(os.getpid(), self.signum)
+
+
+worker_drain = WorkerDrain()
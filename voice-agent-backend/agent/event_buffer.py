@@ -0,0 +1,195 @@
+# agent/event_buffer.py
+import os
+import logging
+import asyncio
+from typing import Callable, Awaitable, List, Optional, Tuple
+
+from .memory import aadd_events
+from .metrics import DB_EVENTS_DROPPED, DB_EVENTS_QUEUED, DB_EVENTS_QUEUED_MAX
+from .models import ConversationSession
+
+logger = logging.getLogger(__name__)
+
+EVENT_FLUSH_MAX_EVENTS = int(os.getenv("EVENT_FLUSH_MAX_EVENTS", "20"))
+EVENT_FLUSH_INTERVAL_MS = int(os.getenv("EVENT_FLUSH_INTERVAL_MS", "2000"))
+# a single turn longer than this is written in pieces
+EVENT_MAX_TURN_CHARS = int(os.getenv("EVENT_MAX_TURN_CHARS", "4000"))
+# a failed batch write (e.g. SQLite "database is locked") is retried after
+# RETRY_MS, 2 * RETRY_MS, ... and dropped after MAX_ATTEMPTS failures
+EVENT_FLUSH_MAX_ATTEMPTS = int(os.getenv("EVENT_FLUSH_MAX_ATTEMPTS", "5"))
+EVENT_FLUSH_RETRY_MS = int(os.getenv("EVENT_FLUSH_RETRY_MS", "200"))
+
+Event = Tuple[str, str]  # (role, content)
+
+# queue_depth summed over every buffer in the process, for /metrics
+_queued = 0
+_queued_max = 0
+
+
+def _count_queued(delta: int):
+    global _queued, _queued_max
+    _queued += delta
+    DB_EVENTS_QUEUED.set(_queued)
+    if _queued > _queued_max:
+        _queued_max = _queued
+        DB_EVENTS_QUEUED_MAX.set(_queued_max)
+
+
+class EventWriteBuffer:
+    """
+    Write-behind buffer for one ConversationSession.
+
+    Transcript deltas are joined into whole turns in memory; finished turns
+    are queued and written with bulk_create from a background task, either
+    when `max_events` are queued or `interval_ms` after the first one.
+    Callers never wait on the DB except in drain(). The session row may be
+    attached later with set_session(); nothing is written before that.
+    A failed write goes back to the front of the queue and is retried with
+    backoff; events are only dropped after `max_attempts` failures in a row
+    or at shutdown.
+    """
+
+    def __init__(
+        self,
+        session: Optional[ConversationSession],
+        write: Optional[Callable[[ConversationSession, List[Event]], Awaitable[None]]] = None,
+        max_events: int = EVENT_FLUSH_MAX_EVENTS,
+        interval_ms: int = EVENT_FLUSH_INTERVAL_MS,
+        max_turn_chars: int = EVENT_MAX_TURN_CHARS,
+        max_attempts: int = EVENT_FLUSH_MAX_ATTEMPTS,
+        retry_ms: int = EVENT_FLUSH_RETRY_MS,
+    ):
+        self.session = session
+        self._write = write or aadd_events
+        self.max_events = max_events
+        self.interval_ms = interval_ms
+        self.max_turn_chars = max_turn_chars
+        self.max_attempts = max(1, max_attempts)
+        self.retry_ms = retry_ms
+
+        self._pending: List[Event] = []
+        self._turn_role: Optional[str] = None
+        self._turn: List[str] = []
+        self._turn_chars = 0
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.events_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        # events accepted but not yet committed to the DB
+        return len(self._pending) + self._in_flight
+
+    def set_session(self, session: ConversationSession):
+        self.session = session
+        # whatever queued up while we waited for the row goes out now
+        self._start_flush()
+
+    def add_delta(self, role: str, text: str):
+        if self._turn_role is not None and self._turn_role != role:
+            self.end_turn()
+        self._turn_role = role
+        self._turn.append(text)
+        self._turn_chars += len(text)
+        if self._turn_chars >= self.max_turn_chars:
+            self.end_turn()
+
+    def end_turn(self):
+        if self._turn_role is not None and self._turn:
+            self.add(self._turn_role, "".join(self._turn))
+        self._turn_role = None
+        self._turn = []
+        self._turn_chars = 0
+
+    def add(self, role: str, content: str):
+        if not content:
+            return
+        self._pending.append((role, content))
+        _count_queued(1)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+        if len(self._pending) >= self.max_events:
+            self._start_flush()
+        elif self._timer is None and self._flush_task is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.interval_ms / 1000, self._start_flush)
+
+    async def drain(self):
+        self.end_turn()
+        if self.session is None:
+            if self._pending:
+                logger.warning("Event buffer: no session row, dropping %d events", len(self._pending))
+                self._drop(len(self._pending))
+                self._pending = []
+            return
+        self._start_flush()
+        while self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "events_written": self.events_written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped_events": self.dropped_events,
+        }
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._flush_task is None and self._pending and self.session is not None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        attempts = 0
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                self._in_flight = len(batch)
+                try:
+                    await self._write(self.session, batch)
+                except Exception as e:
+                    attempts += 1
+                    self.failed_flushes += 1
+                    self._in_flight = 0
+                    if attempts >= self.max_attempts:
+                        logger.error("Event flush failed %d times, dropping %d events: %s", attempts, len(batch), e)
+                        self._drop(len(batch))
+                        attempts = 0
+                        continue
+                    # back in front of anything queued since, so order holds
+                    self._pending[:0] = batch
+                    delay = self.retry_ms / 1000 * 2 ** (attempts - 1)
+                    logger.warning("Event flush failed (attempt %d), retrying in %.2f s: %s", attempts, delay, e)
+                    await asyncio.sleep(delay)
+                    continue
+                attempts = 0
+                self._in_flight = 0
+                self.events_written += len(batch)
+                self.flushes += 1
+                _count_queued(-len(batch))
+        except asyncio.CancelledError:
+            # shutting down: nothing is going to write these any more
+            lost = self.queue_depth
+            if lost:
+                logger.warning("Event buffer cancelled, dropping %d events", lost)
+                self._drop(lost)
+                self._pending = []
+                self._in_flight = 0
+            raise
+        finally:
+            self._flush_task = None
+
+    def _drop(self, count: int):
+        self.dropped_events += count
+        DB_EVENTS_DROPPED.inc(count)
+        _count_queued(-count)
@@ -0,0 +1,342 @@
+# agent/fake_realtime.py
+"""
+Local stand-in for the OpenAI Realtime WebSocket API.
+
+Speaks enough of the protocol for RealtimeBridge (session.update,
+input_audio_buffer.*, response.create/cancel, conversation.item.*) and
+answers every turn with a synthetic spoken reply, paced like the real
+service. Point OPENAI_REALTIME_URL at it for offline tests and benchmarks,
+in-process or on its own:
+
+    python -m agent.fake_realtime --port 8765 --first-audio-ms 300 --words-per-s 6
+"""
+import sys
+import json
+import base64
+import asyncio
+import argparse
+import itertools
+from typing import Optional
+
+import numpy as np
+import websockets
+
+from .audio import UPSTREAM_SAMPLE_RATE, BYTES_PER_SAMPLE
+from .vad import EnergyVAD, SPEECH_STARTED, SPEECH_STOPPED
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{next(_ids)}"
+
+
+def reply_audio(ms: int, freq: float = 220.0) -> bytes:
+    t = np.arange(UPSTREAM_SAMPLE_RATE * ms // 1000) / UPSTREAM_SAMPLE_RATE
+    return (4000 * np.sin(2 * np.pi * freq * t)).astype("<i2").tobytes()
+
+
+class FakeRealtimeServer:
+    """
+    first_audio_ms  delay between response.create and the first audio delta
+    reply_ms        length of the spoken reply
+    chunk_ms        audio per response.audio.delta
+    speed           playback speed of the reply (1.0 = real time, 0 = no pacing)
+    words_per_s     transcript pacing, one word per delta on its own clock
+                    (scaled by speed like the audio); 0 = one delta per audio chunk
+    handshake_ms    extra delay before accepting a connection, to stand in
+                    for the TLS + WebSocket handshake to the real service
+    drop_after_chunks  kill the connection (no close frame) after this many
+                    audio deltas of a reply, for reconnect tests; 0 = never
+    drops           how many connections to kill that way
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        first_audio_ms: int = 150,
+        reply_ms: int = 1000,
+        chunk_ms: int = 100,
+        speed: float = 2.0,
+        reply_text: str = "Sure, here is a short answer from the fake upstream.",
+        handshake_ms: int = 0,
+        words_per_s: float = 0,
+        drop_after_chunks: int = 0,
+        drops: int = 1,
+    ):
+        self.host = host
+        self.port = port
+        self.first_audio_ms = first_audio_ms
+        self.reply_ms = reply_ms
+        self.chunk_ms = chunk_ms
+        self.speed = speed
+        self.reply_text = reply_text
+        self.handshake_ms = handshake_ms
+        self.words_per_s = words_per_s
+        self.drop_after_chunks = drop_after_chunks
+        self.drops = drops
+
+        self._server = None
+        self.sessions = []  # every _FakeSession, in connection order
+        self.connections = 0
+        self.active = 0
+        self.responses = 0
+        self.cancelled = 0
+        self.events_in = 0
+        self.dropped = 0
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/v1/realtime"
+
+    async def start(self):
+        self._server = await websockets.serve(
+            self._handle, self.host, self.port, process_request=self._process_request
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        await asyncio.Future()
+
+    async def _process_request(self, connection, request):
+        if self.handshake_ms:
+            await asyncio.sleep(self.handshake_ms / 1000)
+        return None
+
+    async def _handle(self, ws):
+        self.connections += 1
+        self.active += 1
+        session = _FakeSession(self, ws)
+        self.sessions.append(session)
+        try:
+            await session.run()
+        except websockets.ConnectionClosed:
+            pass  # dropped (see drop_after_chunks) or the client went away
+        finally:
+            session.cancel_response()
+            self.active -= 1
+
+
+class _FakeSession:
+    def __init__(self, server: FakeRealtimeServer, ws):
+        self.server = server
+        self.ws = ws
+        self.config = {}
+        self.audio = bytearray()
+        self.vad: Optional[EnergyVAD] = None
+        self.items = []
+        self._response: Optional[asyncio.Task] = None
+        self._response_id: Optional[str] = None
+
+    async def send(self, event: dict):
+        event.setdefault("event_id", _new_id("event"))
+        await self.ws.send(json.dumps(event))
+
+    async def run(self):
+        await self.send({"type": "session.created", "session": {"id": _new_id("sess")}})
+        async for msg in self.ws:
+            self.server.events_in += 1
+            event = json.loads(msg)
+            handler = getattr(self, "on_" + event.get("type", "").replace(".", "_"), None)
+            if handler is None:
+                await self.send({"type": "error", "error": {"message": f"unsupported: {event.get('type')}"}})
+                continue
+            await handler(event)
+
+    # ---- session ----
+    async def on_session_update(self, event):
+        self.config.update(event.get("session", {}))
+        td = self.config.get("turn_detection")
+        if td and td.get("type") == "server_vad":
+            self.vad = EnergyVAD(silence_ms=td.get("silence_duration_ms", 500))
+        else:
+            self.vad = None
+        await self.send({"type": "session.updated", "session": self.config})
+
+    # ---- input audio ----
+    async def on_input_audio_buffer_append(self, event):
+        pcm = base64.b64decode(event["audio"])
+        self.audio += pcm
+        if self.vad is None:
+            return
+        for vad_event in self.vad.process(pcm):
+            if vad_event == SPEECH_STARTED:
+                await self.send({"type": "input_audio_buffer.speech_started"})
+            elif vad_event == SPEECH_STOPPED:
+                await self.send({"type": "input_audio_buffer.speech_stopped"})
+                await self._commit()
+                if self.config["turn_detection"].get("create_response", True):
+                    self._start_response()
+
+    async def on_input_audio_buffer_commit(self, event):
+        await self._commit()
+
+    async def on_input_audio_buffer_clear(self, event):
+        self.audio.clear()
+        await self.send({"type": "input_audio_buffer.cleared"})
+
+    async def _commit(self):
+        if not self.audio:
+            await self.send(
+                {"type": "error", "error": {"code": "input_audio_buffer_commit_empty"}}
+            )
+            return
+        item_id = _new_id("item")
+        self.items.append({"id": item_id, "role": "user", "audio_bytes": len(self.audio)})
+        self.audio.clear()
+        await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+
+    # ---- conversation ----
+    async def on_conversation_item_create(self, event):
+        item = dict(event.get("item", {}))
+        item.setdefault("id", _new_id("item"))
+        self.items.append(item)
+        await self.send({"type": "conversation.item.created", "item": item})
+
+    async def on_conversation_item_truncate(self, event):
+        await self.send(
+            {
+                "type": "conversation.item.truncated",
+                "item_id": event["item_id"],
+                "content_index": event.get("content_index", 0),
+                "audio_end_ms": event["audio_end_ms"],
+            }
+        )
+
+    # ---- responses ----
+    async def on_response_create(self, event):
+        if self._response is not None and not self._response.done():
+            await self.send(
+                {"type": "error", "error": {"code": "conversation_already_has_active_response"}}
+            )
+            return
+        self._start_response()
+
+    async def on_response_cancel(self, event):
+        if self.cancel_response():
+            self.server.cancelled += 1
+            await self.send(
+                {"type": "response.done", "response": {"id": self._response_id, "status": "cancelled"}}
+            )
+
+    def cancel_response(self) -> bool:
+        if self._response is None or self._response.done():
+            return False
+        self._response.cancel()
+        return True
+
+    def _start_response(self):
+        self.server.responses += 1
+        self._response_id = _new_id("resp")
+        self._response = asyncio.create_task(self._stream_response(self._response_id))
+
+    async def _stream_response(self, response_id: str):
+        server = self.server
+        item_id = _new_id("item")
+        ids = {"response_id": response_id, "item_id": item_id, "output_index": 0, "content_index": 0}
+        await self.send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+        await asyncio.sleep(server.first_audio_ms / 1000)
+
+        audio = reply_audio(server.reply_ms)
+        chunk_bytes = UPSTREAM_SAMPLE_RATE * BYTES_PER_SAMPLE * server.chunk_ms // 1000
+        chunks = [audio[i:i + chunk_bytes] for i in range(0, len(audio), chunk_bytes)]
+        words = server.reply_text.split(" ")
+        chunk_s = server.chunk_ms / 1000 / server.speed if server.speed else 0.0
+
+        # (offset in seconds, text before audio at the same offset, event)
+        timeline = [
+            (n * chunk_s, 1, {"type": "response.audio.delta", "delta": base64.b64encode(chunk).decode()})
+            for n, chunk in enumerate(chunks)
+        ]
+        if server.words_per_s:
+            word_s = 1 / server.words_per_s / server.speed if server.speed else 0.0
+            deltas = [(n * word_s, word + " ") for n, word in enumerate(words)]
+        else:
+            per_chunk = -(-len(words) // max(1, len(chunks)))
+            deltas = [
+                (n * chunk_s, " ".join(words[n * per_chunk:(n + 1) * per_chunk]) + " ")
+                for n in range(len(chunks))
+                if words[n * per_chunk:(n + 1) * per_chunk]
+            ]
+        timeline += [(at, 0, {"type": "response.audio_transcript.delta", "delta": d}) for at, d in deltas]
+        timeline.sort(key=lambda entry: entry[:2])
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        chunks_sent = 0
+        for at, _, event in timeline:
+            if at and start + at > loop.time():
+                await asyncio.sleep(start + at - loop.time())
+            await self.send({**event, **ids})
+            if event["type"] == "response.audio.delta":
+                chunks_sent += 1
+                if chunks_sent == server.drop_after_chunks and server.dropped < server.drops:
+                    # the network goes away mid-reply
+                    server.dropped += 1
+                    self.ws.transport.abort()
+                    return
+        # the reply is over when its last chunk has played
+        end = start + len(chunks) * chunk_s
+        if end > loop.time():
+            await asyncio.sleep(end - loop.time())
+
+        await self.send({"type": "response.audio.done", **ids})
+        await self.send({"type": "response.audio_transcript.done", "transcript": server.reply_text, **ids})
+        self.items.append({"id": item_id, "role": "assistant"})
+        await self.send({"type": "response.done", "response": {"id": response_id, "status": "completed"}})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local fake of the OpenAI Realtime WebSocket API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 = any free port")
+    parser.add_argument("--first-audio-ms", type=int, default=150)
+    parser.add_argument("--reply-ms", type=int, default=1000)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=2.0)
+    parser.add_argument("--words-per-s", type=float, default=0)
+    parser.add_argument("--handshake-ms", type=int, default=0)
+    parser.add_argument("--drop-after-chunks", type=int, default=0)
+    parser.add_argument("--drops", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = FakeRealtimeServer(
+            args.host,
+            args.port,
+            first_audio_ms=args.first_audio_ms,
+            reply_ms=args.reply_ms,
+            chunk_ms=args.chunk_ms,
+            speed=args.speed,
+            words_per_s=args.words_per_s,
+            handshake_ms=args.handshake_ms,
+            drop_after_chunks=args.drop_after_chunks,
+            drops=args.drops,
+        )
+        await server.start()
+        # first line on stdout: where to point OPENAI_REALTIME_URL
+        print(server.url, flush=True)
+        await asyncio.Future()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
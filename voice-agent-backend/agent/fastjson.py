@@ -0,0 +1,29 @@
+# agent/fastjson.py
+"""
+JSON for the hot paths (the Realtime event stream): orjson when installed,
+the standard library otherwise. JSON_BACKEND=json forces the latter.
+"""
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_AVAILABLE = orjson is not None
+
+JSON_BACKEND = os.getenv("JSON_BACKEND", "orjson" if ORJSON_AVAILABLE else "json")
+
+if JSON_BACKEND == "orjson" and ORJSON_AVAILABLE:
+    loads = orjson.loads
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+else:
+    JSON_BACKEND = "json"
+    loads = json.loads
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
@@ -0,0 +1,174 @@
+# agent/jobs.py
+import os
+import logging
+import time
+import random
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Optional
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .consolidation import apply_consolidation, plan_consolidation
+from .memory import extract_memories
+from .models import ConversationSession, MemoryJob, MemoryJobStatus
+from .prompt_cache import memory_cache
+from .transcript import condense_transcript
+
+logger = logging.getLogger(__name__)
+
+# LLM calls in flight per worker process
+MEMORY_JOB_CONCURRENCY = int(os.getenv("MEMORY_JOB_CONCURRENCY", "4"))
+MEMORY_JOB_MAX_ATTEMPTS = int(os.getenv("MEMORY_JOB_MAX_ATTEMPTS", "5"))
+MEMORY_JOB_BACKOFF_S = float(os.getenv("MEMORY_JOB_BACKOFF_S", "10"))
+MEMORY_JOB_MAX_BACKOFF_S = float(os.getenv("MEMORY_JOB_MAX_BACKOFF_S", "600"))
+# a running job not finished within this is considered abandoned and re-run
+MEMORY_JOB_LEASE_S = float(os.getenv("MEMORY_JOB_LEASE_S", "300"))
+MEMORY_JOB_POLL_INTERVAL_S = float(os.getenv("MEMORY_JOB_POLL_INTERVAL_S", "2"))
+
+_RUNNABLE = (MemoryJobStatus.PENDING, MemoryJobStatus.RUNNING)
+
+
+def enqueue_memory_extraction(session: ConversationSession) -> Optional[MemoryJob]:
+    """
+    Close the session and queue its memory extraction; None when nothing
+    was said (no LLM call for an empty transcript). Safe to call more than
+    once per session: the first call wins, later ones return that job.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ConversationSession.objects.filter(pk=session.pk, ended_at__isnull=True).update(ended_at=now)
+        if not session.events.exists():
+            return None
+        job, _created = MemoryJob.objects.get_or_create(
+            session=session, defaults={"next_attempt_at": now}
+        )
+    return job
+
+
+def claim_jobs(limit: int, lease_s: float = MEMORY_JOB_LEASE_S) -> List[MemoryJob]:
+    """Lease up to `limit` due jobs. Each claim is a compare-and-set, so
+    concurrent workers never run the same job. A lease that ran out on the
+    last attempt (the job kept taking its worker down) fails the job."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    abandoned = MemoryJob.objects.filter(
+        status=MemoryJobStatus.RUNNING, next_attempt_at__lte=now, attempts__gte=MEMORY_JOB_MAX_ATTEMPTS
+    ).update(status=MemoryJobStatus.FAILED, last_error="lease expired on the last attempt")
+    if abandoned:
+        logger.warning("%d memory job(s) failed: lease expired on the last attempt", abandoned)
+    runnable = MemoryJob.objects.filter(
+        status__in=_RUNNABLE, next_attempt_at__lte=now, attempts__lt=MEMORY_JOB_MAX_ATTEMPTS
+    )
+    due = list(runnable.order_by("next_attempt_at").values_list("pk", flat=True)[:limit])
+    claimed = [
+        pk
+        for pk in due
+        if runnable.filter(pk=pk).update(
+            status=MemoryJobStatus.RUNNING,
+            next_attempt_at=now + timedelta(seconds=lease_s),
+            attempts=F("attempts") + 1,
+        )
+    ]
+    return list(MemoryJob.objects.filter(pk__in=claimed).select_related("session"))
+
+
+def retry_delay(attempts: int) -> float:
+    # exponential with +-20% jitter so a failed burst doesn't retry in lockstep
+    delay = min(MEMORY_JOB_BACKOFF_S * 2 ** (attempts - 1), MEMORY_JOB_MAX_BACKOFF_S)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_memory_job(job: MemoryJob, client=None) -> str:
+    """Run one claimed job; returns the status it ended in."""
+    # only the holder of this exact lease may move the job on
+    mine = MemoryJob.objects.filter(pk=job.pk, status=MemoryJobStatus.RUNNING, attempts=job.attempts)
+    try:
+        # long sessions arrive summarized in token-bounded pieces
+        transcript = condense_transcript(job.session, client)
+        memories = extract_memories(transcript, client) if transcript else []
+        # matched against stored memories before the write lock is taken
+        plan = plan_consolidation(job.session.user_id, memories)
+        with transaction.atomic():
+            # memories and the done flag commit together: a session's
+            # memories are written exactly once
+            if not mine.update(status=MemoryJobStatus.DONE, last_error=""):
+                return MemoryJobStatus.RUNNING
+            apply_consolidation(plan)
+        return MemoryJobStatus.DONE
+    except Exception as e:
+        if job.attempts >= MEMORY_JOB_MAX_ATTEMPTS:
+            status, next_attempt_at = MemoryJobStatus.FAILED, timezone.now()
+        else:
+            status = MemoryJobStatus.PENDING
+            next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        mine.update(status=status, next_attempt_at=next_attempt_at, last_error=repr(e)[:2000])
+        logger.warning(
+            "Memory job %s (session %s) attempt %d failed: %s", job.pk, job.session_id, job.attempts, e
+        )
+        return status
+
+
+class MemoryJobWorker:
+    """
+    Polls MemoryJob rows and runs up to `concurrency` extractions at a time
+    on a thread pool (the LLM client is blocking). Started by
+    `manage.py memory_worker`, outside the ASGI process.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = MEMORY_JOB_CONCURRENCY,
+        client=None,
+        poll_interval: float = MEMORY_JOB_POLL_INTERVAL_S,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.client = client
+        self.poll_interval = poll_interval
+        self._stopping = False
+
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+    def stop(self):
+        self._stopping = True
+
+    def run(self, once: bool = False):
+        """Process jobs until stop(); with once=True, until none are due."""
+        inflight = set()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix="memory-job") as pool:
+            while not self._stopping or inflight:
+                # cache version bumps that missed Redis while it was down
+                memory_cache.flush_invalidations()
+                if not self._stopping:
+                    for job in claim_jobs(self.concurrency - len(inflight)):
+                        inflight.add(pool.submit(self._run_one, job))
+                if not inflight:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                finished, inflight = wait(inflight, self.poll_interval, FIRST_COMPLETED)
+                for future in finished:
+                    self._count(future.result())
+
+    def stats(self) -> dict:
+        return {"done": self.done, "retried": self.retried, "failed": self.failed}
+
+    def _run_one(self, job: MemoryJob) -> str:
+        try:
+            return run_memory_job(job, self.client)
+        finally:
+            close_old_connections()
+
+    def _count(self, status: str):
+        if status == MemoryJobStatus.DONE:
+            self.done += 1
+        elif status == MemoryJobStatus.PENDING:
+            self.retried += 1
+        elif status == MemoryJobStatus.FAILED:
+            self.failed += 1
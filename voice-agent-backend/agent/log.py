@@ -0,0 +1,162 @@
+# agent/log.py
+"""
+Logging for the agent package: records go through a bounded queue to a
+background thread that does the writing, so a slow log pipe never blocks
+the event loop; every record carries the session it came from; per-frame
+events are rolled up into periodic summaries instead of one line each.
+
+Wired up in settings.LOGGING.
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import contextvars
+import logging.handlers
+from typing import Optional
+
+# seconds between per-frame summary lines per session and stream
+LOG_FRAME_SUMMARY_S = float(os.getenv("LOG_FRAME_SUMMARY_S", "10"))
+# also log every Nth frame on its own at DEBUG; 0 = never
+LOG_FRAME_SAMPLE_EVERY = int(os.getenv("LOG_FRAME_SAMPLE_EVERY", "0"))
+# records waiting for the writer thread; beyond this they are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [user=%(user_id)s session=%(session_id)s] %(message)s"
+
+# per-session fields; one dict per connection, see bind_session()
+_session_context: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "agent_log_session", default=None
+)
+
+
+def bind_session(**fields):
+    """
+    Attach fields (user_id, session_id) to every record logged from the
+    current task and tasks it starts afterwards. The first call in a task
+    sets a fresh dict; later calls update it in place, so tasks started in
+    between (e.g. the bridge's listen loop) see fields added later too.
+    """
+    context = _session_context.get()
+    if context is None:
+        _session_context.set(dict(fields))
+    else:
+        context.update(fields)
+
+
+def new_session_context(**fields):
+    # a connection's own dict, not one inherited from whoever spawned the task
+    _session_context.set(dict(fields))
+
+
+class SessionContextFilter(logging.Filter):
+    def filter(self, record):
+        context = _session_context.get() or {}
+        record.user_id = context.get("user_id", "-")
+        record.session_id = context.get("session_id", "-")
+        return True
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def stop(self):
+        # the stock stop() can't get its sentinel into a full queue
+        try:
+            self.queue.put(self._sentinel, timeout=1)
+        except queue.Full:
+            return  # writer is stuck; its thread is a daemon
+        self._thread.join()
+        self._thread = None
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler with its own listener thread writing to `target` (stderr
+    by default). The queue is bounded; when the writer falls behind, records
+    are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(
+        self,
+        target: Optional[logging.Handler] = None,
+        maxsize: int = LOG_QUEUE_SIZE,
+        fmt: str = LOG_FORMAT,
+    ):
+        super().__init__(queue.Queue(maxsize))
+        if target is None:
+            target = logging.StreamHandler()
+        if target.formatter is None:
+            target.setFormatter(logging.Formatter(fmt))
+        self.target = target
+        self.dropped = 0
+        self.addFilter(SessionContextFilter())
+        self.listener = _QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.close)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+class FrameLog:
+    """
+    Stands in for a log line per audio frame or text delta: counts them and
+    logs one INFO summary per `interval` seconds (and a last one on close()),
+    plus every `sample_every`-th event at DEBUG.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        what: str,
+        interval: float = LOG_FRAME_SUMMARY_S,
+        sample_every: int = LOG_FRAME_SAMPLE_EVERY,
+    ):
+        self.logger = logger
+        self.what = what
+        self.interval = interval
+        self.sample_every = sample_every
+        self.count = 0
+        self.bytes = 0
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_start = time.monotonic()
+
+    def add(self, nbytes: int = 0):
+        self.count += 1
+        self.bytes += nbytes
+        self._window_count += 1
+        self._window_bytes += nbytes
+        if self.sample_every and self.count % self.sample_every == 0:
+            self.logger.debug("%s #%d: %d bytes", self.what, self.count, nbytes)
+        if time.monotonic() - self._window_start >= self.interval:
+            self._summary()
+
+    def close(self):
+        if self._window_count:
+            self._summary()
+
+    def _summary(self):
+        now = time.monotonic()
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "%s: %d in %.1f s, %d bytes (total %d, %d bytes)",
+                self.what,
+                self._window_count,
+                now - self._window_start,
+                self._window_bytes,
+                self.count,
+                self.bytes,
+            )
+        self._window_count = 0
+        self._window_bytes = 0
+        self._window_start = now
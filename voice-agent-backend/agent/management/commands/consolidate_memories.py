@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from agent.consolidation import deduplicate_memories
+from agent.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Deduplicate stored memories and roll up old history summaries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_ids", nargs="*", help="default: every user")
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"] or UserProfile.objects.values_list("id", flat=True).iterator()
+        totals = {}
+        for user_id in user_ids:
+            for key, value in deduplicate_memories(user_id).items():
+                totals[key] = totals.get(key, 0) + value
+        self.stdout.write(f"Consolidated: {totals}")
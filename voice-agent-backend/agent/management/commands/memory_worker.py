@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from agent.jobs import MemoryJobWorker, MEMORY_JOB_CONCURRENCY, MEMORY_JOB_POLL_INTERVAL_S
+
+
+class Command(BaseCommand):
+    help = "Run queued post-call memory extraction jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=MEMORY_JOB_CONCURRENCY)
+        parser.add_argument("--poll-interval", type=float, default=MEMORY_JOB_POLL_INTERVAL_S)
+        parser.add_argument("--once", action="store_true", help="exit when no job is due")
+
+    def handle(self, *args, **options):
+        worker = MemoryJobWorker(
+            concurrency=options["concurrency"], poll_interval=options["poll_interval"]
+        )
+
+        def stop(signum, frame):
+            # finish the jobs in flight, claim nothing new
+            self.stdout.write("Stopping after in-flight jobs...")
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"Memory worker running, concurrency={worker.concurrency}")
+        worker.run(once=options["once"])
+        self.stdout.write(f"Memory worker stopped: {worker.stats()}")
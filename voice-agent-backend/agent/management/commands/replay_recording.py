@@ -0,0 +1,81 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from agent import realtime_bridge
+from agent.fake_realtime import FakeRealtimeServer
+from agent.recorder import DOWNLINK, KIND_NAMES, UPLINK, WATERFALL_COLUMNS, Recording, replay, waterfall
+
+
+class Command(BaseCommand):
+    help = (
+        "Print a session recording's (agent.recorder) per-turn timing waterfall; with --replay, "
+        "play its client side into a new bridge and print both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="a .vrec file from RECORD_DIR")
+        parser.add_argument("--replay", action="store_true", help="replay it and compare")
+        parser.add_argument(
+            "--upstream",
+            choices=["fake", "realtime"],
+            default="fake",
+            help="replay against an in-process fake (default) or OPENAI_REALTIME_URL",
+        )
+        parser.add_argument("--speed", type=float, default=1.0, help="replay speed; 0 = no pacing")
+        parser.add_argument("--first-audio-ms", type=int, default=150, help="the fake's response latency")
+        parser.add_argument("--events", action="store_true", help="also list every record")
+
+    def handle(self, *args, **options):
+        try:
+            recording = Recording(options["path"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        meta = recording.meta
+        self.stdout.write(
+            f"{options['path']}: {recording.duration_s:.1f} s, {len(recording.index)} chunks, "
+            f"user={meta.get('user_id')} session={meta.get('session_id')} "
+            f"turn_detection={meta.get('turn_detection')}"
+        )
+        if options["events"]:
+            self._list(recording)
+        rows = waterfall(recording)
+        if not options["replay"]:
+            self._table(rows)
+            return
+        replayed = waterfall(asyncio.run(self._replay(recording, options)))
+        self._table(rows, replayed)
+
+    async def _replay(self, recording, options):
+        if options["upstream"] == "realtime":
+            return await replay(recording, speed=options["speed"])
+        async with FakeRealtimeServer(first_audio_ms=options["first_audio_ms"], speed=1.0) as fake:
+            realtime_bridge.REALTIME_URL = fake.url
+            return await replay(recording, speed=options["speed"])
+
+    def _list(self, recording):
+        for t, kind, payload in recording.records():
+            if kind in (UPLINK, DOWNLINK):
+                detail = f"{len(payload)} bytes"
+            else:
+                detail = bytes(payload[:120]).decode(errors="replace")
+            self.stdout.write(f"{t / 1e6:10.1f} ms  {KIND_NAMES.get(kind, kind):<8}  {detail}")
+
+    def _table(self, rows, replayed=None):
+        # ms from the end of each user turn; "a -> b" = recorded -> replayed
+        self.stdout.write("turn      at_s  " + "".join(f"{c:>18}" for c in WATERFALL_COLUMNS))
+        for n, row in enumerate(rows):
+            other = replayed[n] if replayed is not None and n < len(replayed) else None
+            cells = []
+            for column in WATERFALL_COLUMNS:
+                cell = _ms(row[f"{column}_ms"])
+                if replayed is not None:
+                    cell += " -> " + _ms(other[f"{column}_ms"] if other else None)
+                cells.append(f"{cell:>18}")
+            self.stdout.write(f"{row['turn']:>4}  {row['at_s']:8.2f}  " + "".join(cells))
+        if replayed is not None and len(replayed) != len(rows):
+            self.stdout.write(f"{len(rows)} turns recorded, {len(replayed)} replayed")
+
+
+def _ms(value) -> str:
+    return "-" if value is None else f"{value:.0f}"
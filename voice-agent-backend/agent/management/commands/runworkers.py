@@ -0,0 +1,92 @@
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+
+from django.core.management.base import BaseCommand
+
+from agent.drain import DRAIN_GRACE_S, DRAIN_TIMEOUT_S
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the ASGI app with several Daphne worker processes sharing one "
+        "listening socket. Each call is one WebSocket and stays on the worker "
+        "that accepted it; agent.directory records which one, and control "
+        "messages reach it through the (Redis) channel layer. Run one of these "
+        "per machine behind any TCP/HTTP load balancer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+        )
+        parser.add_argument("--bind", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8000)
+        parser.add_argument("--application", default="voice_agent_backend.asgi:application")
+        parser.add_argument("--backlog", type=int, default=1024)
+        parser.add_argument(
+            "--stop-timeout",
+            type=float,
+            default=DRAIN_TIMEOUT_S + DRAIN_GRACE_S + 10,
+            help="seconds to wait for workers on shutdown (SIGTERM drains them: agent.drain)",
+        )
+
+    def handle(self, *args, **options):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((options["bind"], options["port"]))
+        sock.listen(options["backlog"])
+        sock.set_inheritable(True)
+        fd = sock.fileno()
+        host = socket.gethostname()
+
+        def spawn(n):
+            # every worker accepts on the same socket; the kernel spreads connections
+            env = dict(os.environ, WORKER_ID=f"{host}-w{n}")
+            return subprocess.Popen(
+                [sys.executable, "-m", "daphne", "--fd", str(fd), options["application"]],
+                pass_fds=(fd,),
+                env=env,
+            )
+
+        workers = {n: spawn(n) for n in range(options["workers"])}
+        stopping = []
+
+        def stop(signum, frame):
+            # passed on: each worker shuts down (or drains) on its own
+            stopping.append(signum)
+            for proc in workers.values():
+                if proc.poll() is None:
+                    proc.send_signal(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f"Serving on {options['bind']}:{options['port']} with {len(workers)} workers "
+            f"(pids {', '.join(str(p.pid) for p in workers.values())})"
+        )
+        self.stdout.flush()
+        restarts = {}
+        while not stopping:
+            for n, proc in list(workers.items()):
+                if proc.poll() is not None and not stopping:
+                    # crashed: restart, but not more than once a second per slot
+                    if time.monotonic() - restarts.get(n, 0) < 1.0:
+                        continue
+                    self.stderr.write(f"Worker {n} (pid {proc.pid}) exited with {proc.returncode}, restarting")
+                    restarts[n] = time.monotonic()
+                    workers[n] = spawn(n)
+            time.sleep(0.5)
+
+        deadline = time.monotonic() + options["stop_timeout"]
+        for proc in workers.values():
+            try:
+                proc.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        sock.close()
+        self.stdout.write("Workers stopped")
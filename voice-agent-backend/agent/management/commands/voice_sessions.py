@@ -0,0 +1,81 @@
+import asyncio
+import datetime
+
+import redis
+
+from django.core.management.base import BaseCommand, CommandError
+
+from agent.directory import (
+    drain_session,
+    drain_worker,
+    end_session,
+    inject_instruction,
+    session_directory,
+)
+
+
+class Command(BaseCommand):
+    help = "List live voice sessions and workers; end, drain or inject into them from any process."
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest="action", required=True)
+        listing = actions.add_parser("list", help="live sessions")
+        listing.add_argument("--worker")
+        actions.add_parser("workers", help="live workers")
+        end = actions.add_parser("end", help="close a session")
+        end.add_argument("session_id")
+        end.add_argument("--reason", default="")
+        inject = actions.add_parser("inject", help="add a system message to a session's conversation")
+        inject.add_argument("session_id")
+        inject.add_argument("text")
+        inject.add_argument("--respond", action="store_true", help="have the assistant answer it now")
+        drain = actions.add_parser("drain", help="close after the reply in progress")
+        drain.add_argument("session_id", nargs="?")
+        drain.add_argument("--worker", help="every session on this worker")
+
+    def handle(self, *args, **options):
+        if not session_directory.enabled:
+            self.stderr.write("Session directory is off (no SESSION_DIRECTORY_REDIS_URL); sending anyway")
+        asyncio.run(getattr(self, "_" + options["action"])(options))
+
+    async def _list(self, options):
+        sessions = await session_directory.sessions(worker_id=options["worker"])
+        for session_id, entry in sorted(sessions.items(), key=lambda item: item[1]["started_at"]):
+            started = datetime.datetime.fromtimestamp(float(entry["started_at"]))
+            self.stdout.write(
+                f"{session_id:>8}  user={entry['user_id']}  worker={entry['worker']}  since {started:%H:%M:%S}"
+            )
+        self.stdout.write(f"{len(sessions)} sessions")
+
+    async def _workers(self, options):
+        for worker_id, entry in sorted((await session_directory.workers()).items()):
+            draining = "  draining" if entry["draining"] == "1" else ""
+            self.stdout.write(f"{worker_id}  pid={entry['pid']}  sessions={entry['sessions']}{draining}")
+
+    async def _end(self, options):
+        await self._check(options["session_id"])
+        await end_session(options["session_id"], options["reason"])
+
+    async def _inject(self, options):
+        await self._check(options["session_id"])
+        await inject_instruction(options["session_id"], options["text"], respond=options["respond"])
+
+    async def _drain(self, options):
+        if options["worker"]:
+            await drain_worker(options["worker"])
+        elif options["session_id"]:
+            await self._check(options["session_id"])
+            await drain_session(options["session_id"])
+        else:
+            raise CommandError("drain needs a session id or --worker")
+
+    async def _check(self, session_id):
+        if not session_directory.enabled:
+            return
+        try:
+            entry = await session_directory.lookup(session_id)
+        except (redis.RedisError, OSError) as e:
+            self.stderr.write(f"Can't reach the session directory ({e}); sending anyway")
+            return
+        if entry is None:
+            raise CommandError(f"session {session_id} is not live")
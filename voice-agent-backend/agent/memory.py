@@ -1,7 +1,9 @@
 # agent/memory.py
 import os
 import json
-from typing import List
+from typing import List, Tuple
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from .models import (
     UserProfile,
     UserMemory,
@@ -9,10 +11,17 @@ from .models import (
     ConversationEvent,
     MemoryType,
 )
+from .consolidation import consolidate_memories
+from .retrieval import MEMORY_PROMPT_K
+from .prompt_cache import CachedMemories, memory_cache
+from .transcript import format_turn, iter_turns
 import openai
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# a concurrent writer took the seqs we picked: re-read MAX(seq) this many times
+EVENT_SEQ_RETRIES = int(os.getenv("EVENT_SEQ_RETRIES", "3"))
+
 
 def get_or_create_user(user_id: str) -> UserProfile:
     user, _created = UserProfile.objects.get_or_create(id=user_id)
@@ -22,31 +31,113 @@ def get_or_create_user(user_id: str) -> UserProfile:
 def get_user_memories(user_id: str, limit: int = 20) -> List[str]:
     qs = (
         UserMemory.objects.filter(user_id=user_id)
-        .order_by("-importance", "-updated_at")[:limit]
+        .order_by("-importance", "-updated_at")
+        .values_list("content", flat=True)[:limit]
     )
-    return [m.content for m in qs]
+    return list(qs)
 
 
 def create_conversation_session(user: UserProfile) -> ConversationSession:
     return ConversationSession.objects.create(user=user)
 
 
+def bootstrap_session(user_id: str) -> Tuple[ConversationSession, CachedMemories]:
+    """
+    Everything VoiceConsumer.connect needs from the DB in one go: make sure
+    the user exists, get the memories for the prompt and open a
+    ConversationSession. On a memory cache hit that's the user upsert and
+    one INSERT.
+    """
+    cached, version = memory_cache.get(user_id)
+    if cached is not None:
+        # the entry may outlive the user row (user deleted, DB reset while
+        # Redis kept it), so the upsert stays
+        UserProfile.objects.get_or_create(id=user_id)
+        return ConversationSession.objects.create(user_id=user_id), cached
+    with transaction.atomic():
+        # the (user, -importance, -updated_at) index; the vector index is
+        # only built once a transcript needs re-ranking (_refresh_memories)
+        memories = get_user_memories(user_id, MEMORY_PROMPT_K)
+        count = len(memories)
+        if count == MEMORY_PROMPT_K:
+            count = UserMemory.objects.filter(user_id=user_id).count()
+        elif not count:
+            # a user with memories necessarily exists
+            UserProfile.objects.get_or_create(id=user_id)
+        session = ConversationSession.objects.create(user_id=user_id)
+    cached = CachedMemories(memories, count)
+    memory_cache.set(user_id, cached, version)
+    return session, cached
+
+
 def add_event(session: ConversationSession, role: str, content: str):
-    ConversationEvent.objects.create(session=session, role=role, content=content)
+    add_events(session, [(role, content)])
+
+
+def add_events(session: ConversationSession, events: List[Tuple[str, str]]):
+    # one writer per session (EventWriteBuffer), so MAX(seq) + 1 doesn't race;
+    # the (session, seq) unique constraint would catch it if it did
+    with transaction.atomic():
+        last = session.events.aggregate(last=Max("seq"))["last"] or 0
+        ConversationEvent.objects.bulk_create(
+            [
+                ConversationEvent(session=session, role=role, content=content, seq=last + n)
+                for n, (role, content) in enumerate(events, start=1)
+            ]
+        )
 
 
 def build_transcript(session: ConversationSession) -> str:
-    events = session.events.order_by("created_at")
-    lines = [f"{e.role.upper()}: {e.content}" for e in events]
-    return "\n".join(lines)
+    # whole transcript in one string: fine for short sessions; memory
+    # extraction uses transcript.condense_transcript instead
+    return "\n".join(format_turn(role, text) for role, text in iter_turns(session))
+
+
+# Async variants for the consumer's event writes. Django's async ORM still
+# runs each query through sync_to_async, and it can't hold a transaction
+# across awaits, so these stick to single statements (plus reads). Session
+# bootstrap stays one db_sync_to_async hop (bootstrap_session).
+
 
+async def aadd_event(session: ConversationSession, role: str, content: str):
+    await aadd_events(session, [(role, content)])
 
-def update_memories_from_transcript(user_id: str, transcript: str):
+
+async def aadd_events(session: ConversationSession, events: List[Tuple[str, str]]):
+    # MAX(seq) and the INSERT are two hops with no transaction between them,
+    # so a second writer for the session (an overlapping flush) can take the
+    # same seqs; the (session, seq) constraint rejects the whole batch and we
+    # re-read and try again
+    for attempt in range(EVENT_SEQ_RETRIES + 1):
+        last = (await session.events.aaggregate(last=Max("seq")))["last"] or 0
+        try:
+            await ConversationEvent.objects.abulk_create(
+                [
+                    ConversationEvent(session=session, role=role, content=content, seq=last + n)
+                    for n, (role, content) in enumerate(events, start=1)
+                ]
+            )
+            return
+        except IntegrityError:
+            if attempt == EVENT_SEQ_RETRIES:
+                raise
+
+
+def get_llm_client():
+    return openai.OpenAI(api_key=openai.api_key)
+
+
+def update_memories_from_transcript(user_id: str, transcript: str, client=None):
     """
     SYNC memory extraction using a normal chat model.
-    This will be called via database_sync_to_async from the consumer.
+    Called from the memory_worker job queue (see agent/jobs.py), never on
+    the ASGI worker's thread pool.
     """
-    client = openai.OpenAI(api_key=openai.api_key)
+    save_memories(user_id, extract_memories(transcript, client))
+
+
+def extract_memories(transcript: str, client=None) -> List[dict]:
+    client = client or get_llm_client()
 
     prompt = f"""
 You are a memory extraction assistant.
@@ -74,17 +165,12 @@ Transcript:
     )
 
     data = json.loads(resp.choices[0].message.content)
-    memories = data.get("memories", [])
+    return data.get("memories", [])
 
-    user = get_or_create_user(user_id)
 
-    for mem in memories:
-        UserMemory.objects.create(
-            user=user,
-            type=mem["type"],
-            content=mem["content"],
-            importance=int(mem.get("importance", 5)),
-        )
+def save_memories(user_id: str, memories: List[dict]):
+    # merged into what we already know instead of piling up near-duplicates
+    return consolidate_memories(user_id, memories)
 
 
 # import os
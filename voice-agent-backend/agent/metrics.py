@@ -0,0 +1,292 @@
+# agent/metrics.py
+"""
+In-process counters, gauges and histograms, rendered in the Prometheus
+text format on /metrics (agent.views.metrics).
+
+No client library: updates are an uncontended lock and an add, cheap
+enough for per-frame paths. Labelled series are looked up once with
+.labels() and kept by the caller. Each ASGI worker process has its own
+registry, so scrape every process (or put one per port behind the scrape
+config).
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# seconds; connect phases, first audio, DB writes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _only(self):
+        return self._children[()]
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._only().inc(amount)
+
+    def _samples(self, key, child):
+        return [f"{self.name}{_label_str(self.labelnames, key)} {_num(child.value)}"]
+
+
+class Gauge(_Metric):
+    """A value set or moved by the code, or read from `func` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, func: Optional[Callable[[], float]] = None, **kwargs):
+        self.func = func
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._only().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._only().dec(amount)
+
+    def set(self, value: float):
+        self._only().set(value)
+
+    def _samples(self, key, child):
+        value = child.value
+        if self.func is not None and not key:
+            try:
+                value = self.func()
+            except Exception:
+                value = math.nan
+        return [f"{self.name}{_label_str(self.labelnames, key)} {_num(value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value: float):
+        self._only().observe(value)
+
+    def _samples(self, key, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            le = _label_str(self.labelnames, key, f'le="{_num(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        labels = _label_str(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_num(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _memory_job_lag() -> float:
+    """Seconds the oldest due memory job has been waiting (0 if none)."""
+    from django.utils import timezone
+    from .models import MemoryJob, MemoryJobStatus
+
+    oldest = (
+        MemoryJob.objects.filter(status=MemoryJobStatus.PENDING, next_attempt_at__lte=timezone.now())
+        .order_by("next_attempt_at")
+        .values_list("next_attempt_at", flat=True)
+        .first()
+    )
+    return (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+
+def _memory_jobs_pending() -> float:
+    from .models import MemoryJob, MemoryJobStatus
+
+    return MemoryJob.objects.filter(status=MemoryJobStatus.PENDING).count()
+
+
+def _realtime_pool_warm() -> float:
+    from .realtime_bridge import realtime_pool
+
+    return realtime_pool.stats()["warm"]
+
+
+# ---- voice sessions (VoiceConsumer) ----
+ACTIVE_SESSIONS = Gauge("voice_active_sessions", "Open /ws/voice/ connections in this process.")
+SESSIONS = Counter("voice_sessions_total", "/ws/voice/ connections accepted.")
+CONNECT_PHASE = Histogram(
+    "voice_connect_phase_seconds",
+    "Time from connect to each phase: db (session row + memories), ready, instructions.",
+    ["phase"],
+)
+FIRST_AUDIO = Histogram(
+    "voice_turn_first_audio_seconds",
+    "End of the user's turn (stop_speaking, local VAD or server VAD) to the first reply audio "
+    "sent to the client.",
+)
+AUDIO_BYTES = Counter("voice_audio_bytes_total", "Client audio bytes, as sent on the wire.", ["direction"])
+WORKER_DRAINING = Gauge("voice_worker_draining", "1 while this process drains (agent.drain).")
+ADMISSION_ACTIVE = Gauge("voice_admission_sessions", "Sessions holding an admission slot (agent.admission).")
+ADMISSION_QUEUED = Gauge("voice_admission_queued", "Connects waiting for an admission slot.")
+ADMISSION_REJECTED = Counter(
+    "voice_admission_rejected_total", "Connects turned away: user_limit, busy, rate_limited.", ["reason"]
+)
+ADMISSION_WAIT = Histogram("voice_admission_wait_seconds", "Time admitted connects spent waiting.")
+CONTROL_MESSAGES = Counter(
+    "voice_control_messages_total", "Control messages handled (agent.directory).", ["type"]
+)
+DB_WRITE = Histogram("voice_db_write_seconds", "Transcript event batch writes.")
+DB_WRITE_ERRORS = Counter("voice_db_write_errors_total", "Failed transcript event batch writes.")
+DB_EVENTS_QUEUED = Gauge(
+    "voice_db_events_queued", "Transcript events accepted but not yet written, all sessions (agent.event_buffer)."
+)
+DB_EVENTS_QUEUED_MAX = Gauge("voice_db_events_queued_max", "High-water mark of voice_db_events_queued.")
+DB_EVENTS_DROPPED = Counter(
+    "voice_db_events_dropped_total", "Transcript events given up on: retries exhausted, or shutdown."
+)
+OUTBOUND_DROPPED_AUDIO = Counter(
+    "voice_outbound_dropped_audio_frames_total",
+    "Audio frames dropped from client queues: overflow (client too slow) or barge_in.",
+    ["reason"],
+)
+RECORDING_DROPPED_BYTES = Counter(
+    "voice_recording_dropped_bytes_total", "Session recording bytes dropped, writer behind (agent.recorder)."
+)
+
+# ---- upstream (RealtimeBridge) ----
+UPSTREAM_EVENTS = Counter("realtime_events_total", "Events received from the Realtime API.", ["type"])
+UPSTREAM_RECONNECTS = Counter(
+    "realtime_reconnects_total", "Sessions re-established (ok) or given up (failed) after a drop.", ["outcome"]
+)
+
+REALTIME_POOL_WARM = Gauge(
+    "realtime_pool_warm", "Warm Realtime connections ready for checkout (agent.upstream_pool).", func=_realtime_pool_warm
+)
+REALTIME_POOL_CHECKOUTS = Counter(
+    "realtime_pool_checkouts_total", "Upstream connections handed out warm (hit) or opened on demand (miss).", ["result"]
+)
+REALTIME_POOL_DISCARDED = Counter(
+    "realtime_pool_discarded_total", "Warm connections retired: expired, unhealthy, closed.", ["reason"]
+)
+REALTIME_POOL_OPEN_FAILURES = Counter(
+    "realtime_pool_open_failures_total", "Failed attempts to open a warm connection."
+)
+
+# ---- memory extraction queue (read from the DB at scrape time) ----
+MEMORY_JOB_LAG = Gauge(
+    "memory_job_queue_lag_seconds", "Age of the oldest due pending memory job.", func=_memory_job_lag
+)
+MEMORY_JOBS_PENDING = Gauge(
+    "memory_jobs_pending", "Memory jobs waiting to run (due or backing off).", func=_memory_jobs_pending
+)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-16 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0002_memoryjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usermemory',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
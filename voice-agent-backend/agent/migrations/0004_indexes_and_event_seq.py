@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-17 00:10
+
+from django.db import migrations, models
+
+
+def backfill_seq(apps, schema_editor):
+    """Number existing events per session in (created_at, id) order."""
+    connection = schema_editor.connection
+    if connection.vendor in ("postgresql", "sqlite"):
+        # one statement; UPDATE ... FROM needs SQLite >= 3.33
+        schema_editor.execute(
+            """
+            UPDATE agent_conversationevent SET seq = numbered.rn
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY created_at, id) AS rn
+                FROM agent_conversationevent
+            ) AS numbered
+            WHERE agent_conversationevent.id = numbered.id
+            """
+        )
+        return
+
+    ConversationEvent = apps.get_model("agent", "ConversationEvent")
+    session_ids = ConversationEvent.objects.values_list("session_id", flat=True).distinct()
+    for session_id in session_ids.iterator():
+        events = list(ConversationEvent.objects.filter(session_id=session_id).order_by("created_at", "id"))
+        for n, event in enumerate(events, start=1):
+            event.seq = n
+        ConversationEvent.objects.bulk_update(events, ["seq"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0003_usermemory_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationevent',
+            name='seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversationevent',
+            constraint=models.UniqueConstraint(fields=('session', 'seq'), name='conversationevent_session_seq_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='usermemory',
+            index=models.Index(fields=['user', '-importance', '-updated_at'], name='usermemory_user_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermemory',
+            index=models.Index(fields=['user', 'updated_at'], name='usermemory_user_updated_idx'),
+        ),
+    ]
@@ -22,9 +22,19 @@ class UserMemory(models.Model):
     type = models.CharField(max_length=32, choices=MemoryType.choices)
     content = models.TextField()
     importance = models.IntegerField(default=5)
+    # float32 vector from agent.retrieval's embedder; filled in lazily for old rows
+    embedding = models.BinaryField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # get_user_memories: WHERE user_id ORDER BY -importance, -updated_at LIMIT k
+            models.Index(fields=["user", "-importance", "-updated_at"], name="usermemory_user_rank_idx"),
+            # retrieval index version check: MAX(updated_at) per user
+            models.Index(fields=["user", "updated_at"], name="usermemory_user_updated_idx"),
+        ]
+
 
 class ConversationSession(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
@@ -37,4 +47,38 @@ class ConversationEvent(models.Model):
     session = models.ForeignKey(ConversationSession, on_delete=models.CASCADE, related_name="events")
     role = models.CharField(max_length=32)  # "user" or "assistant"
     content = models.TextField()
+    # position in the session, 1-based; transcripts are ordered by this, not by
+    # created_at, which can tie within a bulk_create or go backwards across hosts
+    seq = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # doubles as the (session, seq) index build_transcript reads through
+            models.UniqueConstraint(fields=["session", "seq"], name="conversationevent_session_seq_uniq"),
+        ]
+
+
+class MemoryJobStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    RUNNING = "running", "Running"
+    DONE = "done", "Done"
+    FAILED = "failed", "Failed"
+
+
+class MemoryJob(models.Model):
+    """
+    Post-call memory extraction for one session, run by `manage.py memory_worker`.
+    One row per session, so enqueueing twice is a no-op.
+    """
+    session = models.OneToOneField(ConversationSession, on_delete=models.CASCADE, related_name="memory_job")
+    status = models.CharField(max_length=16, choices=MemoryJobStatus.choices, default=MemoryJobStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    # when a pending job may run next; for a running job, when its lease expires
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
@@ -0,0 +1,219 @@
+# agent/outbound.py
+import os
+import logging
+import asyncio
+from collections import deque
+from typing import Callable, Awaitable, Optional
+
+from .metrics import OUTBOUND_DROPPED_AUDIO
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_QUEUE_MAX = int(os.getenv("OUTBOUND_QUEUE_MAX", "256"))
+# what to do when a client can't keep up: coalesce_text | drop_oldest_audio | disconnect
+OUTBOUND_OVERFLOW_POLICY = os.getenv("OUTBOUND_OVERFLOW_POLICY", "coalesce_text")
+
+OVERFLOW_POLICIES = ("coalesce_text", "drop_oldest_audio", "disconnect")
+
+_JSON = "json"
+_BYTES = "bytes"
+
+_DROPPED_OVERFLOW = OUTBOUND_DROPPED_AUDIO.labels("overflow")
+_DROPPED_BARGE_IN = OUTBOUND_DROPPED_AUDIO.labels("barge_in")
+
+
+class OutboundQueue:
+    """
+    Bounded per-session queue between the Realtime bridge and the client
+    socket. put_json()/put_bytes() never block; a dedicated sender task
+    drains the queue, so a slow browser only backs up its own queue and the
+    upstream listen loop keeps reading.
+
+    Overflow policies (applied when `max_items` is reached):
+      coalesce_text      merge text deltas into the last queued one, evict
+                         the oldest audio frame otherwise
+      drop_oldest_audio  evict the oldest audio frame
+      disconnect         give up on the client (on_overflow is called)
+    Control messages (anything that isn't audio or a text delta) are never
+    dropped: when the queue is full with no audio to evict and no text
+    deltas to merge, the client is given up on as with `disconnect`, so
+    `max_items` bounds the queue whatever it holds.
+    """
+
+    def __init__(
+        self,
+        send_json: Callable[[dict], Awaitable[None]],
+        send_bytes: Callable[[bytes], Awaitable[None]],
+        on_overflow: Optional[Callable[[], Awaitable[None]]] = None,
+        on_audio_sent: Optional[Callable[[int, Optional[str]], None]] = None,
+        max_items: int = OUTBOUND_QUEUE_MAX,
+        policy: str = OUTBOUND_OVERFLOW_POLICY,
+    ):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown outbound overflow policy: {policy}")
+        self.send_json = send_json
+        self.send_bytes = send_bytes
+        self.on_overflow = on_overflow
+        self.on_audio_sent = on_audio_sent
+        self.max_items = max_items
+        self.policy = policy
+
+        self._items: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._closed = False
+        self._sender = asyncio.create_task(self._run())
+        self._overflow_task: Optional[asyncio.Task] = None
+
+        self.high_water = 0
+        self.sent = 0
+        self.dropped_audio = 0
+        self.dropped_audio_bytes = 0
+        self.coalesced_text = 0
+        self.overflows = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put_json(self, msg: dict):
+        if self._closed:
+            return
+        if len(self._items) >= self.max_items and self._is_text_delta(msg):
+            if self.policy == "coalesce_text" and self._coalesce(msg):
+                return
+        self._put((_JSON, msg))
+
+    def put_bytes(self, data: bytes, played_bytes: int = 0, item_id: Optional[str] = None):
+        # played_bytes: upstream PCM this frame represents, reported to
+        # on_audio_sent (with the item it belongs to) once the frame is
+        # actually on the wire
+        if self._closed:
+            return
+        self._put((_BYTES, (data, played_bytes, item_id)))
+
+    def drop_audio(self) -> int:
+        # remove every queued audio frame (e.g. the user interrupted)
+        kept = deque()
+        dropped = dropped_bytes = 0
+        for item in self._items:
+            if item[0] == _BYTES:
+                dropped += 1
+                dropped_bytes += len(item[1][0])
+            else:
+                kept.append(item)
+        self._items = kept
+        self.dropped_audio += dropped
+        self.dropped_audio_bytes += dropped_bytes
+        _DROPPED_BARGE_IN.inc(dropped)
+        return dropped
+
+    async def wait_empty(self, timeout: float = 5.0):
+        # e.g. before closing the socket: let what's queued reach the client
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._items and not self._closed and loop.time() < deadline:
+            await asyncio.sleep(0.02)
+
+    async def close(self):
+        self._closed = True
+        self._items.clear()
+        self._sender.cancel()
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._items),
+            "high_water": self.high_water,
+            "sent": self.sent,
+            "dropped_audio": self.dropped_audio,
+            "dropped_audio_bytes": self.dropped_audio_bytes,
+            "coalesced_text": self.coalesced_text,
+            "overflows": self.overflows,
+        }
+
+    def _put(self, item):
+        if len(self._items) >= self.max_items:
+            self.overflows += 1
+            if self.policy == "disconnect" or not self._make_room():
+                self._disconnect()
+                return
+        self._items.append(item)
+        self.high_water = max(self.high_water, len(self._items))
+        self._wakeup.set()
+
+    def _make_room(self) -> bool:
+        # audio goes first; under coalesce_text two neighbouring text deltas
+        # can also share a slot
+        if self._evict_oldest_audio():
+            return True
+        return self.policy == "coalesce_text" and self._merge_text_pair()
+
+    def _merge_text_pair(self) -> bool:
+        previous = None
+        for i, (kind, msg) in enumerate(self._items):
+            if kind == _JSON and self._is_text_delta(msg):
+                if previous is not None:
+                    previous["text"] += msg.get("text", "")
+                    del self._items[i]
+                    self.coalesced_text += 1
+                    return True
+                previous = msg
+            else:
+                previous = None
+        return False
+
+    def _evict_oldest_audio(self) -> bool:
+        for i, (kind, payload) in enumerate(self._items):
+            if kind == _BYTES:
+                del self._items[i]
+                self.dropped_audio += 1
+                self.dropped_audio_bytes += len(payload[0])
+                _DROPPED_OVERFLOW.inc()
+                return True
+        return False
+
+    @staticmethod
+    def _is_text_delta(msg: dict) -> bool:
+        return msg.get("type") == "ai_text_delta" and not msg.get("is_final")
+
+    def _coalesce(self, msg: dict) -> bool:
+        for kind, queued in reversed(self._items):
+            if kind == _JSON and self._is_text_delta(queued):
+                queued["text"] += msg.get("text", "")
+                self.coalesced_text += 1
+                return True
+            if kind == _JSON:
+                # don't merge across a turn boundary / control message
+                return False
+        return False
+
+    def _disconnect(self):
+        self._closed = True
+        self._items.clear()
+        if self.on_overflow is not None and self._overflow_task is None:
+            self._overflow_task = asyncio.create_task(self.on_overflow())
+
+    async def _run(self):
+        while True:
+            if not self._items:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            kind, payload = self._items.popleft()
+            try:
+                if kind == _BYTES:
+                    data, played_bytes, item_id = payload
+                    await self.send_bytes(data)
+                    if played_bytes and self.on_audio_sent is not None:
+                        self.on_audio_sent(played_bytes, item_id)
+                else:
+                    await self.send_json(payload)
+            except Exception as e:
+                # client socket is gone; nothing more to deliver
+                logger.warning("Outbound send failed: %s", e)
+                self._closed = True
+                self._items.clear()
+                return
+            self.sent += 1
@@ -0,0 +1,204 @@
+# agent/prompt_cache.py
+import os
+import logging
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Set, Tuple
+
+import redis
+
+from .prompts import render_memory_block
+
+logger = logging.getLogger(__name__)
+
+# "" keeps the cache process-local
+MEMORY_CACHE_REDIS_URL = os.getenv("MEMORY_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"))
+MEMORY_CACHE_TTL_S = int(os.getenv("MEMORY_CACHE_TTL_S", "600"))
+# local entries are only trusted this long when Redis can't confirm them
+MEMORY_CACHE_LOCAL_TTL_S = float(os.getenv("MEMORY_CACHE_LOCAL_TTL_S", "30"))
+MEMORY_CACHE_MAX_USERS = int(os.getenv("MEMORY_CACHE_MAX_USERS", "10000"))
+# after a Redis error, don't try again for this long
+MEMORY_CACHE_REDIS_RETRY_S = 30.0
+
+
+class CachedMemories:
+    """The prompt memories for one user, as they go into the system prompt."""
+
+    __slots__ = ("memories", "block", "count")
+
+    def __init__(self, memories: List[str], count: int, block: Optional[str] = None):
+        self.memories = memories
+        self.count = count  # all the user's memories, not just these
+        self.block = block if block is not None else render_memory_block(memories)
+
+    def dumps(self, version: int) -> str:
+        return json.dumps({"v": version, "memories": self.memories, "count": self.count, "block": self.block})
+
+    @classmethod
+    def loads(cls, raw) -> Tuple[int, "CachedMemories"]:
+        data = json.loads(raw)
+        return data["v"], cls(data["memories"], data["count"], data["block"])
+
+
+class MemoryBlockCache:
+    """
+    Rendered memory block per user: a local LRU in front of Redis.
+
+    Every write to a user's memories bumps a per-user version in Redis (see
+    invalidate()). Entries carry the version they were read under, and a
+    lookup reads the current version together with the Redis entry in one
+    MGET. A stale entry (local or shared) is never served, whichever process
+    wrote the memories. Without Redis, local entries fall back to a short TTL.
+    A version bump that couldn't reach Redis is kept and sent once Redis
+    answers again (flush_invalidations), so the entry stored under the old
+    version isn't served when it comes back.
+    """
+
+    def __init__(
+        self,
+        url: str = MEMORY_CACHE_REDIS_URL,
+        ttl: int = MEMORY_CACHE_TTL_S,
+        local_ttl: float = MEMORY_CACHE_LOCAL_TTL_S,
+        max_users: int = MEMORY_CACHE_MAX_USERS,
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_users = max_users
+        self._redis = None
+        self._redis_down_until = 0.0
+        self._local: "OrderedDict[str, Tuple[float, int, CachedMemories]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # users whose version bump Redis hasn't seen yet
+        self._unsent: Set[str] = set()
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.redis_errors = 0
+
+    def get(self, user_id: str) -> Tuple[Optional[CachedMemories], Optional[int]]:
+        """
+        Returns (entry or None, version). Pass the version back to set() so
+        an entry read before a concurrent write can't be stored as current.
+        """
+        now = time.monotonic()
+        with self._lock:
+            local = self._local.get(user_id)
+
+        self.flush_invalidations()
+        conn = self._conn()
+        if conn is None:
+            version = None
+            if local is not None and now - local[0] < self.local_ttl:
+                self.local_hits += 1
+                return local[2], None
+        else:
+            try:
+                raw_version, raw_entry = conn.mget(_version_key(user_id), _entry_key(user_id))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                return self.get(user_id)
+            version = int(raw_version or 0)
+            if local is not None and local[1] == version and now - local[0] < self.ttl:
+                self.local_hits += 1
+                return local[2], version
+            if raw_entry is not None:
+                entry_version, entry = CachedMemories.loads(raw_entry)
+                if entry_version == version:
+                    self.redis_hits += 1
+                    self._remember(user_id, version, entry)
+                    return entry, version
+
+        self.misses += 1
+        return None, version
+
+    def set(self, user_id: str, entry: CachedMemories, version: Optional[int]):
+        self._remember(user_id, version if version is not None else -1, entry)
+        conn = self._conn()
+        if conn is None or version is None:
+            return
+        try:
+            conn.set(_entry_key(user_id), entry.dumps(version), ex=self.ttl)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+
+    def invalidate(self, user_id: str):
+        self.invalidations += 1
+        with self._lock:
+            self._local.pop(user_id, None)
+            self._unsent.add(user_id)
+        self.flush_invalidations()
+
+    def flush_invalidations(self):
+        """
+        Send the version bumps Redis missed. Called on every lookup, and by
+        the memory worker's poll loop (the process that writes memories
+        may not look anything up for a while).
+        """
+        if not self._unsent:
+            return
+        conn = self._conn()
+        if conn is None:
+            return
+        with self._lock:
+            users = list(self._unsent)
+        try:
+            pipe = conn.pipeline()
+            for user_id in users:
+                pipe.incr(_version_key(user_id))
+                pipe.delete(_entry_key(user_id))
+            pipe.execute()
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return
+        with self._lock:
+            self._unsent.difference_update(users)
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "redis_errors": self.redis_errors,
+            "unsent_invalidations": len(self._unsent),
+            "local_size": len(self._local),
+        }
+
+    def _remember(self, user_id: str, version: int, entry: CachedMemories):
+        with self._lock:
+            self._local[user_id] = (time.monotonic(), version, entry)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.max_users:
+                self._local.popitem(last=False)
+
+    def _conn(self):
+        if not self.url or time.monotonic() < self._redis_down_until:
+            return None
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(
+                self.url, socket_timeout=0.25, socket_connect_timeout=0.25
+            )
+        return self._redis
+
+    def _redis_failed(self, e: Exception):
+        self.redis_errors += 1
+        self._redis_down_until = time.monotonic() + MEMORY_CACHE_REDIS_RETRY_S
+        logger.warning("Memory cache: Redis unavailable, local only for %s s: %s", MEMORY_CACHE_REDIS_RETRY_S, e)
+
+
+def _version_key(user_id: str) -> str:
+    return f"agent:memver:{user_id}"
+
+
+def _entry_key(user_id: str) -> str:
+    return f"agent:memblock:{user_id}"
+
+
+memory_cache = MemoryBlockCache()
@@ -1,14 +1,134 @@
 import os
-import json
+import re
 import base64
+import random
+import logging
 import asyncio
+import binascii
 import websockets
-from typing import Callable, Awaitable, Optional
+from collections import deque
+from typing import Callable, Awaitable, Optional, Tuple
+
+from . import fastjson
+
+from .audio import UplinkCoalescer, UPSTREAM_SAMPLE_RATE, BYTES_PER_SAMPLE
+from .vad import TURN_DETECTION, TURN_DETECTION_MODES, turn_detection_config
+from .upstream_pool import RealtimeConnectionPool
+from .metrics import UPSTREAM_EVENTS, UPSTREAM_RECONNECTS
+
+logger = logging.getLogger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 REALTIME_MODEL = os.getenv("OPENAI_REALTIME_MODEL", "gpt-4o-realtime-preview")
 
-REALTIME_URL = f"wss://api.openai.com/v1/realtime?model={REALTIME_MODEL}"
+# upstream transcribes the user's audio, which feeds mid-session memory
+# retrieval; empty = off (memories are then only refreshed from the
+# client's own user_transcript messages)
+INPUT_TRANSCRIPTION_MODEL = os.getenv("OPENAI_INPUT_TRANSCRIPTION_MODEL", "whisper-1")
+
+# point this at a local fake (agent/fake_realtime.py) for offline runs
+REALTIME_URL = os.getenv(
+    "OPENAI_REALTIME_URL", f"wss://api.openai.com/v1/realtime?model={REALTIME_MODEL}"
+)
+
+# When the upstream socket drops mid-session the bridge reconnects, waiting
+# BACKOFF_S, 2 * BACKOFF_S, ... (capped, with jitter) between attempts, and
+# gives up after REALTIME_RECONNECT_ATTEMPTS failures in a row
+REALTIME_RECONNECT_ATTEMPTS = int(os.getenv("REALTIME_RECONNECT_ATTEMPTS", "5"))
+REALTIME_RECONNECT_BACKOFF_S = float(os.getenv("REALTIME_RECONNECT_BACKOFF_S", "0.25"))
+REALTIME_RECONNECT_MAX_BACKOFF_S = float(os.getenv("REALTIME_RECONNECT_MAX_BACKOFF_S", "4"))
+# conversation turns (text) replayed into the new upstream session
+REALTIME_REPLAY_TURNS = int(os.getenv("REALTIME_REPLAY_TURNS", "10"))
+# user audio held while reconnecting; the oldest goes beyond this
+REALTIME_RECONNECT_BUFFER_MS = int(os.getenv("REALTIME_RECONNECT_BUFFER_MS", "10000"))
+
+
+def baseline_session_config(turn_detection: str = TURN_DETECTION) -> dict:
+    # everything except the per-user instructions
+    config = {
+        "language": "en",
+        "input_audio_format": "pcm16",
+        "output_audio_format": "pcm16",
+        "modalities": ["audio", "text"],
+        "voice": "verse",
+        "turn_detection": turn_detection_config(turn_detection),
+    }
+    if INPUT_TRANSCRIPTION_MODEL:
+        config["input_audio_transcription"] = {"model": INPUT_TRANSCRIPTION_MODEL}
+    return config
+
+
+async def _open_socket():
+    return await websockets.connect(
+        REALTIME_URL,
+        additional_headers  ={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "OpenAI-Beta": "realtime=v1",
+        },
+    )
+
+
+async def open_realtime_connection():
+    # a connection with the baseline config applied, as kept by the pool
+    ws = await _open_socket()
+    session_update = {"type": "session.update", "session": baseline_session_config()}
+    await ws.send(fastjson.dumps(session_update))
+    return ws
+
+
+# warm connections with the baseline config already applied (REALTIME_POOL_SIZE)
+realtime_pool = RealtimeConnectionPool(open_realtime_connection)
+
+
+_AUDIO_DELTA = re.compile(r'\{\s*"type"\s*:\s*"response\.audio\.delta"')
+_DELTA_VALUE = re.compile(r'"delta"\s*:\s*"')
+_RESPONSE_ID = re.compile(r'"response_id"\s*:\s*"([^"\\]*)"')
+_ITEM_ID = re.compile(r'"item_id"\s*:\s*"([^"\\]*)"')
+
+# fast-path audio deltas skip the per-type lookup
+_AUDIO_DELTA_EVENTS = UPSTREAM_EVENTS.labels("response.audio.delta")
+
+
+def parse_audio_delta(msg: str) -> Optional[Tuple[Optional[str], Optional[str], str]]:
+    """
+    (response_id, item_id, base64 audio) of a response.audio.delta message,
+    found by scanning instead of parsing it; None for any other message, or
+    one this can't read safely (it then goes through the JSON parser).
+    """
+    if not _AUDIO_DELTA.match(msg):
+        return None
+    value = _DELTA_VALUE.search(msg)
+    if value is None:
+        return None
+    start = value.end()
+    end = msg.find('"', start)
+    if end == -1 or msg.find("\\", start, end) != -1:
+        return None
+    # the ids sit before or after the audio; [^"] keeps them out of it
+    response_id = _RESPONSE_ID.search(msg)
+    item_id = _ITEM_ID.search(msg)
+    return (
+        response_id.group(1) if response_id else None,
+        item_id.group(1) if item_id else None,
+        msg[start:end],
+    )
+
+
+class UpstreamLost(ConnectionError):
+    """The Realtime connection dropped and could not be re-established."""
+
+
+# event type -> RealtimeBridge method, filled in by @_handles
+_HANDLERS = {}
+
+
+def _handles(*etypes):
+    def register(method):
+        for etype in etypes:
+            _HANDLERS[etype] = method.__name__
+        return method
+
+    return register
 
 
 class RealtimeBridge:
@@ -17,112 +137,422 @@ class RealtimeBridge:
         system_instructions: str,
         on_text: Callable[[str, bool], Awaitable[None]],
         on_audio_chunk: Callable[[bytes], Awaitable[None]],
-        
+        on_audio_done: Optional[Callable[[], Awaitable[None]]] = None,
+        on_speech_started: Optional[Callable[[], Awaitable[None]]] = None,
+        on_speech_stopped: Optional[Callable[[], Awaitable[None]]] = None,
+        on_user_transcript: Optional[Callable[[str], Awaitable[None]]] = None,
+        on_upstream_state: Optional[Callable[[str], Awaitable[None]]] = None,
     ):
-        
+
         self.system_instructions = system_instructions
         self.on_text = on_text
         self.on_audio_chunk = on_audio_chunk
+        self.on_audio_done = on_audio_done
+        self.on_speech_started = on_speech_started
+        self.on_speech_stopped = on_speech_stopped
+        self.on_user_transcript = on_user_transcript
+        # "reconnecting", then "connected" or (having given up) "lost"
+        self.on_upstream_state = on_upstream_state
+        self.turn_detection = "manual"
+        self.warm = False  # connected via a pre-warmed pool connection
+        self.sent_instructions: Optional[str] = None
         self.ws: Optional[websockets.WebSocketClientProtocol] = None
         self._listen_task: Optional[asyncio.Task] = None
+        self.uplink = UplinkCoalescer(self._send_audio_append)
 
-    async def connect(self):
-        self.ws = await websockets.connect(
-            REALTIME_URL,
-            additional_headers  ={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "OpenAI-Beta": "realtime=v1",
-            },
-        )
-
-        session_update = {
-            "type": "session.update",
-            "session": {
-                "instructions": self.system_instructions,
-                "language": "en",
-                "input_audio_format": "pcm16",
-                "output_audio_format": "pcm16",
-                "modalities": ["audio", "text"],
-                "voice": "verse",
-            },
-        }
-        await self.ws.send(json.dumps(session_update))
+        # reconnect state: sends wait on _connected, audio piles up in _held
+        self._connected = asyncio.Event()
+        self._closing = False
+        self.lost = False
+        self.reconnects = 0
+        self._held = bytearray()
+        self._held_max = UPSTREAM_SAMPLE_RATE * BYTES_PER_SAMPLE * REALTIME_RECONNECT_BUFFER_MS // 1000
+        # (role, text) of recent turns, replayed into a new upstream session
+        self.context = deque(maxlen=REALTIME_REPLAY_TURNS)
+        self._reply_text = []
+        # agent.recorder.SessionRecorder, when the session is recorded
+        self.recorder = None
+        # event type -> async handler(event); callers may add their own
+        self.handlers = {etype: getattr(self, name) for etype, name in _HANDLERS.items()}
+
+        # in-flight response bookkeeping for barge-in
+        self.response_id: Optional[str] = None
+        self.audio_item_id: Optional[str] = None
+        self.played_bytes = 0  # PCM16 @ 24 kHz actually delivered to the client
+        self._cancelled_response_id: Optional[str] = None
+
+    async def connect(self, turn_detection: str = TURN_DETECTION):
+        if turn_detection not in TURN_DETECTION_MODES:
+            raise ValueError(f"unknown turn detection mode: {turn_detection}")
+        self.turn_detection = turn_detection
+        await self._open()
+        self._connected.set()
+        self._listen_task = asyncio.create_task(self._run())
 
-        self._listen_task = asyncio.create_task(self._listen_loop())
+    async def _open(self, replay: bool = False):
+        if realtime_pool.enabled:
+            # baseline config is already applied upstream (warm, or opened
+            # on a pool miss); only the per-user bits are pushed here
+            ws, self.warm = await realtime_pool.acquire()
+            session = {"turn_detection": turn_detection_config(self.turn_detection)}
+        else:
+            ws = await _open_socket()
+            session = baseline_session_config(self.turn_detection)
+
+        # read instructions only now: the caller may have filled in the
+        # user's memories while the handshake was in flight
+        session["instructions"] = self.system_instructions
+        update = fastjson.dumps({"type": "session.update", "session": session})
+        try:
+            await ws.send(update)
+        except websockets.ConnectionClosed:
+            if not self.warm:
+                raise
+            # the warm one went away after checkout: a fresh one instead
+            logger.warning("Warm Realtime connection was closed, opening a new one")
+            ws, self.warm = await open_realtime_connection(), False
+            await ws.send(update)
+        self.sent_instructions = self.system_instructions
+
+        if replay:
+            # a new upstream session knows nothing: give it the recent turns
+            for role, text in self.context:
+                content_type = "text" if role == "assistant" else "input_text"
+                item = {"type": "message", "role": role, "content": [{"type": content_type, "text": text}]}
+                await ws.send(fastjson.dumps({"type": "conversation.item.create", "item": item}))
+        self.ws = ws
 
     async def close(self):
+        self._closing = True
+        self._connected.set()  # nothing waits for a reconnect any more
+        self.uplink.close()
         if self.ws:
             await self.ws.close()
         if self._listen_task:
             self._listen_task.cancel()
 
+    async def _run(self):
+        # the listen loop, reconnected for as long as the session lasts
+        while True:
+            try:
+                await self._listen_loop()
+                reason = "closed by upstream"
+            except (websockets.ConnectionClosed, OSError) as e:
+                reason = str(e) or type(e).__name__
+            except Exception:
+                # a handler failed on one event: skip it, keep listening (on a
+                # socket that has gone meanwhile the loop just ends)
+                logger.exception("Realtime event handling failed")
+                if not self._closing:
+                    continue
+            if self._closing:
+                return
+            logger.warning("Realtime connection lost (%s), reconnecting", reason)
+            if not await self._reconnect():
+                return
+
+    async def _reconnect(self) -> bool:
+        self._connected.clear()
+        # whatever was in flight died with the old session
+        if self.response_id is not None or self._reply_text:
+            self.response_id = None
+            self._end_reply()
+            if self.on_audio_done is not None:
+                await self.on_audio_done()
+            await self.on_text("", True)
+        self.audio_item_id = None
+        self.played_bytes = 0
+        self._cancelled_response_id = None
+        await self._notify_state("reconnecting")
+
+        delay = REALTIME_RECONNECT_BACKOFF_S
+        for attempt in range(1, REALTIME_RECONNECT_ATTEMPTS + 1):
+            # jittered, so sessions dropped together don't come back together
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            if self._closing:
+                return False
+            try:
+                await self._open(replay=True)
+                # audio that came in meanwhile goes first; new sends wait until it's out
+                while self._held:
+                    data = bytes(self._held[: self.uplink.target_bytes or len(self._held)])
+                    del self._held[: len(data)]
+                    try:
+                        await self._append(self.ws, data)
+                    except websockets.ConnectionClosed:
+                        self._held[:0] = data  # not sent: it goes out on the next attempt
+                        raise
+            except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+                # ConnectionClosed included: a socket lost while replaying is
+                # just another failed attempt
+                logger.warning("Realtime reconnect attempt %d/%d failed: %s", attempt, REALTIME_RECONNECT_ATTEMPTS, e)
+                delay = min(delay * 2, REALTIME_RECONNECT_MAX_BACKOFF_S)
+                continue
+            self._connected.set()
+            self.reconnects += 1
+            UPSTREAM_RECONNECTS.labels("ok").inc()
+            logger.info("Realtime reconnected after %d attempt(s), replayed %d turns", attempt, len(self.context))
+            await self._notify_state("connected")
+            return True
+
+        UPSTREAM_RECONNECTS.labels("failed").inc()
+        logger.error("Realtime reconnect failed %d times, giving up", REALTIME_RECONNECT_ATTEMPTS)
+        self.lost = True
+        self._held.clear()
+        self._connected.set()  # waiting sends raise UpstreamLost
+        await self._notify_state("lost")
+        return False
+
+    async def _notify_state(self, state: str):
+        if self.on_upstream_state is not None:
+            await self.on_upstream_state(state)
+
+    async def _send(self, event: dict):
+        msg = fastjson.dumps(event)
+        # from a handler the listen task runs, waiting for the reconnect would
+        # hang it: that task is the one that reconnects. Fail instead, and let
+        # _run reconnect.
+        in_listen_task = self._listen_task is not None and asyncio.current_task() is self._listen_task
+        while True:
+            if not self._connected.is_set():
+                if in_listen_task:
+                    raise UpstreamLost("Realtime connection dropped")
+                await self._connected.wait()
+            if self.lost or self._closing:
+                raise UpstreamLost("Realtime connection is gone")
+            ws = self.ws
+            try:
+                await ws.send(msg)
+                if self.recorder is not None:
+                    self.recorder.sent(msg)
+                return
+            except websockets.ConnectionClosed:
+                # the listen loop sees it too and reconnects; send again then
+                if ws is self.ws:
+                    self._connected.clear()
+                if in_listen_task:
+                    raise
+
     async def _listen_loop(self):
         assert self.ws is not None
+        debug = logger.isEnabledFor(logging.DEBUG)
         async for msg in self.ws:
             if isinstance(msg, bytes):
                 # Usually everything from Realtime is JSON text, so bytes here are rare.
-                print("WS BYTES FROM REALTIME:", len(msg))
+                if debug:
+                    logger.debug("WS bytes from Realtime: %d", len(msg))
+                continue
+
+            # audio deltas are most of the traffic: pulled out of the raw
+            # message without building the event dict
+            audio = parse_audio_delta(msg)
+            if audio is not None:
+                _AUDIO_DELTA_EVENTS.inc()
+                response_id, item_id, b64_audio = audio
+                if response_id is None or response_id != self._cancelled_response_id:
+                    await self._on_audio_delta(item_id, binascii.a2b_base64(b64_audio))
                 continue
 
-            event = json.loads(msg)
+            if self.recorder is not None:
+                self.recorder.upstream(msg)
+            event = fastjson.loads(msg)
             etype = event.get("type")
-            print("REALTIME EVENT:", etype)  # keep this for debugging
+            UPSTREAM_EVENTS.labels(etype).inc()
+            if debug:
+                logger.debug("Realtime event: %s", etype)
+
+            if (
+                self._cancelled_response_id is not None
+                and event.get("response_id") == self._cancelled_response_id
+            ):
+                # leftovers of a response the user talked over
+                continue
+
+            handler = self.handlers.get(etype)
+            if handler is not None:
+                await handler(event)
+            elif debug:
+                logger.debug("Unhandled Realtime event: %s", etype)
+
+    # ---- upstream event handlers, by event type (see _handles) ----
+
+    # 0) RESPONSE LIFECYCLE (needed for cancel / truncate on barge-in)
+    @_handles("response.created")
+    async def _on_response_created(self, event):
+        self.response_id = event["response"]["id"]
 
-            # 1) ASSISTANT TRANSCRIPT (text of the AI's spoken reply)
-            if etype == "response.audio_transcript.delta":
-                # This is a partial text transcript of the model's audio **response**
-                text = event["delta"]          # <--- IMPORTANT: it's directly in "delta"
-                await self.on_text(text, False)
+    @_handles("response.done")
+    async def _on_response_done(self, event):
+        if self.response_id == event["response"]["id"]:
+            self.response_id = None
 
-            elif etype == "response.audio_transcript.done":
-                # Full transcript done
-                await self.on_text("", True)
+    # 1) ASSISTANT TRANSCRIPT (text of the AI's spoken reply)
+    @_handles("response.audio_transcript.delta")
+    async def _on_transcript_delta(self, event):
+        # partial text transcript of the model's audio response, directly in "delta"
+        self._reply_text.append(event["delta"])
+        await self.on_text(event["delta"], False)
 
-            # 2) ASSISTANT AUDIO (base64-encoded PCM16)
-            # elif etype == "response.audio.delta":
-            elif etype == "response.audio.delta":
-                # event["delta"] is a base64-encoded audio chunk
-                b64_audio = event["delta"]
-                pcm_bytes = base64.b64decode(b64_audio)
-                await self.on_audio_chunk(pcm_bytes)
+    @_handles("response.audio_transcript.done")
+    async def _on_transcript_done(self, event):
+        self._end_reply()
+        await self.on_text("", True)
 
-            elif etype == "response.audio.done":
-                # No more audio for this response – optional to handle
-                print("AUDIO DONE")
+    def _end_reply(self):
+        text = "".join(self._reply_text).strip()
+        self._reply_text.clear()
+        if text:
+            self.context.append(("assistant", text))
 
-            # 3) OPTIONAL: transcription of *your* input audio
-            elif etype == "conversation.item.input_audio_transcription.delta":
-                # If you want to see what the model heard from the user:
-                print("USER TRANSCRIPT DELTA:", event["delta"])
-            elif etype == "conversation.item.input_audio_transcription.completed":
-                print("USER TRANSCRIPT COMPLETE:", event.get("transcript"))
+    # 2) ASSISTANT AUDIO (base64-encoded PCM16)
+    @_handles("response.audio.delta")
+    async def _on_audio_delta_event(self, event):
+        # only when parse_audio_delta couldn't take the fast path
+        await self._on_audio_delta(event.get("item_id"), binascii.a2b_base64(event["delta"]))
 
-            # 4) REAL errors
-            elif etype == "response.error" or etype == "error":
-                print("REALTIME ERROR EVENT:", event)
+    async def _on_audio_delta(self, item_id: Optional[str], pcm_bytes: bytes):
+        if item_id != self.audio_item_id:
+            self.audio_item_id = item_id
+            self.played_bytes = 0
+        if self.recorder is not None:
+            self.recorder.downlink(pcm_bytes)
+        await self.on_audio_chunk(pcm_bytes)
 
-            else:
-                # Useful during development – you can comment this out later
-                print("UNHANDLED EVENT:", event)
+    @_handles("response.audio.done")
+    async def _on_audio_done(self, event):
+        # No more audio for this response – let the consumer flush
+        if self.on_audio_done is not None:
+            await self.on_audio_done()
 
+    # 3) SERVER VAD: the user started talking (possibly over us)
+    @_handles("input_audio_buffer.speech_started")
+    async def _on_speech_started(self, event):
+        if self.on_speech_started is not None:
+            await self.on_speech_started()
 
-  
+    @_handles("input_audio_buffer.speech_stopped")
+    async def _on_speech_stopped(self, event):
+        if self.on_speech_stopped is not None:
+            await self.on_speech_stopped()
 
+    @_handles("input_audio_buffer.committed")
+    async def _on_ignored(self, event):
+        # server_vad commits and creates the response by itself
+        pass
+
+    # 4) transcription of the user's input audio
+    @_handles("conversation.item.input_audio_transcription.completed")
+    async def _on_user_transcript(self, event):
+        if event.get("transcript"):
+            self.remember("user", event["transcript"])
+        if self.on_user_transcript is not None and event.get("transcript"):
+            await self.on_user_transcript(event["transcript"])
+
+    # 5) REAL errors
+    @_handles("response.error", "error")
+    async def _on_error(self, event):
+        logger.warning("Realtime error event: %s", event)
 
     async def send_audio_chunk(self, pcm_bytes: bytes):
-        assert self.ws is not None
+        # Batched by the coalescer, sent via _send_audio_append
+        if self.recorder is not None:
+            self.recorder.uplink(pcm_bytes)
+        await self.uplink.push(pcm_bytes)
+
+    async def _send_audio_append(self, pcm_bytes: bytes):
+        if self.lost or self._closing:
+            return  # nowhere to send it
+        if not self._connected.is_set():
+            self._hold(pcm_bytes)
+            return
+        ws = self.ws
+        try:
+            await self._append(ws, pcm_bytes)
+        except websockets.ConnectionClosed:
+            # dropped under us: keep it for the next connection
+            if ws is self.ws:
+                self._connected.clear()
+            self._hold(pcm_bytes)
+
+    async def _append(self, ws, pcm_bytes: bytes):
         b64 = base64.b64encode(pcm_bytes).decode()
         event = {
             "type": "input_audio_buffer.append",
             "audio": b64,
             # "audio_format": "pcm16",
         }
-        await self.ws.send(json.dumps(event))
+        await ws.send(fastjson.dumps(event))
 
-    async def commit_and_request_response(self):
-        assert self.ws is not None
+    def _hold(self, pcm_bytes: bytes):
+        self._held += pcm_bytes
+        excess = len(self._held) - self._held_max
+        if excess > 0:
+            del self._held[: excess + excess % BYTES_PER_SAMPLE]
+
+    def remember(self, role: str, text: str):
+        """A finished turn the upstream session would lose on reconnect."""
+        self.context.append((role, text))
 
-        await self.ws.send(json.dumps({"type": "input_audio_buffer.commit"}))
+    async def update_instructions(self, instructions: str):
+        self.system_instructions = instructions
+        await self._send({"type": "session.update", "session": {"instructions": instructions}})
+        self.sent_instructions = instructions
+
+    async def inject_instruction(self, text: str, respond: bool = False):
+        # a system message into the conversation (e.g. from a supervisor),
+        # optionally answered right away
+        item = {"type": "message", "role": "system", "content": [{"type": "input_text", "text": text}]}
+        await self._send({"type": "conversation.item.create", "item": item})
+        self.remember("system", text)
+        if respond and not self.response_active:
+            await self._send({"type": "response.create"})
+
+    def mark_played(self, pcm_bytes: int, item_id: Optional[str]):
+        # called once audio has gone out to the client; frames of an earlier
+        # item still draining from the queue don't count toward the current one
+        if item_id is not None and item_id == self.audio_item_id:
+            self.played_bytes += pcm_bytes
+
+    @property
+    def response_active(self) -> bool:
+        return self.response_id is not None
+
+    async def cancel_response(self) -> Optional[int]:
+        """
+        Barge-in: stop the in-flight response upstream and truncate the
+        assistant item to what the client actually got. Returns the
+        truncation point in ms (None if nothing was playing).
+        """
+        if self.response_id is None and self.audio_item_id is None:
+            return None
+
+        # what was said of it so far (the transcript runs a little ahead)
+        self._end_reply()
+        if self.response_id is not None:
+            self._cancelled_response_id = self.response_id
+            self.response_id = None
+            await self._send({"type": "response.cancel"})
+
+        audio_end_ms = None
+        if self.audio_item_id is not None:
+            audio_end_ms = self.played_bytes * 1000 // (UPSTREAM_SAMPLE_RATE * BYTES_PER_SAMPLE)
+            await self._send(
+                {
+                    "type": "conversation.item.truncate",
+                    "item_id": self.audio_item_id,
+                    "content_index": 0,
+                    "audio_end_ms": audio_end_ms,
+                }
+            )
+            self.audio_item_id = None
+            self.played_bytes = 0
+        return audio_end_ms
+
+    async def commit_and_request_response(self):
+        # Make sure the tail of the utterance is in the buffer before commit
+        # (held, if we are reconnecting: _send waits until it's upstream)
+        await self.uplink.flush()
+        await self._send({"type": "input_audio_buffer.commit"})
 
         response_create = {
             "type": "response.create",
@@ -138,4 +568,4 @@ class RealtimeBridge:
         ),
             },
         }
-        await self.ws.send(json.dumps(response_create))
\ No newline at end of file
+        await self._send(response_create)
\ No newline at end of file
@@ -0,0 +1,495 @@
+# agent/recorder.py
+"""
+Per-session recordings for latency debugging: uplink PCM, downlink PCM,
+the upstream event stream, what we sent upstream and the client's control
+messages, each with its time since the session started.
+
+Opt-in: with RECORD_DIR set, a session is recorded when its URL has
+?record=1 or, at random, for RECORD_FRACTION of sessions. Audio is
+recorded as the bridge sees it (PCM16, 24 kHz mono), so a recording is
+personal data like the transcript.
+
+File layout (little-endian, append-only, every record 8-byte aligned so an
+mmap can be read in place, e.g. PCM with np.frombuffer):
+
+  header  b"VREC\\x01\\0\\0\\0", start time (unix ns, int64)
+  chunk   b"CHNK", payload length (uint32), first and last record time
+          (ns since start, int64 each), then records:
+  record  kind (uint8), 3 pad bytes, length (uint32), time (int64),
+          payload padded to 8 bytes
+
+<file>.idx holds (first record time, chunk offset) per chunk, so a reader
+seeks by time without scanning; without it (or past its end, after a
+crash) the chunk headers are scanned instead.
+
+The event loop only appends to an in-memory chunk; full chunks, and
+partial ones RECORD_FLUSH_S after their first record (a loop timer, so a
+quiet session's tail isn't held until close), go to one writer thread per
+process, which does all the file I/O. Chunks beyond RECORD_MAX_PENDING_MB waiting for that thread are
+dropped, and counted, rather than held.
+
+`manage.py replay_recording` prints a recording's per-turn timing
+waterfall and can replay its client side against the bridge.
+"""
+import os
+import re
+import json
+import mmap
+import time
+import queue
+import random
+import struct
+import asyncio
+import logging
+import threading
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from . import fastjson
+from .metrics import RECORDING_DROPPED_BYTES
+
+logger = logging.getLogger(__name__)
+
+RECORD_DIR = os.getenv("RECORD_DIR", "")
+RECORD_FRACTION = float(os.getenv("RECORD_FRACTION", "0"))
+RECORD_CHUNK_BYTES = int(os.getenv("RECORD_CHUNK_BYTES", str(256 * 1024)))
+RECORD_FLUSH_S = float(os.getenv("RECORD_FLUSH_S", "1"))
+RECORD_MAX_PENDING_MB = float(os.getenv("RECORD_MAX_PENDING_MB", "32"))
+
+# record kinds
+META = 0  # JSON: user_id, session_id, ...
+UPLINK = 1  # PCM16 24 kHz from the client
+DOWNLINK = 2  # PCM16 24 kHz from upstream
+UPSTREAM = 3  # event received from upstream (audio deltas: see DOWNLINK)
+SENT = 4  # event sent upstream (audio appends: see UPLINK)
+CLIENT = 5  # control message from the client
+KIND_NAMES = {META: "meta", UPLINK: "uplink", DOWNLINK: "downlink", UPSTREAM: "upstream", SENT: "sent", CLIENT: "client"}
+
+MAGIC = b"VREC\x01\x00\x00\x00"
+_HEADER = struct.Struct("<8sq")
+_CHUNK = struct.Struct("<4sIqq")
+_RECORD = struct.Struct("<BxxxIq")
+_INDEX = struct.Struct("<qq")
+
+
+class RecordingWriter:
+    """
+    The one thread per process that writes recordings. open/append/close
+    only queue work; append refuses (and counts) chunks over the budget.
+    """
+
+    def __init__(self, max_pending_bytes: int = int(RECORD_MAX_PENDING_MB * 2**20)):
+        self.max_pending_bytes = max_pending_bytes
+        self.pending_bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+        self.written_bytes = 0
+        self.dropped_bytes = 0
+        self.errors = 0
+
+    def open(self, path: str, header: bytes):
+        self._put(("open", path, header, 0))
+
+    def append(self, path: str, chunk: bytes, t_first: int) -> bool:
+        with self._lock:
+            if self.pending_bytes + len(chunk) > self.max_pending_bytes:
+                self.dropped_bytes += len(chunk)
+                RECORDING_DROPPED_BYTES.inc(len(chunk))
+                return False
+            self.pending_bytes += len(chunk)
+        self._put(("append", path, chunk, t_first))
+        return True
+
+    def close(self, path: str):
+        self._put(("close", path, None, 0))
+
+    def sync(self, timeout: float = 5.0) -> bool:
+        """Blocks until everything queued so far is written (tests, CLI)."""
+        done = threading.Event()
+        self._put(("sync", None, done, 0))
+        return done.wait(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "pending_bytes": self.pending_bytes,
+            "written_bytes": self.written_bytes,
+            "dropped_bytes": self.dropped_bytes,
+            "errors": self.errors,
+        }
+
+    def _put(self, item):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+            self._thread.start()
+        self._queue.put(item)
+
+    def _run(self):
+        files: Dict[str, list] = {}  # path -> [file, index file, offset]
+        while True:
+            op, path, data, t_first = self._queue.get()
+            try:
+                if op == "sync":
+                    data.set()
+                elif op == "open":
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    f = open(path, "ab")
+                    if f.tell() == 0:
+                        f.write(data)
+                    files[path] = [f, open(path + ".idx", "ab"), f.tell()]
+                elif op == "append":
+                    entry = files.get(path)
+                    if entry is not None:
+                        f, idx, offset = entry
+                        f.write(data)
+                        f.flush()
+                        # after the chunk, so the index never points past the file
+                        idx.write(_INDEX.pack(t_first, offset))
+                        idx.flush()
+                        entry[2] = offset + len(data)
+                        self.written_bytes += len(data)
+                elif op == "close":
+                    entry = files.pop(path, None)
+                    if entry is not None:
+                        entry[0].close()
+                        entry[1].close()
+            except OSError as e:
+                self.errors += 1
+                logger.warning("Recording %s: %s failed: %s", path, op, e)
+            finally:
+                if op == "append":
+                    with self._lock:
+                        self.pending_bytes -= len(data)
+
+
+class MemoryWriter:
+    """Keeps a recording in memory instead (replays)."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def open(self, path: str, header: bytes):
+        self.data += header
+
+    def append(self, path: str, chunk: bytes, t_first: int) -> bool:
+        self.data += chunk
+        return True
+
+    def close(self, path: str):
+        pass
+
+
+recording_writer = RecordingWriter()
+
+
+class SessionRecorder:
+    """Appends records for one session; called on the event loop only."""
+
+    def __init__(
+        self,
+        path: str,
+        meta: Optional[dict] = None,
+        writer=None,
+        chunk_bytes: int = RECORD_CHUNK_BYTES,
+        flush_s: float = RECORD_FLUSH_S,
+    ):
+        self.path = path
+        self.writer = writer if writer is not None else recording_writer
+        self.chunk_bytes = chunk_bytes
+        self.flush_ns = int(flush_s * 1e9)
+        self._start = time.perf_counter_ns()
+        self._buf = bytearray()
+        self._t_first: Optional[int] = None
+        self._t_last = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.records = 0
+        self.writer.open(path, _HEADER.pack(MAGIC, time.time_ns()))
+        if meta:
+            self.meta(**meta)
+
+    def uplink(self, pcm_bytes: bytes):
+        self._add(UPLINK, pcm_bytes)
+
+    def downlink(self, pcm_bytes: bytes):
+        self._add(DOWNLINK, pcm_bytes)
+
+    def upstream(self, msg: str):
+        self._add(UPSTREAM, msg.encode())
+
+    def sent(self, msg: str):
+        self._add(SENT, msg.encode())
+
+    def client(self, msg: str):
+        self._add(CLIENT, msg.encode())
+
+    def meta(self, **fields):
+        self._add(META, json.dumps(fields).encode())
+
+    def flush(self):
+        self._cancel_timer()
+        if not self._buf:
+            return
+        chunk = _CHUNK.pack(b"CHNK", len(self._buf), self._t_first, self._t_last) + self._buf
+        self.writer.append(self.path, chunk, self._t_first)
+        self._buf = bytearray()
+        self._t_first = None
+
+    def close(self):
+        self.flush()
+        self.writer.close(self.path)
+
+    def _add(self, kind: int, payload: bytes):
+        t = time.perf_counter_ns() - self._start
+        buf = self._buf
+        buf += _RECORD.pack(kind, len(payload), t)
+        buf += payload
+        pad = -len(payload) % 8
+        if pad:
+            buf += bytes(pad)
+        self.records += 1
+        if self._t_first is None:
+            self._t_first = t
+        self._t_last = t
+        if len(buf) >= self.chunk_bytes or t - self._t_first >= self.flush_ns:
+            self.flush()
+        elif self._timer is None and self.flush_ns > 0:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return  # off the loop (tools, tests): flushed by size and on close
+            self._timer = loop.call_later(self.flush_ns / 1e9, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+_recordings = 0
+
+
+def start_recording(user_id: str, requested: bool, meta: dict) -> Optional[SessionRecorder]:
+    """A recorder for a new session, or None when it isn't recorded."""
+    global _recordings
+    if not RECORD_DIR or not (requested or random.random() < RECORD_FRACTION):
+        return None
+    _recordings += 1
+    # e.g. 20260101T120000-user42-1234-1.vrec
+    name = "{}-{}-{}-{}.vrec".format(
+        time.strftime("%Y%m%dT%H%M%S"), re.sub(r"[^\w\-]", "_", user_id)[:40], os.getpid(), _recordings
+    )
+    return SessionRecorder(os.path.join(RECORD_DIR, name), {"user_id": user_id, **meta})
+
+
+class Recording:
+    """A recording file (memory-mapped) or buffer, read by time."""
+
+    def __init__(self, source):
+        self.path = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._buf = memoryview(source)
+        else:
+            self.path = source
+            with open(source, "rb") as f:
+                self._buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, self.started_at_ns = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"not a recording: {source if self.path else 'buffer'}")
+        self.index = self._load_index()
+        self._firsts = [t for t, _ in self.index]
+
+    @property
+    def meta(self) -> dict:
+        fields = {}
+        for _, _, payload in self.records(kinds=(META,)):
+            fields.update(json.loads(bytes(payload)))
+        return fields
+
+    @property
+    def duration_s(self) -> float:
+        if not self.index:
+            return 0.0
+        return _CHUNK.unpack_from(self._buf, self.index[-1][1])[3] / 1e9
+
+    def records(
+        self, start_ns: int = 0, end_ns: Optional[int] = None, kinds=None
+    ) -> Iterator[Tuple[int, int, memoryview]]:
+        """(time ns, kind, payload) in order, from the chunk holding start_ns."""
+        buf = self._buf
+        first = max(0, bisect_right(self._firsts, start_ns) - 1)
+        for t_first, offset in self.index[first:]:
+            if end_ns is not None and t_first > end_ns:
+                return
+            length = _CHUNK.unpack_from(buf, offset)[1]
+            pos = offset + _CHUNK.size
+            end = pos + length
+            while pos < end:
+                kind, size, t = _RECORD.unpack_from(buf, pos)
+                pos += _RECORD.size
+                payload = buf[pos:pos + size]
+                pos += size + (-size % 8)
+                if t < start_ns:
+                    continue
+                if end_ns is not None and t > end_ns:
+                    return
+                if kinds is None or kind in kinds:
+                    yield t, kind, payload
+
+    def _load_index(self) -> List[Tuple[int, int]]:
+        entries = []
+        if self.path is not None and os.path.exists(self.path + ".idx"):
+            with open(self.path + ".idx", "rb") as f:
+                data = f.read()
+            whole = len(data) - len(data) % _INDEX.size  # a torn last entry is ignored
+            entries = [e for e in _INDEX.iter_unpack(data[:whole]) if self._chunk_at(e[1]) is not None]
+        # chunks written after the last index entry (or no index at all)
+        offset = _HEADER.size
+        if entries:
+            offset = entries[-1][1] + _CHUNK.size + self._chunk_at(entries[-1][1])
+        while True:
+            length = self._chunk_at(offset)
+            if length is None:
+                return entries
+            entries.append((_CHUNK.unpack_from(self._buf, offset)[2], offset))
+            offset += _CHUNK.size + length
+
+    def _chunk_at(self, offset: int) -> Optional[int]:
+        # payload length of a whole chunk at offset, None if there isn't one
+        if offset + _CHUNK.size > len(self._buf):
+            return None
+        magic, length, _, _ = _CHUNK.unpack_from(self._buf, offset)
+        if magic != b"CHNK" or offset + _CHUNK.size + length > len(self._buf):
+            return None
+        return length
+
+
+# ---- timing waterfall ----
+
+WATERFALL_COLUMNS = ("commit", "created", "first_text", "first_audio", "done")
+
+
+def waterfall(recording: Recording) -> List[dict]:
+    """
+    One row per user turn, in ms from the end of the turn (client
+    stop_speaking, else our commit or upstream's speech_stopped) to: our
+    commit, response.created, the first transcript delta, the first reply
+    audio and response.done.
+    """
+    turns: List[dict] = []
+    turn: Optional[dict] = None  # the latest user turn
+    by_response: Dict[str, dict] = {}
+    speaking: Optional[dict] = None  # whose reply audio is arriving
+
+    def new_turn(t):
+        turns.append({"at": t})
+        return turns[-1]
+
+    for t, kind, payload in recording.records(kinds=(CLIENT, SENT, UPSTREAM, DOWNLINK)):
+        if kind == DOWNLINK:
+            if speaking is not None:
+                speaking.setdefault("first_audio", t)
+            continue
+        event = fastjson.loads(bytes(payload))
+        etype = event.get("type")
+        if kind == CLIENT:
+            if etype == "stop_speaking":
+                turn = new_turn(t)
+        elif kind == SENT:
+            if etype == "input_audio_buffer.commit":
+                if turn is None or "commit" in turn or "created" in turn:
+                    turn = new_turn(t)
+                turn["commit"] = t
+        elif etype == "input_audio_buffer.speech_stopped":
+            turn = new_turn(t)
+        elif etype == "response.created":
+            # an answer to the latest turn, unless that one has its own
+            if turn is not None and "created" not in turn:
+                turn["created"] = t
+                by_response[event["response"]["id"]] = speaking = turn
+        elif etype == "response.audio_transcript.delta":
+            if event.get("response_id") in by_response:
+                by_response[event["response_id"]].setdefault("first_text", t)
+        elif etype == "response.done":
+            done = by_response.pop(event["response"]["id"], None)
+            if done is not None:
+                done["done"] = t
+                if speaking is done:
+                    speaking = None
+
+    return [
+        {
+            "turn": n,
+            "at_s": round(row["at"] / 1e9, 3),
+            **{f"{c}_ms": round((row[c] - row["at"]) / 1e6, 1) if c in row else None for c in WATERFALL_COLUMNS},
+        }
+        for n, row in enumerate(turns, 1)
+    ]
+
+
+# ---- replay ----
+
+
+async def replay(recording: Recording, speed: float = 1.0, settle_s: float = 10.0) -> Recording:
+    """
+    Plays the client side of a recording (uplink audio, control messages)
+    into a new RealtimeBridge on the current REALTIME_URL, on the original
+    schedule (/ speed; 0 = as fast as possible), ending turns the way
+    VoiceConsumer does. Returns the replay's own recording.
+    """
+    from .realtime_bridge import RealtimeBridge
+    from .vad import EnergyVAD, SPEECH_STARTED, SPEECH_STOPPED
+
+    async def ignore(*args):
+        pass
+
+    meta = recording.meta
+    turn_detection = meta.get("turn_detection", "manual")
+    writer = MemoryWriter()
+    recorder = SessionRecorder("replay", {**meta, "replay_of": recording.path}, writer=writer)
+    bridge = RealtimeBridge("You are a helpful voice assistant.", on_text=ignore, on_audio_chunk=ignore)
+    bridge.recorder = recorder
+    vad = EnergyVAD() if turn_detection == "local_vad" else None
+    await bridge.connect(turn_detection=turn_detection)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for t, kind, payload in recording.records(kinds=(UPLINK, CLIENT)):
+        if speed:
+            delay = start + t / 1e9 / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if kind == UPLINK:
+            pcm = bytes(payload)
+            await bridge.send_audio_chunk(pcm)
+            for vad_event in vad.process(pcm) if vad is not None else ():
+                if vad_event == SPEECH_STOPPED:
+                    await bridge.commit_and_request_response()
+                elif vad_event == SPEECH_STARTED and bridge.response_active:
+                    await bridge.cancel_response()
+            continue
+        msg = bytes(payload).decode()
+        recorder.client(msg)
+        msg_type = json.loads(msg).get("type")
+        if msg_type == "stop_speaking":
+            if turn_detection == "server_vad":
+                await bridge.uplink.flush()
+            elif vad is None or vad.in_speech:
+                if vad is not None:
+                    vad.reset()
+                await bridge.commit_and_request_response()
+        elif msg_type == "barge_in" or (msg_type == "start_speaking" and bridge.response_active):
+            await bridge.cancel_response()
+
+    # the last reply
+    await asyncio.sleep(0.5)
+    deadline = loop.time() + settle_s
+    while bridge.response_active and loop.time() < deadline:
+        await asyncio.sleep(0.05)
+    await bridge.close()
+    recorder.close()
+    return Recording(bytes(writer.data))
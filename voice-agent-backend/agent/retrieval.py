@@ -0,0 +1,164 @@
+# agent/retrieval.py
+import os
+import re
+import zlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, Max
+from django.utils.module_loading import import_string
+
+from .models import UserMemory
+
+# dotted path to a class with .dim and .embed(texts) -> float32 (n, dim), rows L2-normalized
+MEMORY_EMBEDDER = os.getenv("MEMORY_EMBEDDER", "agent.retrieval.HashingEmbedder")
+MEMORY_EMBEDDING_DIM = int(os.getenv("MEMORY_EMBEDDING_DIM", "256"))
+# memories that go into the system prompt
+MEMORY_PROMPT_K = int(os.getenv("MEMORY_PROMPT_K", "8"))
+# how much importance (0-10) tips the ranking on top of cosine similarity
+MEMORY_IMPORTANCE_WEIGHT = float(os.getenv("MEMORY_IMPORTANCE_WEIGHT", "0.02"))
+# users whose index is kept in this process
+MEMORY_INDEX_MAX_USERS = int(os.getenv("MEMORY_INDEX_MAX_USERS", "1000"))
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: words and character trigrams feature-hashed into `dim`
+    signed buckets. Catches shared vocabulary and spelling variants, not
+    synonyms; swap in a model-backed class via MEMORY_EMBEDDER for that.
+    """
+
+    def __init__(self, dim: int = MEMORY_EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            joined = " ".join(words)
+            features = words + [joined[i:i + 3] for i in range(len(joined) - 2)]
+            for feature in features:
+                # crc32, not hash(): vectors are stored and must match across processes
+                h = zlib.crc32(feature.encode())
+                out[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+
+_embedder = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = import_string(MEMORY_EMBEDDER)()
+    return _embedder
+
+
+def embed_memories(memories: List[UserMemory]):
+    """Fill .embedding on the given (saved or unsaved) rows."""
+    if not memories:
+        return
+    vectors = get_embedder().embed([m.content for m in memories])
+    for memory, vector in zip(memories, vectors):
+        memory.embedding = vector.astype(np.float32).tobytes()
+
+
+class UserMemoryIndex:
+    """
+    One user's memories as a (n, dim) matrix of unit vectors, so a query is
+    a single matrix-vector product. Built from the DB, read-only afterwards.
+    """
+
+    def __init__(self, contents: List[str], importance: np.ndarray, matrix: np.ndarray, version=None):
+        self.contents = contents
+        self.importance = importance
+        self.matrix = matrix
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    @classmethod
+    def build(cls, user_id: str, version=None) -> "UserMemoryIndex":
+        embedder = get_embedder()
+        rows = list(
+            UserMemory.objects.filter(user_id=user_id).only("id", "content", "importance", "embedding")
+        )
+        # rows written before embeddings existed (or by another embedder)
+        stale = [m for m in rows if not m.embedding or len(m.embedding) != embedder.dim * 4]
+        if stale:
+            embed_memories(stale)
+            UserMemory.objects.bulk_update(stale, ["embedding"])
+        matrix = np.frombuffer(b"".join(bytes(m.embedding) for m in rows), dtype=np.float32)
+        return cls(
+            contents=[m.content for m in rows],
+            importance=np.array([m.importance for m in rows], dtype=np.float32),
+            matrix=matrix.reshape(len(rows), embedder.dim),
+            version=version,
+        )
+
+    def top_by_importance(self, k: int = MEMORY_PROMPT_K) -> List[str]:
+        # before anything was said: same idea as get_user_memories()
+        order = np.argsort(-self.importance, kind="stable")[:k]
+        return [self.contents[i] for i in order]
+
+    def search(self, query: str, k: int = MEMORY_PROMPT_K) -> List[str]:
+        if not len(self) or not query.strip():
+            return self.top_by_importance(k)
+        q = get_embedder().embed([query])[0]
+        scores = self.matrix @ q + MEMORY_IMPORTANCE_WEIGHT * self.importance
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [self.contents[i] for i in top]
+
+
+def _index_version(user_id: str) -> Tuple[int, Optional[object]]:
+    agg = UserMemory.objects.filter(user_id=user_id).aggregate(n=Count("id"), last=Max("updated_at"))
+    return agg["n"], agg["last"]
+
+
+class MemoryIndexStore:
+    """
+    Per-process LRU of UserMemoryIndex. get() revalidates with one cheap
+    aggregate query, so writes from the memory worker process are picked up
+    on the next session without any cross-process signalling.
+    """
+
+    def __init__(self, max_users: int = MEMORY_INDEX_MAX_USERS):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[str, UserMemoryIndex]" = OrderedDict()
+        # get() may run on several DB threads at once (DB_THREAD_SENSITIVE=False)
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+
+    def get(self, user_id: str) -> UserMemoryIndex:
+        """Sync (ORM); call from a thread, e.g. via db_sync_to_async."""
+        version = _index_version(user_id)
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is not None and index.version == version:
+            self.reuses += 1
+        else:
+            index = UserMemoryIndex.build(user_id, version)
+            self.builds += 1
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+
+memory_indexes = MemoryIndexStore()
@@ -1,3 +1,2340 @@
-from django.test import TestCase
+import os
+import json
+import time
+import shutil
+import tempfile
+import base64
+import logging
+import threading
+import tracemalloc
+import asyncio
+import unittest
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
 
-# Create your tests here.
+import numpy as np
+import redis
+import websockets
+from websockets.protocol import State
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.db import IntegrityError, OperationalError, transaction
+from django.utils import timezone
+
+from .audio import UplinkCoalescer, StreamingResampler
+from .codecs import OPUS_AVAILABLE, OpusSessionCodec, OpusCodecPool
+from .event_buffer import EventWriteBuffer
+from .outbound import OutboundQueue
+from .log import FrameLog, QueueLogHandler, SessionContextFilter, bind_session, new_session_context
+from .consumers import CLOSE_DRAINED, CLOSE_ENDED, CLOSE_UPSTREAM_LOST, VoiceConsumer
+from .admission import CLOSE_CODES, AdmissionController, admission
+from .drain import CLOSE_DRAINING, WorkerDrain, worker_drain
+from .directory import SessionDirectory, drain_worker, end_session, inject_instruction, session_directory
+from .realtime_bridge import RealtimeBridge, UpstreamLost, parse_audio_delta
+from .vad import EnergyVAD, SPEECH_STARTED, SPEECH_STOPPED
+from .upstream_pool import PoolStartupMiddleware, RealtimeConnectionPool
+from .recorder import (
+    CLIENT,
+    DOWNLINK,
+    SENT,
+    UPLINK,
+    UPSTREAM,
+    MemoryWriter,
+    Recording,
+    RecordingWriter,
+    SessionRecorder,
+    recording_writer,
+    replay,
+    waterfall,
+)
+from .memory import (
+    EVENT_SEQ_RETRIES,
+    aadd_event,
+    aadd_events,
+    add_events,
+    bootstrap_session,
+    build_transcript,
+    create_conversation_session,
+    get_or_create_user,
+)
+from .models import ConversationEvent, ConversationSession, MemoryJob, MemoryJobStatus, UserMemory, UserProfile
+from .consolidation import apply_consolidation, consolidate_memories, deduplicate_memories, plan_consolidation
+from .retrieval import MEMORY_PROMPT_K, HashingEmbedder, MemoryIndexStore, memory_indexes
+from .prompt_cache import CachedMemories, MemoryBlockCache, memory_cache
+from .transcript import condense_transcript, iter_transcript_chunks
+from .jobs import MemoryJobWorker, claim_jobs, enqueue_memory_extraction, run_memory_job
+from . import metrics
+
+
+def setUpModule():
+    # the process-wide Redis clients point at REDIS_URL; keep the tests off
+    # whatever a local Redis holds from earlier runs
+    for client in (memory_cache, session_directory, admission):
+        patcher = patch.object(client, "url", "")
+        patcher.start()
+        unittest.addModuleCleanup(patcher.stop)
+
+
+def sine_pcm(rate, seconds=1.0, freq=440.0, amp=10000):
+    t = np.arange(int(rate * seconds)) / rate
+    return (amp * np.sin(2 * np.pi * freq * t)).astype("<i2").tobytes()
+
+
+class FakeRealtimeSocket:
+    """In-process stand-in for the upstream websocket used by RealtimeBridge."""
+
+    def __init__(self):
+        self.sent = []
+        self._incoming = asyncio.Queue()
+
+    async def send(self, msg):
+        self.sent.append(json.loads(msg))
+
+    def push(self, event):
+        self._incoming.put_nowait(json.dumps(event))
+
+    async def close(self):
+        self._incoming.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        msg = await self._incoming.get()
+        if msg is None:
+            raise StopAsyncIteration
+        return msg
+
+    def sent_of_type(self, etype):
+        return [e for e in self.sent if e["type"] == etype]
+
+
+def audio_delta(response_id, item_id, pcm):
+    return {
+        "type": "response.audio.delta",
+        "response_id": response_id,
+        "item_id": item_id,
+        "delta": base64.b64encode(pcm).decode(),
+    }
+
+
+class FakeLLMClient:
+    """Stands in for openai.OpenAI: client.chat.completions.create(...)."""
+
+    def __init__(self, memories=None, fail_times=0, delay=0.0):
+        self.memories = memories or [{"type": "fact", "content": "Plays the cello", "importance": 6}]
+        self.fail_times = fail_times
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.calls <= self.fail_times:
+            raise RuntimeError("rate limited")
+        content = json.dumps({"memories": self.memories})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class UplinkCoalescerTests(SimpleTestCase):
+    def test_batches_small_frames_to_target_duration(self):
+        async def run():
+            sent = []
+
+            async def flush_cb(data):
+                sent.append(data)
+
+            # 20 ms at 24 kHz = 960 bytes; worklet frames are 256 bytes
+            c = UplinkCoalescer(flush_cb, frame_ms=20, max_latency_ms=1000)
+            for _ in range(8):
+                await c.push(b"\x01\x00" * 128)
+            c.close()
+            return sent, c
+
+        sent, c = asyncio.run(run())
+        self.assertEqual([len(s) for s in sent], [1024, 1024])
+        self.assertEqual(c.frames_in, 8)
+        self.assertEqual(c.frames_out, 2)
+
+    def test_timer_flushes_partial_frame(self):
+        async def run():
+            sent = []
+
+            async def flush_cb(data):
+                sent.append(data)
+
+            c = UplinkCoalescer(flush_cb, frame_ms=100, max_latency_ms=10)
+            await c.push(b"\x00\x00" * 128)
+            await asyncio.sleep(0.05)
+            return sent, c
+
+        sent, c = asyncio.run(run())
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(c.timer_flushes, 1)
+
+    def test_failed_timer_flush_is_logged_not_left_on_the_task(self):
+        async def run():
+            async def flush_cb(data):
+                raise UpstreamLost("Realtime connection is gone")
+
+            c = UplinkCoalescer(flush_cb, frame_ms=100, max_latency_ms=10)
+            await c.push(b"\x00\x00" * 128)
+            await asyncio.sleep(0.05)
+            return c
+
+        with self.assertLogs("agent.audio", "WARNING") as logs:
+            c = asyncio.run(run())
+        self.assertIn("Realtime connection is gone", logs.output[0])
+        self.assertTrue(c._timer_task.done())
+        self.assertIsNone(c._timer_task.exception())
+        self.assertEqual(c.stats()["timer_flush_errors"], 1)
+
+    def test_close_cancels_a_running_timer_flush(self):
+        async def run():
+            sent = []
+
+            async def flush_cb(data):
+                await asyncio.sleep(0.05)  # a slow upstream send
+                sent.append(data)
+
+            c = UplinkCoalescer(flush_cb, frame_ms=100, max_latency_ms=1)
+            await c.push(b"\x00\x00" * 128)
+            await asyncio.sleep(0.01)  # the timer fired, its send is in flight
+            task = c._timer_task
+            c.close()
+            await asyncio.sleep(0.1)
+            return sent, task
+
+        sent, task = asyncio.run(run())
+        self.assertEqual(sent, [])
+        self.assertTrue(task.cancelled())
+
+    def test_frames_pushed_during_a_send_stay_within_the_batch_size(self):
+        async def run():
+            sent = []
+
+            async def flush_cb(data):
+                await asyncio.sleep(0.01)
+                sent.append(len(data))
+
+            c = UplinkCoalescer(flush_cb, frame_ms=20, max_latency_ms=1000)  # 960 bytes
+            frames = [c.push(b"\x01\x00" * 240) for _ in range(12)]  # 480 bytes each
+            await asyncio.gather(*frames)
+            await c.flush()
+            return sent
+
+        self.assertEqual(asyncio.run(run()), [960] * 6)
+
+    def test_explicit_flush_sends_tail(self):
+        async def run():
+            sent = []
+
+            async def flush_cb(data):
+                sent.append(data)
+
+            c = UplinkCoalescer(flush_cb, frame_ms=100, max_latency_ms=1000)
+            await c.push(b"\x00\x00" * 10)
+            await c.flush()
+            await c.flush()  # nothing buffered -> no extra frame
+            return sent, c
+
+        sent, c = asyncio.run(run())
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(c.stats()["buffered_bytes"], 0)
+
+
+class StreamingResamplerTests(SimpleTestCase):
+    def test_chunked_output_matches_whole_stream(self):
+        pcm = sine_pcm(16000)
+        whole = StreamingResampler(16000, 24000).process(pcm)
+        r = StreamingResampler(16000, 24000)
+        # odd chunk size also exercises the split-sample carry
+        chunked = b"".join(r.process(pcm[i:i + 257]) for i in range(0, len(pcm), 257))
+        self.assertEqual(whole, chunked)
+        self.assertEqual(len(whole), 24000 * 2)
+
+    def test_preserves_pitch(self):
+        for src, dst in [(16000, 24000), (24000, 44100), (24000, 16000)]:
+            y = np.frombuffer(StreamingResampler(src, dst).process(sine_pcm(src)), "<i2")
+            spectrum = np.abs(np.fft.rfft(y.astype(np.float64)))
+            self.assertAlmostEqual(np.argmax(spectrum) * dst / len(y), 440.0, delta=2)
+
+    def test_same_rate_is_passthrough(self):
+        pcm = sine_pcm(24000, 0.1)
+        self.assertIs(StreamingResampler(24000, 24000).process(pcm), pcm)
+
+
+@unittest.skipUnless(OPUS_AVAILABLE, "opuslib / libopus not installed")
+class OpusCodecTests(SimpleTestCase):
+    def test_round_trip_in_20ms_packets(self):
+        codec = OpusSessionCodec(bitrate=24000)
+        pcm = sine_pcm(24000, 0.5)
+        packets = codec.encode(pcm[:5000]) + codec.encode(pcm[5000:])
+        tail, tail_bytes = codec.flush()
+        packets += tail
+        self.assertEqual(len(packets), 25)
+        self.assertEqual((tail, tail_bytes), ([], 0))  # 0.5 s is whole frames
+        decoded = b"".join(codec.decode(p) for p in packets)
+        self.assertEqual(len(decoded), len(pcm))
+        self.assertLess(sum(map(len, packets)), len(pcm) // 8)
+
+    def test_flush_reports_the_real_tail_not_the_padding(self):
+        codec = OpusSessionCodec()
+        whole = codec.encode(sine_pcm(24000, 0.5)[:5000])
+        tail, tail_bytes = codec.flush()
+        self.assertEqual((len(whole), len(tail)), (5000 // codec.frame_bytes, 1))
+        self.assertEqual(tail_bytes, 5000 % codec.frame_bytes)
+        self.assertEqual(codec.flush(), ([], 0))
+
+    def test_corrupt_packet_is_dropped(self):
+        self.assertEqual(OpusSessionCodec().decode(b"\xff" * 3), b"")
+
+    def test_pool_reuses_codecs(self):
+        pool = OpusCodecPool(max_size=1)
+        first = pool.acquire(16000)
+        pool.release(first)
+        second = pool.acquire(32000)
+        self.assertIs(first, second)
+        self.assertEqual(second.bitrate, 32000)
+        self.assertEqual((pool.created, pool.reused), (1, 1))
+
+
+class EventWriteBufferTests(SimpleTestCase):
+    def run_buffer(self, scenario, **kwargs):
+        written = []
+
+        async def write(session, batch):
+            await asyncio.sleep(0)
+            written.append(list(batch))
+
+        async def run():
+            buf = EventWriteBuffer(object(), write=write, **kwargs)
+            await scenario(buf)
+            await buf.drain()
+            return buf
+
+        buf = asyncio.run(run())
+        return written, buf
+
+    def test_deltas_are_joined_into_turns(self):
+        async def scenario(buf):
+            for word in ("Hello", " there", "!"):
+                buf.add_delta("assistant", word)
+            buf.end_turn()
+            buf.add("user", "hi")
+            buf.add_delta("assistant", "Bye")
+
+        written, buf = self.run_buffer(scenario, max_events=100, interval_ms=10_000)
+        self.assertEqual(
+            written,
+            [[("assistant", "Hello there!"), ("user", "hi"), ("assistant", "Bye")]],
+        )
+        self.assertEqual(buf.stats()["queue_depth"], 0)
+        self.assertEqual(buf.events_written, 3)
+
+    def test_queue_depth_is_exported_while_it_builds(self):
+        queued = metrics.DB_EVENTS_QUEUED._only()
+        before = queued.value
+        seen = []
+
+        async def scenario(buf):
+            for i in range(3):
+                buf.add("user", f"turn {i}")
+            seen.append(queued.value)
+
+        self.run_buffer(scenario, max_events=100, interval_ms=10_000)
+        self.assertEqual(seen, [before + 3])
+        self.assertEqual(queued.value, before)
+        self.assertGreaterEqual(metrics.DB_EVENTS_QUEUED_MAX._only().value, before + 3)
+
+    def test_size_threshold_flushes_in_background(self):
+        async def scenario(buf):
+            for i in range(5):
+                buf.add("user", f"turn {i}")
+            self.assertEqual(buf.queue_depth, 5)
+            await asyncio.sleep(0.01)
+            self.assertEqual(buf.queue_depth, 0)
+
+        written, buf = self.run_buffer(scenario, max_events=2, interval_ms=10_000)
+        self.assertEqual(sum(len(b) for b in written), 5)
+        self.assertEqual(buf.max_queue_depth, 5)
+
+    def test_interval_flushes_partial_batch(self):
+        async def scenario(buf):
+            buf.add("user", "only one")
+            await asyncio.sleep(0.05)
+            self.assertEqual(buf.flushes, 1)
+
+        written, _ = self.run_buffer(scenario, max_events=100, interval_ms=10)
+        self.assertEqual(written, [[("user", "only one")]])
+
+    def test_long_turn_is_split(self):
+        async def scenario(buf):
+            for _ in range(10):
+                buf.add_delta("assistant", "x" * 10)
+
+        written, _ = self.run_buffer(scenario, max_turn_chars=50)
+        self.assertEqual([len(c) for _, c in written[0]], [50, 50])
+
+    def run_failing(self, failures, **kwargs):
+        written = []
+
+        async def write(session, batch):
+            if len(written) < failures:
+                written.append(None)
+                raise OperationalError("database is locked")
+            written.append(list(batch))
+
+        async def run():
+            buf = EventWriteBuffer(object(), write=write, max_events=1, retry_ms=1, **kwargs)
+            buf.add("user", "first")
+            await asyncio.sleep(0)
+            buf.add("assistant", "second")
+            await buf.drain()
+            return buf
+
+        buf = asyncio.run(run())
+        return [batch for batch in written if batch is not None], buf
+
+    def test_failed_write_is_retried_in_order(self):
+        queued = metrics.DB_EVENTS_QUEUED._only()
+        before = queued.value
+        written, buf = self.run_failing(2, max_attempts=3)
+        self.assertEqual(written, [[("user", "first"), ("assistant", "second")]])
+        self.assertEqual((buf.failed_flushes, buf.events_written, buf.dropped_events), (2, 2, 0))
+        self.assertEqual(queued.value, before)
+
+    def test_events_are_dropped_and_counted_after_the_last_attempt(self):
+        dropped = metrics.DB_EVENTS_DROPPED._only().value
+        with self.assertLogs("agent.event_buffer", "ERROR"):
+            written, buf = self.run_failing(2, max_attempts=2)
+        self.assertEqual(written, [])
+        self.assertEqual((buf.failed_flushes, buf.dropped_events, buf.queue_depth), (2, 2, 0))
+        self.assertEqual(metrics.DB_EVENTS_DROPPED._only().value, dropped + 2)
+
+
+class EventPersistenceTests(TestCase):
+    def test_bulk_written_events_build_transcript(self):
+        session = create_conversation_session(get_or_create_user("user-1"))
+        add_events(session, [("user", "hi"), ("assistant", "Hello there!")])
+        self.assertEqual(build_transcript(session), "USER: hi\nASSISTANT: Hello there!")
+
+    def test_events_are_numbered_per_session(self):
+        session = create_conversation_session(get_or_create_user("user-1"))
+        other = create_conversation_session(get_or_create_user("user-1"))
+        add_events(session, [("user", "one"), ("assistant", "two")])
+        add_events(other, [("user", "elsewhere")])
+        add_events(session, [("user", "three")])
+        self.assertEqual(list(session.events.order_by("seq").values_list("seq", flat=True)), [1, 2, 3])
+        # timestamp ties no longer matter
+        session.events.update(created_at=session.started_at)
+        self.assertEqual(build_transcript(session), "USER: one\nASSISTANT: two\nUSER: three")
+
+    async def test_async_event_writes(self):
+        user = await UserProfile.objects.acreate(id="user-async")
+        session = await ConversationSession.objects.acreate(user=user)
+        await aadd_event(session, "user", "hi")
+        await aadd_events(session, [("assistant", "Hello "), ("assistant", "there!")])
+        self.assertEqual([e.seq async for e in session.events.order_by("seq")], [1, 2, 3])
+
+    def test_bootstrap_session_creates_user_and_session(self):
+        session, cached = bootstrap_session("new-user")
+        self.assertEqual((cached.memories, cached.count), ([], 0))
+        self.assertTrue(UserProfile.objects.filter(id="new-user").exists())
+        self.assertEqual(session.user_id, "new-user")
+
+    def test_bootstrap_session_returns_memories(self):
+        user = get_or_create_user("user-2")
+        UserMemory.objects.create(user=user, type="fact", content="Lives in Lyon", importance=3)
+        UserMemory.objects.create(user=user, type="preference", content="Likes jazz", importance=8)
+        session, cached = bootstrap_session("user-2")
+        self.assertEqual(cached.memories, ["Likes jazz", "Lives in Lyon"])
+        self.assertEqual(ConversationSession.objects.filter(user=user).count(), 1)
+
+    def test_bootstrap_session_reads_top_memories_without_the_vector_index(self):
+        user = get_or_create_user("user-4")
+        UserMemory.objects.bulk_create(
+            UserMemory(user=user, type="fact", content=f"Fact {i}", importance=10 if i == 3 else 1)
+            for i in range(MEMORY_PROMPT_K + 5)
+        )
+        builds = memory_indexes.builds
+        with patch("agent.memory.memory_cache", MemoryBlockCache(url="")):
+            _session, cached = bootstrap_session("user-4")
+        self.assertEqual(cached.count, MEMORY_PROMPT_K + 5)
+        self.assertEqual(len(cached.memories), MEMORY_PROMPT_K)
+        self.assertEqual(cached.memories[0], "Fact 3")
+        # no index build, so no embedding backfill on the connect path
+        self.assertEqual(memory_indexes.builds, builds)
+        self.assertFalse(UserMemory.objects.filter(user=user).exclude(embedding=None).exists())
+
+    def test_bootstrap_session_on_cache_hit_skips_the_memory_read(self):
+        with patch("agent.memory.memory_cache", MemoryBlockCache(url="")):
+            bootstrap_session("user-3")
+            # the user lookup and the session INSERT
+            with self.assertNumQueries(2):
+                session, cached = bootstrap_session("user-3")
+        self.assertEqual(cached.count, 0)
+
+    def test_bootstrap_session_on_cache_hit_for_an_unknown_user(self):
+        # e.g. Redis kept the entry across a DB reset
+        cache = MemoryBlockCache(url="")
+        cache.set("user-5", CachedMemories(["Likes jazz"], 1), cache.get("user-5")[1])
+        with patch("agent.memory.memory_cache", cache):
+            session, cached = bootstrap_session("user-5")
+        self.assertEqual(cached.memories, ["Likes jazz"])
+        self.assertTrue(UserProfile.objects.filter(id="user-5").exists())
+        self.assertEqual(session.user_id, "user-5")
+
+
+class ConcurrentEventWriteTests(TransactionTestCase):
+    async def test_overlapping_writes_for_a_session_both_land(self):
+        session = await ConversationSession.objects.acreate(user=await UserProfile.objects.acreate(id="user-8"))
+        # both read MAX(seq) before either inserts; the loser re-reads
+        await asyncio.gather(
+            aadd_events(session, [("user", "one"), ("assistant", "two")]),
+            aadd_events(session, [("user", "three")]),
+        )
+        seqs = [e.seq async for e in session.events.order_by("seq")]
+        self.assertEqual(seqs, [1, 2, 3])
+
+    async def test_seq_conflicts_give_up_after_the_retries(self):
+        session = await ConversationSession.objects.acreate(user=await UserProfile.objects.acreate(id="user-9"))
+        await aadd_events(session, [("user", "one")])
+        stale = {"last": 0}  # every re-read still misses the existing row
+        with patch.object(type(session.events), "aaggregate", AsyncMock(return_value=stale)) as agg:
+            with self.assertRaises(IntegrityError):
+                await aadd_events(session, [("user", "two")])
+        self.assertEqual(agg.await_count, EVENT_SEQ_RETRIES + 1)
+
+
+class TranscriptTests(TestCase):
+    def test_fragments_merge_into_turns(self):
+        session = create_conversation_session(get_or_create_user("user-1"))
+        add_events(
+            session,
+            [("user", "I like"), ("user", " jazz."), ("assistant", "Nice."), ("assistant", "What else?"), ("user", "Cello")],
+        )
+        self.assertEqual(
+            build_transcript(session), "USER: I like jazz.\nASSISTANT: Nice. What else?\nUSER: Cello"
+        )
+
+    def test_long_session_is_summarized_in_bounded_pieces(self):
+        session = create_conversation_session(get_or_create_user("user-1"))
+        add_events(session, [("user" if n % 2 else "assistant", f"turn {n} " * 50) for n in range(200)])
+        chunks = list(iter_transcript_chunks(session, max_tokens=500))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(c) <= 500 * 4 for c in chunks))
+
+        client = FakeLLMClient()
+        condensed = condense_transcript(session, client, max_tokens=500)
+        self.assertLessEqual(len(condensed), 500 * 4)
+        self.assertIn("NOTES", condensed)
+        # one summary per piece (map), then rounds over the notes (reduce)
+        self.assertGreater(client.calls, len(chunks))
+        # short sessions go to extraction verbatim, without extra calls
+        calls = client.calls
+        short = create_conversation_session(get_or_create_user("user-2"))
+        add_events(short, [("user", "hi")])
+        self.assertEqual(condense_transcript(short, client), "USER: hi")
+        self.assertEqual(client.calls, calls)
+
+    def test_100k_event_session_streams_in_bounded_memory(self):
+        session = create_conversation_session(get_or_create_user("user-1"))
+        fragment = "word " * 20  # per-delta events, ~100 chars each
+        ConversationEvent.objects.bulk_create(
+            (
+                ConversationEvent(session=session, role="assistant" if (n // 50) % 2 else "user", content=fragment, seq=n)
+                for n in range(1, 100_001)
+            ),
+            batch_size=5000,
+        )
+        total_chars = 100_000 * len(fragment)
+
+        tracemalloc.start()
+        try:
+            chunks = sum(1 for _ in iter_transcript_chunks(session, max_tokens=2000))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(chunks, total_chars // (2000 * 4))
+        # a few fetch batches and one piece, not the ~10 MB transcript
+        self.assertLess(peak, total_chars // 4)
+
+
+class MemoryConsolidationTests(TestCase):
+    def test_near_duplicates_bump_instead_of_insert(self):
+        consolidate_memories("u1", [{"type": "preference", "content": "Prefers short answers", "importance": 5}])
+        stats = consolidate_memories(
+            "u1",
+            [
+                {"type": "preference", "content": "User prefers short answers.", "importance": 4},
+                {"type": "preference", "content": "prefers concise, short answers", "importance": 6},
+                {"type": "fact", "content": "Prefers short answers", "importance": 5},
+                {"type": "preference", "content": "Prefers long walks", "importance": 5},
+            ],
+        )
+        self.assertEqual(stats["merged"], 2)
+        self.assertEqual(stats["inserted"], 2)  # other type, other meaning
+        short = UserMemory.objects.get(user_id="u1", type="preference", content__icontains="short answers")
+        self.assertEqual(short.importance, 7)  # 5 -> max(5, 4) + 1 -> max(6, 6) + 1
+        self.assertEqual(short.content, "prefers concise, short answers")  # the newest wording
+        self.assertEqual(UserMemory.objects.filter(user_id="u1").count(), 3)
+
+    def test_updated_fact_replaces_the_old_one(self):
+        consolidate_memories("u5", [{"type": "fact", "content": "User is 34 years old", "importance": 5}])
+        old = UserMemory.objects.get(user_id="u5")
+        stats = consolidate_memories("u5", [{"type": "fact", "content": "User is 35 years old", "importance": 5}])
+        self.assertEqual(stats["merged"], 1)
+        row = UserMemory.objects.get(user_id="u5")
+        self.assertEqual((row.pk, row.content), (old.pk, "User is 35 years old"))
+        self.assertNotEqual(row.embedding, old.embedding)
+        # and a later restatement in the same batch wins over an earlier one
+        consolidate_memories("u5", [
+            {"type": "fact", "content": "User is 36 years old", "importance": 5},
+            {"type": "fact", "content": "User is 37 years old", "importance": 5},
+        ])
+        self.assertEqual(UserMemory.objects.get(user_id="u5").content, "User is 37 years old")
+
+    def test_existing_duplicates_are_folded(self):
+        user = get_or_create_user("u2")
+        for _ in range(4):
+            UserMemory.objects.create(user=user, type="fact", content="Has a dog named Rex", importance=3)
+        UserMemory.objects.create(user=user, type="fact", content="Has a cat named Rex", importance=3)
+        # the new-memory path leaves them alone; the management command folds them
+        self.assertEqual(consolidate_memories("u2", [])["merged"], 0)
+        self.assertEqual(UserMemory.objects.filter(user=user).count(), 5)
+        stats = deduplicate_memories("u2")
+        self.assertEqual(stats["deduplicated"], 3)
+        self.assertEqual(UserMemory.objects.filter(user=user).count(), 2)
+
+    def test_matched_row_gone_before_the_write_is_inserted_again(self):
+        consolidate_memories("u4", [{"type": "fact", "content": "Has a dog named Rex", "importance": 5}])
+        plan = plan_consolidation("u4", [{"type": "fact", "content": "User has a dog named Rex", "importance": 6}])
+        # folded away by a concurrent `manage.py consolidate_memories`
+        UserMemory.objects.filter(user_id="u4").delete()
+        with transaction.atomic():
+            stats = apply_consolidation(plan)
+        self.assertEqual(stats["merged"], 1)
+        row = UserMemory.objects.get(user_id="u4")
+        self.assertEqual((row.content, row.importance), ("User has a dog named Rex", 6))
+        self.assertIsNotNone(row.embedding)
+
+    def test_old_history_summaries_are_rolled_up(self):
+        topics = ["jazz", "taxes", "a trip to Kyoto", "gardening", "chess openings", "a job offer",
+                  "marathon training", "sourdough", "moving flats", "a birthday", "guitar", "insurance"]
+        summaries = [
+            {"type": "history_summary", "content": f"Session {i}: {topic}."}
+            for i, topic in enumerate(topics)
+        ]
+        with patch("agent.consolidation.HISTORY_SUMMARIES_KEPT", 5):
+            for summary in summaries:
+                consolidate_memories("u3", [summary])
+        rows = list(
+            UserMemory.objects.filter(user_id="u3", type="history_summary").order_by("created_at", "id")
+        )
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(rows[0].content.startswith("Session 0:"))
+        self.assertIn("Session 6:", rows[0].content)
+        self.assertEqual(rows[-1].content, summaries[-1]["content"])
+
+    def test_summary_merged_in_the_same_pass_is_rolled_up_as_merged(self):
+        with patch("agent.consolidation.HISTORY_SUMMARIES_KEPT", 1):
+            for content in ("Session zero: jazz and blues records", "Talked about taxes"):
+                consolidate_memories("u6", [{"type": "history_summary", "content": content, "importance": 3}])
+            consolidate_memories(
+                "u6",
+                [
+                    {"type": "history_summary", "content": "Session zero: jazz and blues recordings", "importance": 8},
+                    {"type": "history_summary", "content": "Planned a trip to Kyoto", "importance": 3},
+                ],
+            )
+        rows = list(UserMemory.objects.filter(user_id="u6").order_by("created_at", "id"))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].content, "Session zero: jazz and blues recordings Talked about taxes")
+        self.assertEqual(rows[0].importance, 9)  # max(3, 8) + 1, from the merge
+        self.assertEqual(rows[1].content, "Planned a trip to Kyoto")
+
+
+class MemoryRetrievalTests(TestCase):
+    FACTS = [
+        "Has a dog named Rex who is afraid of thunder",
+        "Is training for the Berlin marathon in September",
+        "Allergic to peanuts and shellfish",
+        "Plays jazz guitar in a weekend band",
+        "Works night shifts as a nurse",
+        "Is learning Japanese for a trip to Kyoto",
+    ]
+
+    def setUp(self):
+        consolidate_memories(
+            "u1", [{"type": "fact", "content": c, "importance": 5} for c in self.FACTS]
+        )
+
+    def test_hashing_embedder_is_normalized_and_stable(self):
+        vectors = HashingEmbedder(dim=64).embed(["Likes jazz", "likes JAZZ!", ""])
+        self.assertAlmostEqual(float(np.linalg.norm(vectors[0])), 1.0, places=5)
+        np.testing.assert_allclose(vectors[0], vectors[1])
+        self.assertFalse(vectors[2].any())
+
+    def test_search_ranks_relevant_memories_first(self):
+        index = MemoryIndexStore().get("u1")
+        self.assertEqual(index.search("my marathon training plan", 1), [self.FACTS[1]])
+        self.assertEqual(index.search("what should I pack for Kyoto", 1), [self.FACTS[5]])
+        self.assertEqual(index.search("ordering food, any peanuts?", 1), [self.FACTS[2]])
+
+    def test_store_reuses_index_until_memories_change(self):
+        store = MemoryIndexStore()
+        first = store.get("u1")
+        self.assertIs(store.get("u1"), first)
+        consolidate_memories("u1", [{"type": "fact", "content": "Drinks oat milk"}])
+        second = store.get("u1")
+        self.assertIsNot(second, first)
+        self.assertEqual(len(second), len(self.FACTS) + 1)
+        self.assertEqual((store.builds, store.reuses), (2, 1))
+
+    def test_rows_without_embedding_are_backfilled(self):
+        UserMemory.objects.filter(user_id="u1").update(embedding=None)
+        index = MemoryIndexStore().get("u1")
+        self.assertEqual(index.matrix.shape, (len(self.FACTS), HashingEmbedder().dim))
+        self.assertFalse(UserMemory.objects.filter(user_id="u1", embedding=None).exists())
+
+
+class FakeRedis:
+    """The few sync redis-py calls MemoryBlockCache makes, over a dict."""
+
+    def __init__(self):
+        self.data = {}
+        self._ops = []
+
+    def mget(self, *keys):
+        return [self.data.get(k) for k in keys]
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+
+    def pipeline(self):
+        self._ops = []
+        return self
+
+    def incr(self, key):
+        self._ops.append(lambda: self.data.__setitem__(key, str(int(self.data.get(key, 0)) + 1).encode()))
+
+    def delete(self, key):
+        self._ops.append(lambda: self.data.pop(key, None))
+
+    def execute(self):
+        for op in self._ops:
+            op()
+
+
+class MemoryBlockCacheTests(SimpleTestCase):
+    def make_cache(self, shared=None):
+        cache = MemoryBlockCache(url="redis://fake")
+        cache._redis = shared or FakeRedis()
+        return cache
+
+    def test_local_then_shared_hits(self):
+        shared = FakeRedis()
+        a, b = self.make_cache(shared), self.make_cache(shared)
+        entry, version = a.get("u1")
+        self.assertIsNone(entry)
+        a.set("u1", CachedMemories(["Likes jazz"], 1), version)
+
+        self.assertEqual(a.get("u1")[0].memories, ["Likes jazz"])
+        self.assertEqual(b.get("u1")[0].block, "- Likes jazz")
+        self.assertEqual(b.get("u1")[0].count, 1)
+        self.assertEqual((a.local_hits, a.misses), (1, 1))
+        self.assertEqual((b.redis_hits, b.local_hits), (1, 1))
+
+    def test_invalidate_from_another_process(self):
+        shared = FakeRedis()
+        server, worker = self.make_cache(shared), self.make_cache(shared)
+        _, version = server.get("u1")
+        server.set("u1", CachedMemories(["old"], 1), version)
+        worker.invalidate("u1")
+        entry, version = server.get("u1")
+        self.assertIsNone(entry)
+        self.assertEqual(version, 1)
+
+    def test_set_with_stale_version_is_never_served(self):
+        cache = self.make_cache()
+        _, version = cache.get("u1")  # read...
+        cache.invalidate("u1")  # ...a write lands...
+        cache.set("u1", CachedMemories(["old"], 1), version)  # ...old rows cached
+        self.assertIsNone(cache.get("u1")[0])
+
+    def test_invalidation_missed_while_redis_was_down_is_sent_later(self):
+        shared = FakeRedis()
+        server, worker = self.make_cache(shared), self.make_cache(shared)
+        _, version = server.get("u1")
+        server.set("u1", CachedMemories(["old"], 1), version)
+        shared.pipeline = MagicMock(side_effect=redis.ConnectionError("down"))
+        worker.invalidate("u1")
+        self.assertEqual(worker.stats()["unsent_invalidations"], 1)
+        # Redis is back; the worker's next use sends the bump
+        del shared.pipeline
+        worker._redis_down_until = 0.0
+        worker.flush_invalidations()
+        self.assertEqual(worker.stats()["unsent_invalidations"], 0)
+        self.assertIsNone(server.get("u1")[0])
+
+    def test_without_redis_local_entries_expire(self):
+        cache = MemoryBlockCache(url="", local_ttl=0.05)
+        cache.set("u1", CachedMemories(["x"], 1), None)
+        self.assertIsNotNone(cache.get("u1")[0])
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("u1")[0])
+
+
+class SqliteProfileTests(SimpleTestCase):
+    def test_new_connections_get_wal_and_busy_timeout(self):
+        import os
+        import tempfile
+        from django.db import connection
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, "NAME": os.path.join(tmp, "profile.sqlite3")}, alias="profile"
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    pragmas = {
+                        name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                        for name in ("journal_mode", "synchronous", "busy_timeout")
+                    }
+            finally:
+                wrapper.close()
+        # synchronous: 1 == NORMAL
+        self.assertEqual(pragmas, {"journal_mode": "wal", "synchronous": 1, "busy_timeout": 5000})
+
+
+class LoggingTests(SimpleTestCase):
+    def test_frames_are_summarized_not_logged_one_by_one(self):
+        logger = logging.getLogger("agent.tests.frames")
+        with self.assertLogs(logger, "DEBUG") as logs:
+            frames = FrameLog(logger, "audio in", interval=3600, sample_every=100)
+            for _ in range(250):
+                frames.add(640)
+            frames.close()
+        self.assertEqual(len(logs.records), 3)  # 2 samples + the summary
+        self.assertIn("audio in: 250 in", logs.output[-1])
+        self.assertIn("160000 bytes", logs.output[-1])
+
+    def test_records_carry_session_context(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        handler.addFilter(SessionContextFilter())
+        logger = logging.getLogger("agent.tests.context")
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        async def session(user_id, session_id):
+            new_session_context(user_id=user_id)
+
+            async def child():
+                await asyncio.sleep(0.01)
+                logger.warning("from a task started before the session row")
+
+            task = asyncio.create_task(child())
+            bind_session(session_id=session_id)
+            await task
+
+        async def run():
+            await asyncio.gather(session("u1", 1), session("u2", 2))
+
+        asyncio.run(run())
+        self.assertEqual(sorted((r.user_id, r.session_id) for r in records), [("u1", 1), ("u2", 2)])
+
+    def test_queue_handler_drops_instead_of_blocking(self):
+        release = threading.Event()
+
+        class SlowHandler(logging.Handler):
+            def emit(self, record):
+                release.wait(5)
+
+        handler = QueueLogHandler(SlowHandler(), maxsize=2)
+        self.addCleanup(handler.close)
+        self.addCleanup(release.set)
+        record = logging.LogRecord("agent", logging.INFO, __file__, 1, "hi", None, None)
+        start = time.perf_counter()
+        for _ in range(10):
+            handler.handle(record)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertGreaterEqual(handler.dropped, 7)
+
+
+class OutboundQueueTests(SimpleTestCase):
+    def run_queue(self, scenario, **kwargs):
+        sent = []
+        gate = asyncio.Event()  # the "client" reads nothing until set
+
+        async def send_json(msg):
+            await gate.wait()
+            sent.append(msg)
+
+        async def send_bytes(data):
+            await gate.wait()
+            sent.append(data)
+
+        async def run():
+            q = OutboundQueue(send_json, send_bytes, **kwargs)
+            await scenario(q)
+            gate.set()
+            for _ in range(20):
+                await asyncio.sleep(0)
+            await q.close()
+            return q
+
+        q = asyncio.run(run())
+        return sent, q
+
+    def test_drop_oldest_audio_keeps_newest(self):
+        async def scenario(q):
+            for i in range(6):
+                q.put_bytes(bytes([i]))
+
+        sent, q = self.run_queue(scenario, max_items=3, policy="drop_oldest_audio")
+        self.assertEqual(sent, [b"\x03", b"\x04", b"\x05"])
+        self.assertEqual(q.dropped_audio, 3)
+        self.assertEqual(q.high_water, 3)
+
+    def test_coalesce_text_merges_deltas_when_full(self):
+        async def scenario(q):
+            q.put_json({"type": "ready"})
+            await asyncio.sleep(0)
+            for word in ("a", "b", "c", "d"):
+                q.put_json({"type": "ai_text_delta", "text": word, "is_final": False})
+            q.put_json({"type": "ai_text_delta", "text": "", "is_final": True})
+
+        sent, q = self.run_queue(scenario, max_items=2, policy="coalesce_text")
+        texts = [m["text"] for m in sent if m.get("type") == "ai_text_delta"]
+        self.assertEqual("".join(texts), "abcd")
+        self.assertTrue(sent[-1]["is_final"])
+        # c and d into b; then a and bcd, to make room for the final marker
+        self.assertEqual(q.coalesced_text, 3)
+        self.assertLessEqual(q.high_water, 2)
+
+    def test_disconnect_policy_calls_on_overflow(self):
+        closed = []
+
+        async def on_overflow():
+            closed.append(True)
+
+        async def scenario(q):
+            await asyncio.sleep(0)
+            for i in range(4):
+                q.put_bytes(bytes([i]))
+            await asyncio.sleep(0)
+
+        _, q = self.run_queue(scenario, max_items=2, policy="disconnect", on_overflow=on_overflow)
+        self.assertEqual(closed, [True])
+        self.assertEqual(q.overflows, 1)
+
+    def test_barge_in_drops_are_counted(self):
+        barge_in = metrics.OUTBOUND_DROPPED_AUDIO.labels("barge_in")
+        before = barge_in.value
+
+        async def scenario(q):
+            await asyncio.sleep(0)
+            for i in range(3):
+                q.put_bytes(bytes([i]) * 4)
+            q.put_json({"type": "ai_speaking", "value": False})
+            self.assertEqual(q.drop_audio(), 3)
+
+        sent, q = self.run_queue(scenario, max_items=10)
+        self.assertEqual(sent, [{"type": "ai_speaking", "value": False}])
+        self.assertEqual((q.dropped_audio, q.dropped_audio_bytes), (3, 12))
+        self.assertEqual(barge_in.value, before + 3)
+
+    def test_queue_full_of_control_messages_gives_up_on_the_client(self):
+        closed = []
+
+        async def on_overflow():
+            closed.append(True)
+
+        async def scenario(q):
+            await asyncio.sleep(0)
+            for _ in range(4):
+                q.put_json({"type": "upstream", "state": "reconnecting"})
+            self.assertLessEqual(len(q), 2)
+            await asyncio.sleep(0)
+
+        _, q = self.run_queue(scenario, max_items=2, policy="drop_oldest_audio", on_overflow=on_overflow)
+        self.assertEqual(closed, [True])
+        self.assertEqual(q.overflows, 1)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class BargeInTests(TransactionTestCase):
+    def test_barge_in_stops_audio_and_truncates(self):
+        chunk = b"\x01\x00" * 2400  # 100 ms @ 24 kHz
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=u1")
+                connected, _ = await comm.connect()
+                self.assertTrue(connected)
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+
+                async def upstream():
+                    # upstream keeps streaming until it processes the cancel
+                    for _ in range(40):
+                        fake.push(audio_delta("resp_1", "item_1", chunk))
+                        await asyncio.sleep(0.01)
+
+                producer = asyncio.create_task(upstream())
+                frames = 0
+                while frames < 5:
+                    out = await comm.receive_output(timeout=5)
+                    frames += out.get("bytes") is not None
+
+                barge_at = time.perf_counter()
+                await comm.send_json_to({"type": "barge_in"})
+                last_audio_at = barge_at
+                # receive_output() cancels the app on timeout, so poll instead
+                while not await comm.receive_nothing(timeout=0.3):
+                    out = await comm.receive_output()
+                    if out.get("bytes") is not None:
+                        frames += 1
+                        last_audio_at = time.perf_counter()
+
+                await producer
+                await comm.disconnect()
+                return fake, frames, last_audio_at - barge_at
+
+        fake, frames, latency = asyncio.run(run())
+        self.assertLess(latency, 0.1)
+        self.assertLess(frames, 40)
+        self.assertEqual(len(fake.sent_of_type("response.cancel")), 1)
+        truncate = fake.sent_of_type("conversation.item.truncate")[0]
+        self.assertEqual(truncate["item_id"], "item_1")
+        self.assertEqual(truncate["audio_end_ms"], frames * 100)
+
+    def test_frames_of_the_previous_item_do_not_count_toward_the_next(self):
+        chunk = b"\x01\x00" * 2400  # 100 ms @ 24 kHz
+        sent = []
+
+        async def send_bytes(data):
+            sent.append(data)
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            bridge = RealtimeBridge("hi", on_text=AsyncMock(), on_audio_chunk=AsyncMock())
+            bridge.ws = fake
+            bridge._connected.set()
+            q = OutboundQueue(AsyncMock(), send_bytes, on_audio_sent=bridge.mark_played)
+            # item_1's frames are still queued when item_2 starts streaming
+            await bridge._on_audio_delta("item_1", chunk)
+            q.put_bytes(chunk, len(chunk), "item_1")
+            q.put_bytes(chunk, len(chunk), "item_1")
+            await bridge._on_audio_delta("item_2", chunk)
+            q.put_bytes(chunk, len(chunk), "item_2")
+            for _ in range(10):
+                await asyncio.sleep(0)
+            await q.close()
+            return fake, await bridge.cancel_response()
+
+        fake, audio_end_ms = asyncio.run(run())
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(audio_end_ms, 100)
+        truncate = fake.sent_of_type("conversation.item.truncate")[0]
+        self.assertEqual((truncate["item_id"], truncate["audio_end_ms"]), ("item_2", 100))
+
+
+class FakeAsyncRedis:
+    """The redis.asyncio calls SessionDirectory makes, over dicts."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.zsets = {}
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update({k.encode(): str(v).encode() for k, v in mapping.items()})
+
+    async def expire(self, key, ttl):
+        pass
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def delete(self, key):
+        self.hashes.pop(key, None)
+
+    async def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        for member in [m for m, score in zset.items() if score <= high]:
+            del zset[member]
+
+    async def zrange(self, key, start, end):
+        return [m.encode() for m in self.zsets.get(key, {})]
+
+    async def scan_iter(self, match):
+        for key in list(self.hashes):
+            if key.startswith(match.rstrip("*")):
+                yield key.encode()
+
+
+class _FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.calls.append(method(*args, **kwargs))
+
+    async def execute(self):
+        return [await call for call in self.calls]
+
+
+class SessionDirectoryTests(SimpleTestCase):
+    def test_heartbeat_publishes_and_removes_sessions(self):
+        directory = SessionDirectory(url="redis://fake", ttl=60, worker_id="host-w0")
+        shared = FakeAsyncRedis()
+        directory._conn = lambda: shared
+
+        async def run():
+            directory.add(7, "chan.7", "u7")
+            directory.add(8, "chan.8", "u8")
+            await asyncio.sleep(0.01)
+            listed = await directory.sessions()
+            directory.remove(7)
+            await asyncio.sleep(0.01)
+            return listed, await directory.sessions(), await directory.lookup(8), await directory.workers()
+
+        listed, after, entry, workers = asyncio.run(run())
+        self.assertEqual(set(listed), {"7", "8"})
+        self.assertEqual(set(after), {"8"})
+        self.assertEqual(entry["channel"], "chan.8")
+        self.assertEqual(entry["worker"], "host-w0")
+        self.assertEqual(workers["host-w0"]["sessions"], "1")
+
+    def test_disabled_directory_is_local_only(self):
+        directory = SessionDirectory(url="")
+
+        async def run():
+            directory.add(1, "chan.1", "u1")
+            return await directory.sessions()
+
+        self.assertEqual(list(asyncio.run(run())), ["1"])
+        self.assertIsNone(directory._task)
+
+
+async def live_session(user_id):
+    # the consumer is in its groups once the directory lists it
+    for _ in range(200):
+        for session_id, entry in session_directory._local.items():
+            if entry["user_id"] == user_id:
+                return session_id
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"no live session for {user_id}")
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class SessionControlTests(TransactionTestCase):
+    async def connect(self, fake, user_id):
+        comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), f"/ws/voice/?user_id={user_id}")
+        await comm.connect()
+        self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+        return comm, await live_session(user_id)
+
+    def test_inject_then_end(self):
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm, session_id = await self.connect(fake, "c1")
+                await inject_instruction(session_id, "Wrap up politely.", respond=True)
+                await end_session(session_id, "operator")
+                closed = await comm.receive_output(timeout=5)
+                # what the server does once the socket is closed
+                await comm.send_input({"type": "websocket.disconnect", "code": closed["code"]})
+                await comm.wait()
+                return fake, closed, session_id
+
+        fake, closed, session_id = asyncio.run(run())
+        item = fake.sent_of_type("conversation.item.create")[0]["item"]
+        self.assertEqual(item["role"], "system")
+        self.assertEqual(item["content"][0]["text"], "Wrap up politely.")
+        self.assertEqual(len(fake.sent_of_type("response.create")), 1)
+        self.assertEqual(closed["type"], "websocket.close")
+        self.assertEqual(closed["code"], CLOSE_ENDED)
+        self.assertNotIn(session_id, session_directory._local)
+
+    def test_inject_into_a_lost_upstream_is_dropped(self):
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)), patch.object(
+                RealtimeBridge, "inject_instruction", AsyncMock(side_effect=UpstreamLost("gone"))
+            ):
+                comm, session_id = await self.connect(fake, "c8")
+                await inject_instruction(session_id, "Wrap up politely.")
+                # the consumer is still there to take the next control message
+                await end_session(session_id, "operator")
+                closed = await comm.receive_output(timeout=5)
+                await comm.send_input({"type": "websocket.disconnect", "code": closed["code"]})
+                await comm.wait()
+                return closed
+
+        with self.assertLogs("agent.consumers", "WARNING") as logs:
+            closed = asyncio.run(run())
+        self.assertEqual(closed["code"], CLOSE_ENDED)
+        self.assertTrue(any("Injecting instruction failed" in line for line in logs.output))
+
+    def test_failed_group_discard_still_releases_the_session(self):
+        controller = AdmissionController(max_sessions=1, max_per_user=1, queue_timeout=0.05)
+        drain = WorkerDrain(signal_name="")
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.consumers.admission", controller), patch("agent.consumers.worker_drain", drain), patch(
+                "agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)
+            ), patch(
+                "channels.layers.InMemoryChannelLayer.group_discard", AsyncMock(side_effect=OSError("layer down"))
+            ):
+                comm, _ = await self.connect(fake, "c9")
+                live = (controller.stats()["active"], len(drain.sessions))
+                await comm.disconnect()
+                return live
+
+        with self.assertLogs("agent.consumers", "WARNING") as logs:
+            live = asyncio.run(run())
+        self.assertEqual(live, (1, 1))
+        self.assertTrue(any("Leaving control groups failed" in line for line in logs.output))
+        self.assertEqual(controller.stats()["active"], 0)
+        self.assertEqual(controller.per_user, {})
+        self.assertFalse(drain.sessions)
+
+    def test_drain_waits_for_the_reply_in_progress(self):
+        chunk = b"\x01\x00" * 2400
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm, session_id = await self.connect(fake, "c2")
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+                fake.push(audio_delta("resp_1", "item_1", chunk))
+                while (await comm.receive_output(timeout=5)).get("bytes") is None:
+                    pass
+                await drain_worker(session_directory.worker_id)
+                outputs = []
+                while not await comm.receive_nothing(timeout=0.2):
+                    outputs.append(await comm.receive_output())
+                fake.push({"type": "response.audio_transcript.done", "response_id": "resp_1"})
+                while True:
+                    out = await comm.receive_output(timeout=5)
+                    if out["type"] == "websocket.close":
+                        await comm.send_input({"type": "websocket.disconnect", "code": out["code"]})
+                        await comm.wait()
+                        return outputs, out
+
+        outputs, closed = asyncio.run(run())
+        texts = [json.loads(o["text"]) for o in outputs if o.get("text")]
+        self.assertIn({"type": "draining"}, texts)
+        # still open until the reply was done
+        self.assertFalse(any(o["type"] == "websocket.close" for o in outputs))
+        self.assertEqual(closed["code"], CLOSE_DRAINED)
+
+    def test_pending_drain_close_is_cancelled_on_disconnect(self):
+        cancelled = []
+
+        async def stuck_close_drained(consumer):
+            # e.g. waiting for a client that stopped reading
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)), patch.object(
+                VoiceConsumer, "_close_drained", stuck_close_drained
+            ):
+                comm, session_id = await self.connect(fake, "c6")
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+                fake.push({"type": "response.audio_transcript.delta", "response_id": "resp_1", "delta": "Hi"})
+                await drain_worker(session_directory.worker_id)
+                await asyncio.sleep(0.1)
+                fake.push({"type": "response.audio_transcript.done", "response_id": "resp_1"})
+                await asyncio.sleep(0.1)
+                await comm.disconnect()
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [True])
+
+    def test_worker_drain_refuses_new_sessions_and_waits_for_live_ones(self):
+        drain = WorkerDrain(signal_name="")
+        drain.finish = MagicMock()
+        self.addCleanup(setattr, session_directory, "draining", False)
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.consumers.worker_drain", drain), patch(
+                "agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)
+            ):
+                comm, _ = await self.connect(fake, "c3")
+                drain.start()
+                late = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=c4")
+                await late.connect()
+                refused = await late.receive_output(timeout=5)
+                # the live call carries on
+                fake.push({"type": "response.audio_transcript.delta", "delta": "Still here"})
+                reply = await comm.receive_json_from(timeout=5)
+                finished_early = drain.finish.called
+                await comm.disconnect()
+                return refused, reply, finished_early
+
+        refused, reply, finished_early = asyncio.run(run())
+        self.assertEqual(refused["code"], CLOSE_DRAINING)
+        self.assertEqual(reply["text"], "Still here")
+        self.assertFalse(finished_early)
+        drain.finish.assert_called_once()
+        self.assertTrue(session_directory.draining)
+
+    def test_over_capacity_is_refused_before_any_work(self):
+        controller = AdmissionController(max_sessions=1, queue_timeout=0.05)
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            connect = AsyncMock(return_value=fake)
+            with patch("agent.consumers.admission", controller), patch(
+                "agent.realtime_bridge.websockets.connect", connect
+            ):
+                comm, _ = await self.connect(fake, "c5")
+                late = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=c6")
+                await late.connect()
+                refused = await late.receive_output(timeout=5)
+                await late.send_input({"type": "websocket.disconnect", "code": refused["code"]})
+                await late.wait()
+                await comm.disconnect()
+                return refused, connect.await_count
+
+        refused, upstream_connects = asyncio.run(run())
+        self.assertEqual(refused["code"], CLOSE_CODES["busy"])
+        self.assertEqual(upstream_connects, 1)
+        self.assertFalse(ConversationSession.objects.filter(user_id="c6").exists())
+        self.assertEqual(controller.stats()["active"], 0)
+
+    def test_failed_upstream_connect_gives_the_admission_back(self):
+        controller = AdmissionController(max_sessions=1, max_per_user=1, queue_timeout=0.05)
+        active = metrics.ACTIVE_SESSIONS._only().value
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            connect = AsyncMock(side_effect=[OSError("connection refused"), fake])
+            with patch("agent.consumers.admission", controller), patch(
+                "agent.realtime_bridge.websockets.connect", connect
+            ):
+                failed = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=c7")
+                await failed.connect()
+                closed = await failed.receive_output(timeout=5)
+                await failed.send_input({"type": "websocket.disconnect", "code": closed["code"]})
+                await failed.wait()
+                stats_between = controller.stats()
+                # the same user again: admitted, not refused for user_limit
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=c7")
+                await comm.connect()
+                ready = await comm.receive_json_from(timeout=5)
+                await comm.disconnect()
+                return closed, stats_between, ready
+
+        closed, stats_between, ready = asyncio.run(run())
+        self.assertEqual(closed["code"], CLOSE_UPSTREAM_LOST)
+        self.assertEqual(stats_between["active"], 0)
+        self.assertEqual(controller.per_user, {})
+        self.assertEqual(ready, {"type": "ready"})
+        self.assertEqual(metrics.ACTIVE_SESSIONS._only().value, active)
+        self.assertFalse(worker_drain.sessions)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class ConnectOrderTests(TransactionTestCase):
+    def test_memories_reach_upstream_after_concurrent_connect(self):
+        user = UserProfile.objects.create(id="u2")
+        UserMemory.objects.create(user=user, type="fact", content="Has a dog named Rex")
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=u2")
+                connected, _ = await comm.connect()
+                self.assertTrue(connected)
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                await comm.disconnect()
+                return fake
+
+        fake = asyncio.run(run())
+        updates = [
+            e["session"]["instructions"]
+            for e in fake.sent_of_type("session.update")
+            if "instructions" in e["session"]
+        ]
+        # either the first config already had them, or a follow-up update did
+        self.assertIn("Has a dog named Rex", updates[-1])
+        self.assertEqual(ConversationSession.objects.filter(user=user).count(), 1)
+
+    @patch("agent.consumers.MEMORY_PROMPT_K", 2)
+    def test_user_transcript_refreshes_memories(self):
+        facts = MemoryRetrievalTests.FACTS
+        consolidate_memories("u3", [{"type": "fact", "content": c, "importance": 5} for c in facts])
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=u3")
+                await comm.connect()
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                await comm.send_json_to({"type": "user_transcript", "text": "Any tips for my trip to Kyoto?"})
+                await comm.receive_nothing(timeout=0.2)
+                await comm.disconnect()
+                return fake
+
+        fake = asyncio.run(run())
+        instructions = fake.sent_of_type("session.update")[-1]["session"]["instructions"]
+        self.assertIn(facts[5], instructions)
+        self.assertEqual(sum(f in instructions for f in facts), 2)
+
+    @patch("agent.consumers.MEMORY_PROMPT_K", 2)
+    def test_memory_refresh_runs_off_the_listen_loop(self):
+        facts = MemoryRetrievalTests.FACTS
+        consolidate_memories("u4", [{"type": "fact", "content": c, "importance": 5} for c in facts])
+        builds = []
+
+        def slow_get(user_id):
+            builds.append(user_id)
+            time.sleep(0.3)
+            return memory_indexes.get(user_id)
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)), patch(
+                "agent.consumers.memory_indexes", SimpleNamespace(get=slow_get)
+            ):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=u4")
+                await comm.connect()
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                await comm.receive_nothing(timeout=0.1)  # the DB bootstrap may finish after ready
+                for text in ("Any tips for my trip to Kyoto?", "And for Osaka?"):
+                    fake.push({"type": "conversation.item.input_audio_transcription.completed", "transcript": text})
+                fake.push(audio_delta("resp_1", "item_1", b"\x01\x00" * 2400))
+                started = time.perf_counter()
+                while (await comm.receive_output(timeout=5)).get("bytes") is None:
+                    pass
+                audio_after = time.perf_counter() - started
+                await comm.receive_nothing(timeout=0.5)
+                await comm.disconnect()
+                return fake, audio_after
+
+        fake, audio_after = asyncio.run(run())
+        # audio went out while the index was being built, which happened once
+        self.assertLess(audio_after, 0.2)
+        self.assertEqual(builds, ["u4"])
+        instructions = fake.sent_of_type("session.update")[-1]["session"]["instructions"]
+        self.assertIn(facts[5], instructions)
+
+
+class ListenLoopTests(SimpleTestCase):
+    def test_parse_audio_delta(self):
+        pcm = b"\x01\x00" * 480
+        event = audio_delta("resp_1", "item_1", pcm)
+        for msg in (json.dumps(event), json.dumps(event, separators=(",", ":"))):
+            response_id, item_id, b64 = parse_audio_delta(msg)
+            self.assertEqual((response_id, item_id, base64.b64decode(b64)), ("resp_1", "item_1", pcm))
+        # anything else, or anything escaped, goes through the JSON parser
+        self.assertIsNone(parse_audio_delta(json.dumps({"type": "response.audio.done"})))
+        self.assertIsNone(parse_audio_delta('{"type":"response.audio.delta","delta":"AA\\/A"}'))
+
+    def test_events_are_dispatched_by_type(self):
+        chunks, texts, updated = [], [], []
+
+        async def on_text(text, is_final):
+            texts.append((text, is_final))
+
+        async def on_audio_chunk(pcm):
+            chunks.append(pcm)
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            bridge = RealtimeBridge("hi", on_text=on_text, on_audio_chunk=on_audio_chunk)
+
+            async def on_session_updated(event):
+                updated.append(event["session"])
+
+            bridge.handlers["session.updated"] = on_session_updated
+            bridge.ws = fake
+            for event in (
+                {"type": "response.created", "response": {"id": "resp_1"}},
+                audio_delta("resp_1", "item_1", b"\x02\x00" * 4),
+                {"type": "response.audio_transcript.delta", "delta": "Hel", "response_id": "resp_1"},
+                {"type": "session.updated", "session": {"voice": "verse"}},
+                {"type": "rate_limits.updated"},
+            ):
+                fake.push(event)
+            await fake.close()
+            await bridge._listen_loop()
+            return bridge
+
+        bridge = asyncio.run(run())
+        self.assertEqual(bridge.response_id, "resp_1")
+        self.assertEqual(bridge.audio_item_id, "item_1")
+        self.assertEqual(chunks, [b"\x02\x00" * 4])
+        self.assertEqual(texts, [("Hel", False)])
+        self.assertEqual(updated, [{"voice": "verse"}])
+
+
+def histogram_count(histogram, *labels):
+    child = histogram.labels(*labels) if labels else histogram._only()
+    return sum(child.counts)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_text_format(self):
+        registry = metrics.Registry()
+        requests = metrics.Counter("requests_total", "Requests.", ["path"], registry=registry)
+        latency = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+        metrics.Gauge("queue_depth", "Depth.", func=lambda: 7, registry=registry)
+        requests.labels('a"b').inc(2)
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter\n", text)
+        self.assertIn('requests_total{path="a\\"b"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('latency_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("latency_seconds_sum 5.55\n", text)
+        self.assertIn("latency_seconds_count 3\n", text)
+        self.assertIn("queue_depth 7\n", text)
+        with self.assertRaises(ValueError):
+            metrics.Counter("requests_total", "Again.", registry=registry)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class SessionMetricsTests(TransactionTestCase):
+    def test_consumer_and_bridge_hooks(self):
+        chunk = b"\x01\x00" * 2400
+        audio_in = metrics.AUDIO_BYTES.labels("in").value
+        audio_out = metrics.AUDIO_BYTES.labels("out").value
+        first_audio = histogram_count(metrics.FIRST_AUDIO)
+        ready = histogram_count(metrics.CONNECT_PHASE, "ready")
+        writes = histogram_count(metrics.DB_WRITE)
+        created = metrics.UPSTREAM_EVENTS.labels("response.created").value
+        deltas = metrics.UPSTREAM_EVENTS.labels("response.audio.delta").value
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=m1")
+                await comm.connect()
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                active = metrics.ACTIVE_SESSIONS._only().value
+
+                await comm.send_to(bytes_data=b"\x00\x00" * 320)
+                await comm.send_json_to({"type": "stop_speaking"})
+                while not fake.sent_of_type("response.create"):
+                    await asyncio.sleep(0.01)
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+                fake.push(audio_delta("resp_1", "item_1", chunk))
+                fake.push(audio_delta("resp_1", "item_1", chunk))
+                fake.push({"type": "response.audio_transcript.delta", "response_id": "resp_1", "delta": "Hi"})
+                fake.push({"type": "response.audio_transcript.done", "response_id": "resp_1"})
+                while True:
+                    out = await comm.receive_output(timeout=5)
+                    if out.get("text") and '"is_final": true' in out["text"]:
+                        break
+                await comm.disconnect()
+                return active
+
+        active_during = asyncio.run(run())
+        self.assertEqual(active_during, metrics.ACTIVE_SESSIONS._only().value + 1)
+        self.assertEqual(metrics.AUDIO_BYTES.labels("in").value - audio_in, 640)
+        self.assertGreater(metrics.AUDIO_BYTES.labels("out").value, audio_out)
+        # one turn: observed at its first audio chunk only
+        self.assertEqual(histogram_count(metrics.FIRST_AUDIO) - first_audio, 1)
+        self.assertEqual(histogram_count(metrics.CONNECT_PHASE, "ready") - ready, 1)
+        self.assertEqual(histogram_count(metrics.DB_WRITE) - writes, 1)
+        self.assertEqual(metrics.UPSTREAM_EVENTS.labels("response.created").value - created, 1)
+        self.assertEqual(metrics.UPSTREAM_EVENTS.labels("response.audio.delta").value - deltas, 2)
+
+    def test_first_audio_is_timed_from_server_vad_to_the_client(self):
+        first_audio = histogram_count(metrics.FIRST_AUDIO)
+        sent_at = []
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                path = "/ws/voice/?user_id=m2&turn_detection=server_vad"
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), path)
+                await comm.connect()
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                fake.push({"type": "input_audio_buffer.speech_stopped"})
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+                fake.push(audio_delta("resp_1", "item_1", b"\x01\x00" * 2400))
+                while (await comm.receive_output(timeout=5)).get("bytes") is None:
+                    pass
+                sent_at.append(histogram_count(metrics.FIRST_AUDIO) - first_audio)
+                await comm.disconnect()
+
+        asyncio.run(run())
+        # observed once the frame was handed to the client socket
+        self.assertEqual(sent_at, [1])
+
+    def test_metrics_view_reports_memory_job_lag(self):
+        session = create_conversation_session(get_or_create_user("m2"))
+        add_events(session, [("user", "hi")])
+        enqueue_memory_extraction(session)
+        MemoryJob.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=90))
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn("memory_jobs_pending 1\n", text)
+        lag = float(text.split("\nmemory_job_queue_lag_seconds ")[1].split()[0])
+        self.assertGreaterEqual(lag, 90)
+        self.assertIn("# TYPE voice_turn_first_audio_seconds histogram", text)
+
+
+class TurnDetectionTests(SimpleTestCase):
+    def test_energy_vad_reports_start_and_end_of_speech(self):
+        vad = EnergyVAD(silence_ms=200, min_speech_ms=60)
+        speech = sine_pcm(24000, 0.5)
+        silence = b"\x00\x00" * 24000
+        events = []
+        # feed in worklet-sized pieces
+        stream = speech + silence
+        for i in range(0, len(stream), 256):
+            events += vad.process(stream[i:i + 256])
+        self.assertEqual(events, [SPEECH_STARTED, SPEECH_STOPPED])
+        self.assertFalse(vad.in_speech)
+
+    def test_short_click_is_not_speech(self):
+        vad = EnergyVAD(min_speech_ms=100)
+        self.assertEqual(vad.process(sine_pcm(24000, 0.04) + b"\x00\x00" * 4800), [])
+
+    def test_connect_sends_turn_detection_mode(self):
+        async def run(mode):
+            fake = FakeRealtimeSocket()
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                bridge = RealtimeBridge("hi", on_text=AsyncMock(), on_audio_chunk=AsyncMock())
+                await bridge.connect(turn_detection=mode)
+                await bridge.close()
+            return fake.sent_of_type("session.update")[0]["session"]["turn_detection"]
+
+        self.assertIsNone(asyncio.run(run("manual")))
+        self.assertIsNone(asyncio.run(run("local_vad")))
+        self.assertEqual(asyncio.run(run("server_vad"))["type"], "server_vad")
+        with self.assertRaises(ValueError):
+            asyncio.run(run("push_to_talk"))
+
+
+class FakeRealtimeServerTests(SimpleTestCase):
+    def test_bridge_turn_with_paced_transcript(self):
+        from .fake_realtime import FakeRealtimeServer
+
+        deltas, audio = [], []
+        done = asyncio.Event()
+
+        async def on_text(text, is_final):
+            if is_final:
+                done.set()
+            elif text:
+                deltas.append(text)
+
+        async def on_audio_chunk(pcm):
+            audio.append(pcm)
+
+        async def run():
+            fake = FakeRealtimeServer(
+                first_audio_ms=0, reply_ms=300, speed=0, words_per_s=10, reply_text="one two three four"
+            )
+            async with fake:
+                with patch("agent.realtime_bridge.REALTIME_URL", fake.url):
+                    bridge = RealtimeBridge("test", on_text=on_text, on_audio_chunk=on_audio_chunk)
+                    await bridge.connect(turn_detection="manual")
+                    await bridge.send_audio_chunk(sine_pcm(24000, 0.2))
+                    await bridge.commit_and_request_response()
+                    await asyncio.wait_for(done.wait(), 5)
+                    await bridge.close()
+            return fake
+
+        fake = asyncio.run(run())
+        self.assertEqual(deltas, ["one ", "two ", "three ", "four "])
+        self.assertEqual(sum(map(len, audio)), 24000 * 2 * 300 // 1000)
+        self.assertEqual(fake.responses, 1)
+
+
+class FakeBucketScript:
+    """agent.admission's token bucket script, on the local clock."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.tokens = None
+        self.ts = None
+
+    async def __call__(self, keys, args, client):
+        if self.fail:
+            raise redis.ConnectionError("down")
+        rate, burst = args
+        now = time.monotonic()
+        tokens = burst if self.tokens is None else self.tokens
+        tokens = min(burst, tokens + (now - (self.ts or now)) * rate)
+        taken = int(tokens >= 1)
+        self.tokens, self.ts = tokens - taken, now
+        return [taken, str((1 - self.tokens) / rate)]
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def test_full_process_queues_and_gets_the_next_free_slot(self):
+        async def run():
+            controller = AdmissionController(max_sessions=1, queue_timeout=1)
+            self.assertIsNone(await controller.admit("a"))
+            waiting = asyncio.create_task(controller.admit("b"))
+            await asyncio.sleep(0.01)
+            queued = controller.stats()["waiting"]
+            controller.release("a")
+            return queued, await waiting, controller
+
+        queued, result, controller = asyncio.run(run())
+        self.assertEqual(queued, 1)
+        self.assertIsNone(result)
+        self.assertEqual(controller.stats()["active"], 1)
+        self.assertEqual(controller.per_user, {"b": 1})
+
+    def test_refusals(self):
+        async def run():
+            busy = AdmissionController(max_sessions=1, queue_timeout=0.05)
+            per_user = AdmissionController(max_per_user=1)
+            return [
+                await busy.admit("a"),
+                await busy.admit("b"),
+                await per_user.admit("a"),
+                await per_user.admit("a"),
+                await per_user.admit("b"),
+            ], busy
+
+        results, busy = asyncio.run(run())
+        self.assertEqual(results, [None, "busy", None, "user_limit", None])
+        # the refused connect doesn't hold anything
+        self.assertEqual((busy.active, busy.per_user), (1, {"a": 1}))
+
+    def test_token_bucket_waits_within_the_timeout_and_fails_open(self):
+        async def run(queue_timeout, script):
+            controller = AdmissionController(rate=20, burst=2, queue_timeout=queue_timeout, url="redis://bucket")
+            controller._redis, controller._take = object(), script
+            return [await controller.admit(f"u{n}") for n in range(3)], controller
+
+        results, _ = asyncio.run(run(0, FakeBucketScript()))
+        self.assertEqual(results, [None, None, "rate_limited"])
+        results, _ = asyncio.run(run(0.5, FakeBucketScript()))
+        self.assertEqual(results, [None, None, None])
+        results, controller = asyncio.run(run(0, FakeBucketScript(fail=True)))
+        self.assertEqual(results, [None, None, None])
+        self.assertEqual(controller.redis_errors, 1)
+
+
+@patch("agent.realtime_bridge.REALTIME_RECONNECT_BACKOFF_S", 0.01)
+class RealtimeReconnectTests(SimpleTestCase):
+    def make_bridge(self, states, finals, on_state=None):
+        async def on_text(text, is_final):
+            if is_final:
+                finals.append(True)
+
+        async def on_upstream_state(state):
+            states.append(state)
+            if on_state is not None:
+                await on_state(state)
+
+        return RealtimeBridge(
+            "test", on_text=on_text, on_audio_chunk=AsyncMock(), on_upstream_state=on_upstream_state
+        )
+
+    async def wait_for(self, condition):
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        self.fail("timed out")
+
+    def test_reconnects_mid_response_and_replays_context(self):
+        from .fake_realtime import FakeRealtimeServer
+
+        states, finals = [], []
+        later = sine_pcm(24000, 0.1)
+
+        async def run():
+            fake = FakeRealtimeServer(first_audio_ms=0, reply_ms=600, speed=0, drop_after_chunks=2)
+            async with fake:
+                with patch("agent.realtime_bridge.REALTIME_URL", fake.url):
+
+                    async def on_state(state):
+                        if state == "reconnecting":
+                            # the user keeps talking while we're away
+                            await bridge.send_audio_chunk(later)
+                            await bridge.uplink.flush()
+
+                    bridge = self.make_bridge(states, finals, on_state)
+                    bridge.remember("user", "My name is Ada.")
+                    await bridge.connect(turn_detection="manual")
+                    await bridge.send_audio_chunk(sine_pcm(24000, 0.2))
+                    await bridge.commit_and_request_response()
+                    await self.wait_for(lambda: "connected" in states)
+                    await bridge.commit_and_request_response()
+                    await self.wait_for(lambda: len(finals) == 2)
+                    await bridge.close()
+            return fake, bridge
+
+        fake, bridge = asyncio.run(run())
+        self.assertEqual(states, ["reconnecting", "connected"])
+        self.assertEqual((fake.connections, fake.dropped, bridge.reconnects), (2, 1, 1))
+        second = fake.sessions[1]
+        self.assertEqual(second.config["instructions"], "test")
+        replayed = [(i["role"], i["content"][0]["text"]) for i in second.items[:2]]
+        self.assertEqual(replayed[0], ("user", "My name is Ada."))
+        # the part of the cut-off reply the user heard
+        self.assertEqual(replayed[1][0], "assistant")
+        self.assertTrue(fake.reply_text.startswith(replayed[1][1]))
+        # audio held during the reconnect went into the next turn
+        self.assertEqual(second.items[2]["audio_bytes"], len(later))
+
+    @patch("agent.realtime_bridge.REALTIME_RECONNECT_BACKOFF_S", 0)
+    def test_drop_during_a_handler_send_reconnects(self):
+        states, finals = [], []
+
+        class DroppingSocket(FakeRealtimeSocket):
+            dropped = False
+
+            async def send(self, msg):
+                if self.dropped:
+                    raise websockets.ConnectionClosed(None, None)
+                await super().send(msg)
+
+        first, second = DroppingSocket(), FakeRealtimeSocket()
+
+        async def run():
+            bridge = self.make_bridge(states, finals)
+
+            async def on_transcript(event):
+                # a send from a handler the listen task runs
+                first.dropped = True
+                await bridge.update_instructions("refreshed")
+
+            bridge.handlers["conversation.item.input_audio_transcription.completed"] = on_transcript
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(side_effect=[first, second])):
+                await bridge.connect(turn_detection="manual")
+                first.push({"type": "conversation.item.input_audio_transcription.completed"})
+                await self.wait_for(lambda: "connected" in states)
+            await bridge.close()
+
+        asyncio.run(run())
+        self.assertEqual(states, ["reconnecting", "connected"])
+        self.assertEqual(second.sent_of_type("session.update")[0]["session"]["instructions"], "refreshed")
+
+    @patch("agent.realtime_bridge.REALTIME_RECONNECT_BACKOFF_S", 0)
+    def test_drop_while_replaying_held_audio_is_a_failed_attempt(self):
+        states, finals = [], []
+        held = sine_pcm(24000, 0.1)
+
+        class ClosingSocket(FakeRealtimeSocket):
+            # takes the session.update and the replayed turns, then goes away
+            async def send(self, msg):
+                if json.loads(msg)["type"] == "input_audio_buffer.append":
+                    raise websockets.ConnectionClosed(None, None)
+                await super().send(msg)
+
+        first, second, third = FakeRealtimeSocket(), ClosingSocket(), FakeRealtimeSocket()
+
+        async def run():
+            async def on_state(state):
+                if state == "reconnecting":
+                    await bridge.send_audio_chunk(held)
+                    await bridge.uplink.flush()
+
+            bridge = self.make_bridge(states, finals, on_state)
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(side_effect=[first, second, third])):
+                await bridge.connect(turn_detection="manual")
+                await first.close()
+                await self.wait_for(lambda: "connected" in states)
+                # sends go through again instead of waiting forever
+                await asyncio.wait_for(bridge.commit_and_request_response(), 1)
+            await bridge.close()
+            return bridge
+
+        bridge = asyncio.run(run())
+        self.assertEqual(states, ["reconnecting", "connected"])
+        self.assertEqual(bridge.reconnects, 1)
+        appended = b"".join(base64.b64decode(e["audio"]) for e in third.sent_of_type("input_audio_buffer.append"))
+        self.assertEqual(appended, held)
+        self.assertEqual(len(third.sent_of_type("response.create")), 1)
+
+    def test_failed_handler_is_logged_and_the_loop_keeps_listening(self):
+        states, finals, seen = [], [], []
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            bridge = self.make_bridge(states, finals)
+
+            async def broken(event):
+                raise KeyError("response")
+
+            async def on_done(event):
+                seen.append(event["type"])
+
+            bridge.handlers["response.created"] = broken
+            bridge.handlers["response.done"] = on_done
+            with patch("agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)):
+                await bridge.connect(turn_detection="manual")
+                fake.push({"type": "response.created"})
+                fake.push({"type": "response.done"})
+                await self.wait_for(lambda: seen)
+            await bridge.close()
+
+        with self.assertLogs("agent.realtime_bridge", "ERROR") as logs:
+            asyncio.run(run())
+        self.assertIn("Realtime event handling failed", logs.output[0])
+        self.assertEqual(seen, ["response.done"])
+        self.assertEqual(states, [])
+
+    @patch("agent.realtime_bridge.REALTIME_RECONNECT_ATTEMPTS", 2)
+    def test_gives_up_after_failed_attempts(self):
+        from .fake_realtime import FakeRealtimeServer
+
+        states, finals = [], []
+
+        async def run():
+            fake = FakeRealtimeServer(first_audio_ms=0, reply_ms=600, speed=0, drop_after_chunks=1)
+            async with fake:
+                with patch("agent.realtime_bridge.REALTIME_URL", fake.url):
+
+                    async def on_state(state):
+                        if state == "reconnecting":
+                            # nothing listens there
+                            patcher = patch("agent.realtime_bridge.REALTIME_URL", "ws://127.0.0.1:1/")
+                            patcher.start()
+                            self.addCleanup(patcher.stop)
+
+                    bridge = self.make_bridge(states, finals, on_state)
+                    await bridge.connect(turn_detection="manual")
+                    await bridge.send_audio_chunk(sine_pcm(24000, 0.2))
+                    await bridge.commit_and_request_response()
+                    await self.wait_for(lambda: "lost" in states)
+                    # audio is dropped quietly, anything else fails
+                    await bridge.send_audio_chunk(sine_pcm(24000, 0.1))
+                    await bridge.uplink.flush()
+                    with self.assertRaises(UpstreamLost):
+                        await bridge.commit_and_request_response()
+                    await bridge.close()
+            return bridge
+
+        bridge = asyncio.run(run())
+        self.assertEqual(states, ["reconnecting", "lost"])
+        self.assertEqual(finals, [True])  # the cut-off reply was ended for the client
+        self.assertTrue(bridge.lost)
+
+
+class SessionRecorderTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def record(self, path, writer, chunk_bytes=4096):
+        recorder = SessionRecorder(path, {"user_id": "r0"}, writer=writer, chunk_bytes=chunk_bytes)
+        uplink = [sine_pcm(24000, 0.05, amp=1000 + n) for n in range(10)]
+        for n, pcm in enumerate(uplink):
+            recorder.uplink(pcm)
+            recorder.upstream(json.dumps({"type": "input_audio_buffer.speech_started", "n": n}))
+        recorder.downlink(b"\x01\x00" * 3)  # odd size: padded
+        recorder.close()
+        return recorder, uplink
+
+    def test_file_round_trip_seek_by_time(self):
+        path = os.path.join(self.dir, "s.vrec")
+        writer = RecordingWriter()
+        recorder, uplink = self.record(path, writer)
+        self.assertTrue(writer.sync())
+
+        recording = Recording(path)
+        self.assertEqual(recording.meta, {"user_id": "r0"})
+        records = list(recording.records())
+        self.assertEqual(len(records), recorder.records)
+        self.assertEqual([bytes(p) for _, k, p in records if k == UPLINK], uplink)
+        self.assertEqual(bytes(records[-1][2]), b"\x01\x00" * 3)
+        # PCM payloads can be read in place
+        pcm = np.frombuffer(records[1][2], dtype="<i2")
+        self.assertEqual(pcm.tobytes(), uplink[0])
+        self.assertGreater(len(recording.index), 3)
+
+        # seeking: from the chunk holding the time, nothing earlier
+        t_mid = records[len(records) // 2][0]
+        self.assertEqual(list(recording.records(start_ns=t_mid)), [r for r in records if r[0] >= t_mid])
+
+        # without the index, or with a torn last chunk after a crash
+        os.remove(path + ".idx")
+        self.assertEqual(Recording(path).index, recording.index)
+        with open(path, "rb") as f:
+            data = f.read()
+        torn = Recording(data[:-10])
+        self.assertEqual(torn.index, recording.index[:-1])
+
+    def test_chunks_over_the_writer_budget_are_dropped(self):
+        path = os.path.join(self.dir, "s.vrec")
+        writer = RecordingWriter(max_pending_bytes=1000)
+        recorder, _ = self.record(path, writer, chunk_bytes=2000)
+        self.assertTrue(writer.sync())
+        self.assertGreater(writer.stats()["dropped_bytes"], 0)
+        self.assertEqual(writer.stats()["pending_bytes"], 0)
+        # the small chunks made it; the file is still readable
+        kept = list(Recording(path).records())
+        self.assertLess(0, len(kept))
+        self.assertLess(len(kept), recorder.records)
+
+    def test_quiet_session_is_flushed_on_a_timer(self):
+        writer = MemoryWriter()
+
+        async def run():
+            recorder = SessionRecorder("mem", writer=writer, flush_s=0.05)
+            recorder.uplink(sine_pcm(24000, 0.02))
+            header = len(writer.data)
+            # nothing else is recorded: the timer sends the partial chunk
+            await asyncio.sleep(0.2)
+            flushed = len(writer.data) - header
+            recorder.uplink(sine_pcm(24000, 0.02))
+            recorder.close()
+            await asyncio.sleep(0.1)  # the closed recorder's timer doesn't fire
+            return recorder, flushed
+
+        recorder, flushed = asyncio.run(run())
+        self.assertGreater(flushed, 0)
+        self.assertIsNone(recorder._timer)
+        self.assertEqual(len(list(Recording(bytes(writer.data)).records())), 2)
+
+    def test_replay_against_fake_upstream(self):
+        from .fake_realtime import FakeRealtimeServer
+
+        writer = MemoryWriter()
+        recorder = SessionRecorder("mem", {"turn_detection": "manual"}, writer=writer)
+        recorder.uplink(sine_pcm(24000, 0.2))
+        recorder.client(json.dumps({"type": "stop_speaking"}))
+        recorder.close()
+
+        async def run():
+            async with FakeRealtimeServer(first_audio_ms=0, reply_ms=200, speed=0) as fake:
+                with patch("agent.realtime_bridge.REALTIME_URL", fake.url):
+                    return await replay(Recording(bytes(writer.data)), speed=0, settle_s=5), fake
+
+        replayed, fake = asyncio.run(run())
+        self.assertEqual(fake.responses, 1)
+        [row] = waterfall(replayed)
+        self.assertLessEqual(0, row["commit_ms"])
+        self.assertLessEqual(row["commit_ms"], row["created_ms"])
+        self.assertLessEqual(row["created_ms"], row["first_audio_ms"])
+        self.assertLessEqual(row["first_audio_ms"], row["done_ms"])
+        uplink = b"".join(bytes(p) for _, _, p in replayed.records(kinds=(UPLINK,)))
+        self.assertEqual(uplink, sine_pcm(24000, 0.2))
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class SessionRecordingTests(TransactionTestCase):
+    def test_opted_in_session_is_recorded(self):
+        record_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, record_dir)
+        chunk = b"\x01\x00" * 2400
+
+        async def run():
+            fake = FakeRealtimeSocket()
+            with patch("agent.recorder.RECORD_DIR", record_dir), patch(
+                "agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fake)
+            ):
+                comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), "/ws/voice/?user_id=r1&record=1")
+                await comm.connect()
+                self.assertEqual(await comm.receive_json_from(timeout=5), {"type": "ready"})
+                session_id = await live_session("r1")
+                await comm.send_to(bytes_data=sine_pcm(16000, 0.1))
+                await comm.send_json_to({"type": "stop_speaking"})
+                await comm.receive_nothing(timeout=0.1)
+                fake.push({"type": "response.created", "response": {"id": "resp_1"}})
+                fake.push(audio_delta("resp_1", "item_1", chunk))
+                fake.push({"type": "response.done", "response": {"id": "resp_1"}})
+                while (await comm.receive_output(timeout=5)).get("bytes") is None:
+                    pass
+                await comm.disconnect()
+                return session_id
+
+        session_id = asyncio.run(run())
+        self.assertTrue(recording_writer.sync())
+        [name] = [n for n in os.listdir(record_dir) if n.endswith(".vrec")]
+        recording = Recording(os.path.join(record_dir, name))
+        self.assertEqual(recording.meta["user_id"], "r1")
+        self.assertEqual(str(recording.meta["session_id"]), str(session_id))
+        kinds = {kind for _, kind, _ in recording.records()}
+        self.assertLessEqual({UPLINK, DOWNLINK, UPSTREAM, SENT, CLIENT}, kinds)
+        [row] = waterfall(recording)
+        self.assertIsNotNone(row["commit_ms"])
+        self.assertIsNotNone(row["first_audio_ms"])
+
+
+class RealtimeConnectionPoolTests(SimpleTestCase):
+    class Conn:
+        def __init__(self, healthy=True):
+            self.healthy = healthy
+            self.closed = False
+            self.state = State.OPEN
+
+        async def ping(self):
+            if not self.healthy:
+                raise ConnectionError("gone")
+            fut = asyncio.get_running_loop().create_future()
+            fut.set_result(None)
+            return fut
+
+        async def close(self):
+            self.closed = True
+
+    def make_pool(self, **kwargs):
+        opened = []
+
+        async def open_connection():
+            conn = self.Conn()
+            opened.append(conn)
+            return conn
+
+        return RealtimeConnectionPool(open_connection, **kwargs), opened
+
+    def test_checkout_is_warm_and_pool_refills(self):
+        async def run():
+            pool, opened = self.make_pool(size=2, health_interval=60)
+            pool.start()
+            await asyncio.sleep(0.01)
+            first, warm = await pool.acquire()
+            await asyncio.sleep(0.01)
+            stats = pool.stats()
+            await pool.close()
+            return first, warm, stats, opened
+
+        first, warm, stats, opened = asyncio.run(run())
+        self.assertTrue(warm)
+        self.assertIs(first, opened[0])
+        self.assertEqual(stats["warm"], 2)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(len(opened), 3)
+
+    def test_expired_and_unhealthy_connections_are_replaced(self):
+        async def run():
+            pool, opened = self.make_pool(size=2, health_interval=0.01, max_age=0.05)
+            pool.start()
+            await asyncio.sleep(0.01)
+            opened[0].healthy = False
+            await asyncio.sleep(0.1)
+            stats = pool.stats()
+            await pool.close()
+            return stats, opened
+
+        stats, opened = asyncio.run(run())
+        self.assertEqual(stats["unhealthy"], 1)
+        self.assertGreaterEqual(stats["expired"], 1)
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(stats["warm"], 2)
+
+    def test_connection_closed_by_the_server_is_not_handed_out(self):
+        discarded = metrics.REALTIME_POOL_DISCARDED.labels("closed").value
+
+        async def run():
+            pool, opened = self.make_pool(size=2, health_interval=60)
+            pool.start()
+            await asyncio.sleep(0.01)
+            opened[0].state = State.CLOSED
+            conn, warm = await pool.acquire()
+            stats = pool.stats()
+            await pool.close()
+            return conn, warm, stats, opened
+
+        conn, warm, stats, opened = asyncio.run(run())
+        self.assertTrue(warm)
+        self.assertIs(conn, opened[1])
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(stats["closed"], 1)
+        self.assertEqual(metrics.REALTIME_POOL_DISCARDED.labels("closed").value, discarded + 1)
+
+    def test_startup_middleware_fills_the_pool_at_lifespan_startup(self):
+        sent = []
+
+        async def run():
+            pool, opened = self.make_pool(size=1, health_interval=60)
+            app = PoolStartupMiddleware(AsyncMock(), pool)
+            messages = asyncio.Queue()
+            messages.put_nowait({"type": "lifespan.startup"})
+
+            async def send(message):
+                sent.append(message["type"])
+
+            lifespan = asyncio.create_task(app({"type": "lifespan"}, messages.get, send))
+            await asyncio.sleep(0.01)
+            warm = pool.stats()["warm"]
+            messages.put_nowait({"type": "lifespan.shutdown"})
+            await lifespan
+            return warm, pool, opened
+
+        warm, pool, opened = asyncio.run(run())
+        self.assertEqual(warm, 1)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertTrue(opened[0].closed)
+        self.assertEqual(pool.stats()["warm"], 0)
+
+    def test_bridge_opens_a_fresh_connection_when_the_warm_one_is_gone(self):
+        class GoneSocket(FakeRealtimeSocket):
+            # closed upstream after the checkout check
+            state = State.OPEN
+
+            async def send(self, msg):
+                raise websockets.ConnectionClosed(None, None)
+
+        fresh = FakeRealtimeSocket()
+
+        async def run():
+            async def open_connection():
+                return GoneSocket()
+
+            pool = RealtimeConnectionPool(open_connection, size=1, health_interval=60)
+            pool.start()
+            await asyncio.sleep(0.01)
+            bridge = RealtimeBridge("hi", on_text=AsyncMock(), on_audio_chunk=AsyncMock())
+            with patch("agent.realtime_bridge.realtime_pool", pool), patch(
+                "agent.realtime_bridge.websockets.connect", AsyncMock(return_value=fresh)
+            ):
+                await bridge.connect(turn_detection="manual")
+            await bridge.close()
+            await pool.close()
+            return bridge
+
+        bridge = asyncio.run(run())
+        self.assertIs(bridge.ws, fresh)
+        self.assertFalse(bridge.warm)
+        self.assertEqual(fresh.sent_of_type("session.update")[-1]["session"]["instructions"], "hi")
+
+    def test_disabled_pool_opens_on_demand(self):
+        async def run():
+            pool, opened = self.make_pool(size=0)
+            conn, warm = await pool.acquire()
+            return conn, warm, opened, pool
+
+        conn, warm, opened, pool = asyncio.run(run())
+        self.assertFalse(warm)
+        self.assertEqual(opened, [conn])
+        self.assertEqual(pool.misses, 1)
+
+
+class MemoryJobTests(TransactionTestCase):
+    def make_session(self, user_id="u1", text="I play the cello"):
+        session = create_conversation_session(get_or_create_user(user_id))
+        add_events(session, [("user", text), ("assistant", "Nice!")])
+        return session
+
+    def test_enqueue_is_idempotent_and_ends_session(self):
+        session = self.make_session()
+        first = enqueue_memory_extraction(session)
+        second = enqueue_memory_extraction(session)
+        self.assertEqual(first.pk, second.pk)
+        session.refresh_from_db()
+        self.assertIsNotNone(session.ended_at)
+
+    def test_session_without_events_is_closed_but_not_queued(self):
+        session = create_conversation_session(get_or_create_user("u1"))
+        self.assertIsNone(enqueue_memory_extraction(session))
+        self.assertFalse(MemoryJob.objects.exists())
+        session.refresh_from_db()
+        self.assertIsNotNone(session.ended_at)
+
+    def test_worker_extracts_memories_once(self):
+        sessions = [self.make_session(f"u{i}") for i in range(5)]
+        for session in sessions:
+            enqueue_memory_extraction(session)
+        client = FakeLLMClient()
+        # concurrency=1 here: the in-memory test DB can't take writes from two threads
+        worker = MemoryJobWorker(concurrency=1, client=client, poll_interval=0.01)
+        worker.run(once=True)
+
+        self.assertEqual(worker.stats(), {"done": 5, "retried": 0, "failed": 0})
+        self.assertEqual(client.calls, 5)
+        self.assertEqual(UserMemory.objects.filter(content="Plays the cello").count(), 5)
+        # re-enqueueing a finished session doesn't extract again
+        enqueue_memory_extraction(sessions[0])
+        MemoryJobWorker(client=client).run(once=True)
+        self.assertEqual(client.calls, 5)
+
+    def test_worker_concurrency_is_bounded(self):
+        for i in range(6):
+            enqueue_memory_extraction(self.make_session(f"u{i}"))
+        active, peak = [0], [0]
+
+        def fake_run(job, client):
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            active[0] -= 1
+            return MemoryJobStatus.DONE
+
+        with patch("agent.jobs.run_memory_job", fake_run):
+            worker = MemoryJobWorker(concurrency=3, poll_interval=0.01)
+            worker.run(once=True)
+        self.assertEqual(worker.done, 6)
+        self.assertEqual(peak[0], 3)
+
+    def test_failed_attempt_is_retried_with_backoff(self):
+        enqueue_memory_extraction(self.make_session())
+        client = FakeLLMClient(fail_times=1)
+        job = claim_jobs(1)[0]
+        self.assertEqual(run_memory_job(job, client), MemoryJobStatus.PENDING)
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("rate limited", job.last_error)
+        self.assertEqual(claim_jobs(1), [])  # not due yet
+
+        MemoryJob.objects.update(next_attempt_at=job.created_at)
+        job = claim_jobs(1)[0]
+        self.assertEqual(run_memory_job(job, client), MemoryJobStatus.DONE)
+        self.assertEqual(UserMemory.objects.count(), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        enqueue_memory_extraction(self.make_session())
+        client = FakeLLMClient(fail_times=100)
+        with patch("agent.jobs.MEMORY_JOB_MAX_ATTEMPTS", 2):
+            for expected in (MemoryJobStatus.PENDING, MemoryJobStatus.FAILED):
+                MemoryJob.objects.update(next_attempt_at=MemoryJob.objects.get().created_at)
+                self.assertEqual(run_memory_job(claim_jobs(1)[0], client), expected)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_lease_expired_on_the_last_attempt_fails_the_job(self):
+        enqueue_memory_extraction(self.make_session())
+        with patch("agent.jobs.MEMORY_JOB_MAX_ATTEMPTS", 2):
+            for _ in range(2):
+                # claimed, then the worker died without a word
+                self.assertEqual(len(claim_jobs(1)), 1)
+                MemoryJob.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(claim_jobs(1), [])
+        job = MemoryJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (MemoryJobStatus.FAILED, 2))
+        self.assertIn("lease expired", job.last_error)
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        enqueue_memory_extraction(self.make_session())
+        self.assertEqual(len(claim_jobs(5)), 1)
+        self.assertEqual(claim_jobs(5), [])
@@ -0,0 +1,153 @@
+# agent/transcript.py
+import os
+from itertools import chain
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .models import ConversationSession
+
+# prompt budget for one piece of transcript (~4 chars per token)
+TRANSCRIPT_CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", "6000"))
+# rows fetched per round trip while streaming a session's events
+TRANSCRIPT_FETCH_SIZE = int(os.getenv("TRANSCRIPT_FETCH_SIZE", "2000"))
+TRANSCRIPT_SUMMARY_MODEL = os.getenv("TRANSCRIPT_SUMMARY_MODEL", "gpt-4.1-mini")
+TRANSCRIPT_SUMMARY_MAX_TOKENS = int(os.getenv("TRANSCRIPT_SUMMARY_MAX_TOKENS", "400"))
+
+CHARS_PER_TOKEN = 4
+
+Turn = Tuple[str, str]  # (role, text)
+
+
+def _merge(parts: List[str]) -> str:
+    # deltas of one reply glue together as-is; separate sentences get a space
+    pieces = [parts[0]]
+    for prev, part in zip(parts, parts[1:]):
+        if prev and part and prev[-1] in ".!?" and not part[0].isspace():
+            pieces.append(" ")
+        pieces.append(part)
+    return "".join(pieces)
+
+
+def merge_turns(events: Iterable[Turn], max_turn_chars: Optional[int] = None) -> Iterator[Turn]:
+    """Consecutive same-role (role, content) events merged into turns; a
+    turn growing past max_turn_chars is yielded in pieces."""
+    role, parts, size = None, [], 0
+    for event_role, content in events:
+        if parts and (event_role != role or (max_turn_chars and size >= max_turn_chars)):
+            yield role, _merge(parts)
+            parts, size = [], 0
+        role = event_role
+        parts.append(content)
+        size += len(content)
+    if parts:
+        yield role, _merge(parts)
+
+
+def iter_turns(
+    session: ConversationSession,
+    fetch_size: int = TRANSCRIPT_FETCH_SIZE,
+    max_turn_chars: Optional[int] = None,
+) -> Iterator[Turn]:
+    """The session's turns, with rows streamed (.iterator()), never loaded
+    all at once."""
+    events = (
+        session.events.order_by("seq")
+        .values_list("role", "content")
+        .iterator(chunk_size=fetch_size)
+    )
+    return merge_turns(events, max_turn_chars)
+
+
+def format_turn(role: str, text: str) -> str:
+    return f"{role.upper()}: {text}"
+
+
+def iter_transcript_chunks(
+    session: ConversationSession, max_tokens: int = TRANSCRIPT_CHUNK_TOKENS
+) -> Iterator[str]:
+    """
+    The transcript as pieces of at most ~max_tokens, split between turns
+    where possible. A turn longer than a whole piece is cut into several.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    lines, size = [], 0
+    for role, text in iter_turns(session, max_turn_chars=max_chars):
+        line = format_turn(role, text)
+        while len(line) > max_chars:
+            if lines:
+                yield "\n".join(lines)
+                lines, size = [], 0
+            yield line[:max_chars]
+            line = format_turn(role, line[max_chars:])
+        if size + len(line) + 1 > max_chars and lines:
+            yield "\n".join(lines)
+            lines, size = [], 0
+        lines.append(line)
+        size += len(line) + 1
+    if lines:
+        yield "\n".join(lines)
+
+
+def summarize_chunk(text: str, client, part: int) -> str:
+    prompt = f"""
+Below is part {part} of a long voice conversation between a user and an assistant.
+
+Write short notes (bullet points) of everything in it that says something
+about the user: preferences, facts about their life, plans, and what was
+discussed. Leave out small talk. Do not invent anything.
+
+Conversation part:
+\"\"\"{text}\"\"\"
+"""
+    resp = client.chat.completions.create(
+        model=TRANSCRIPT_SUMMARY_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=TRANSCRIPT_SUMMARY_MAX_TOKENS,
+    )
+    return resp.choices[0].message.content.strip()
+
+
+def condense_transcript(
+    session: ConversationSession, client=None, max_tokens: int = TRANSCRIPT_CHUNK_TOKENS
+) -> str:
+    """
+    Text to extract memories from that fits one prompt. A session that fits
+    is returned verbatim; a longer one is summarized piece by piece (map),
+    and the notes are summarized again until they fit (reduce).
+    """
+    chunks = iter_transcript_chunks(session, max_tokens)
+    first = next(chunks, "")
+    second = next(chunks, None)
+    if second is None:
+        return first
+
+    if client is None:
+        from .memory import get_llm_client  # memory imports this module
+
+        client = get_llm_client()
+    notes, part = [], 0
+    for chunk in chain([first, second], chunks):
+        part += 1
+        notes.append(f"PART {part} NOTES:\n{summarize_chunk(chunk, client, part)}")
+    return _reduce(notes, client, max_tokens)
+
+
+def _reduce(notes: List[str], client, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    while True:
+        text = "\n\n".join(notes)
+        if len(text) <= max_chars:
+            return text
+        groups, group, size = [], [], 0
+        for note in notes:
+            if group and size + len(note) + 2 > max_chars:
+                groups.append("\n\n".join(group))
+                group, size = [], 0
+            group.append(note)
+            size += len(note) + 2
+        groups.append("\n\n".join(group))
+        if len(groups) == len(notes):
+            # notes too big to pair up any more; summaries are capped, so
+            # this only happens with a tiny budget
+            return text[:max_chars]
+        notes = [f"NOTES {n}:\n{summarize_chunk(g, client, n)}" for n, g in enumerate(groups, start=1)]
+
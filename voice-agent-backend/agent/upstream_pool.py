@@ -0,0 +1,215 @@
+# agent/upstream_pool.py
+import os
+import logging
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from websockets.protocol import State
+
+from .metrics import REALTIME_POOL_CHECKOUTS, REALTIME_POOL_DISCARDED, REALTIME_POOL_OPEN_FAILURES
+
+logger = logging.getLogger(__name__)
+
+# Number of authenticated, pre-configured Realtime connections kept open per
+# process (0 = open a fresh connection for every call).
+REALTIME_POOL_SIZE = int(os.getenv("REALTIME_POOL_SIZE", "0"))
+# Retire idle connections before the upstream's own session limit kicks in
+REALTIME_POOL_MAX_AGE_S = float(os.getenv("REALTIME_POOL_MAX_AGE_S", "300"))
+REALTIME_POOL_HEALTH_INTERVAL_S = float(os.getenv("REALTIME_POOL_HEALTH_INTERVAL_S", "15"))
+REALTIME_POOL_PING_TIMEOUT_S = float(os.getenv("REALTIME_POOL_PING_TIMEOUT_S", "5"))
+REALTIME_POOL_MAX_BACKOFF_S = 30.0
+
+_HIT = REALTIME_POOL_CHECKOUTS.labels("hit")
+_MISS = REALTIME_POOL_CHECKOUTS.labels("miss")
+
+
+class _WarmConnection:
+    __slots__ = ("ws", "created_at")
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.created_at = time.monotonic()
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+
+class RealtimeConnectionPool:
+    """
+    Process-level pool of warm Realtime connections.
+
+    `open_connection` must return a connected websocket that already had the
+    baseline session.update applied; checkout then only has to push the
+    per-user bits. A background task keeps `size` connections warm, pings
+    them every `health_interval` seconds, retires those older than
+    `max_age` and reconnects with exponential backoff when opening fails.
+    Checkout skips connections the server has closed since. Connections
+    are never returned: a used session carries conversation state, so
+    checkout consumes it and the pool refills.
+
+    Started from the server's event loop (PoolStartupMiddleware), else by
+    the first acquire().
+    """
+
+    def __init__(
+        self,
+        open_connection: Callable[[], Awaitable[object]],
+        size: int = REALTIME_POOL_SIZE,
+        max_age: float = REALTIME_POOL_MAX_AGE_S,
+        health_interval: float = REALTIME_POOL_HEALTH_INTERVAL_S,
+    ):
+        self.open_connection = open_connection
+        self.size = size
+        self.max_age = max_age
+        self.health_interval = health_interval
+
+        self._warm: Deque[_WarmConnection] = deque()
+        self._refill = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.hits = 0
+        self.misses = 0
+        self.opened = 0
+        self.expired = 0
+        self.unhealthy = 0
+        self.closed = 0
+        self.open_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self):
+        if self.enabled and (self._task is None or self._task.done()):
+            self._stopping = False
+            self._task = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._task is not None:
+            # the flag too: wait_for can swallow a cancel that lands just as
+            # the refill event fires
+            self._stopping = True
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._warm:
+            await self._discard(self._warm.popleft())
+
+    async def acquire(self) -> Tuple[object, bool]:
+        """Returns (ws, warm). Falls back to a fresh connection when empty."""
+        self.start()
+        while self._warm:
+            conn = self._warm.popleft()
+            if conn.age >= self.max_age:
+                self._count("expired")
+            elif conn.ws.state is not State.OPEN:
+                # closed upstream since the last health check
+                self._count("closed")
+            else:
+                self.hits += 1
+                _HIT.inc()
+                self._refill.set()
+                return conn.ws, True
+            await self._discard(conn)
+        self.misses += 1
+        _MISS.inc()
+        self._refill.set()
+        return await self.open_connection(), False
+
+    def stats(self) -> dict:
+        return {
+            "warm": len(self._warm),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "opened": self.opened,
+            "expired": self.expired,
+            "unhealthy": self.unhealthy,
+            "closed": self.closed,
+            "open_failures": self.open_failures,
+        }
+
+    async def _maintain(self):
+        backoff = 1.0
+        while not self._stopping:
+            self._refill.clear()
+            await self._check_health()
+            while len(self._warm) < self.size and not self._stopping:
+                try:
+                    ws = await self.open_connection()
+                except Exception as e:
+                    self.open_failures += 1
+                    REALTIME_POOL_OPEN_FAILURES.inc()
+                    logger.warning("Realtime pool: connect failed, retrying in %s s: %s", backoff, e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, REALTIME_POOL_MAX_BACKOFF_S)
+                    continue
+                backoff = 1.0
+                self.opened += 1
+                self._warm.append(_WarmConnection(ws))
+
+            try:
+                await asyncio.wait_for(self._refill.wait(), self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check_health(self):
+        for conn in list(self._warm):
+            if conn.age >= self.max_age:
+                self._count("expired")
+            else:
+                try:
+                    pong = await conn.ws.ping()
+                    await asyncio.wait_for(pong, REALTIME_POOL_PING_TIMEOUT_S)
+                    continue
+                except Exception:
+                    self._count("unhealthy")
+            # may have been checked out while we were pinging
+            if conn in self._warm:
+                self._warm.remove(conn)
+                await self._discard(conn)
+
+    def _count(self, reason: str):
+        # a warm connection retired: expired, unhealthy or closed
+        setattr(self, reason, getattr(self, reason) + 1)
+        REALTIME_POOL_DISCARDED.labels(reason).inc()
+
+    @staticmethod
+    async def _discard(conn: _WarmConnection):
+        try:
+            await conn.ws.close()
+        except Exception:
+            pass
+
+
+class PoolStartupMiddleware:
+    """
+    ASGI wrapper that starts `pool` on the server's event loop before the
+    first call needs it: at lifespan startup where the server sends one,
+    otherwise on the first request of any kind (Daphne has no lifespan;
+    the load balancer's /healthz checks come in before calls do).
+    """
+
+    def __init__(self, app, pool: RealtimeConnectionPool):
+        self.app = app
+        self.pool = pool
+
+    async def __call__(self, scope, receive, send):
+        self.pool.start()
+        if scope["type"] != "lifespan":
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.pool.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
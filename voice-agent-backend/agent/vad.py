@@ -0,0 +1,102 @@
+# agent/vad.py
+import os
+from typing import List
+
+import numpy as np
+
+from .audio import UPSTREAM_SAMPLE_RATE, BYTES_PER_SAMPLE
+
+# turn detection: manual (push-to-talk) | server_vad (upstream) | local_vad (EnergyVAD)
+TURN_DETECTION = os.getenv("TURN_DETECTION", "manual")
+TURN_DETECTION_MODES = ("manual", "server_vad", "local_vad")
+
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "500"))
+VAD_PREFIX_PADDING_MS = int(os.getenv("VAD_PREFIX_PADDING_MS", "300"))
+# upstream server_vad threshold is 0..1; the local VAD works in dBFS
+VAD_SERVER_THRESHOLD = float(os.getenv("VAD_SERVER_THRESHOLD", "0.5"))
+VAD_ENERGY_THRESHOLD_DBFS = float(os.getenv("VAD_ENERGY_THRESHOLD_DBFS", "-45"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "100"))
+VAD_FRAME_MS = 20
+
+SPEECH_STARTED = "speech_started"
+SPEECH_STOPPED = "speech_stopped"
+
+
+class EnergyVAD:
+    """
+    Cheap energy-based voice activity detector over PCM16 mono.
+
+    Audio is cut into 20 ms frames; a frame is "loud" when its RMS is above
+    `threshold_dbfs`. Speech starts after `min_speech_ms` of consecutive loud
+    frames and stops after `silence_ms` of consecutive quiet ones.
+    process() returns the SPEECH_STARTED / SPEECH_STOPPED transitions found
+    in the chunk.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = UPSTREAM_SAMPLE_RATE,
+        threshold_dbfs: float = VAD_ENERGY_THRESHOLD_DBFS,
+        silence_ms: int = VAD_SILENCE_MS,
+        min_speech_ms: int = VAD_MIN_SPEECH_MS,
+    ):
+        self.frame_bytes = sample_rate * VAD_FRAME_MS // 1000 * BYTES_PER_SAMPLE
+        # compare mean square against the threshold, no sqrt/log per frame
+        self._threshold_ms = (32768.0 * 10 ** (threshold_dbfs / 20)) ** 2
+        self._start_frames = max(1, min_speech_ms // VAD_FRAME_MS)
+        self._stop_frames = max(1, silence_ms // VAD_FRAME_MS)
+
+        self._pending = b""
+        self._loud_run = 0
+        self._quiet_run = 0
+        self.in_speech = False
+        self.frames = 0
+
+    def process(self, pcm_bytes: bytes) -> List[str]:
+        data = self._pending + pcm_bytes
+        n_frames = len(data) // self.frame_bytes
+        used = n_frames * self.frame_bytes
+        self._pending = data[used:]
+        if not n_frames:
+            return []
+
+        samples = np.frombuffer(data[:used], dtype="<i2").astype(np.float32)
+        energy = np.mean(samples.reshape(n_frames, -1) ** 2, axis=1)
+        loud = energy > self._threshold_ms
+        self.frames += n_frames
+
+        events = []
+        for is_loud in loud.tolist():
+            if is_loud:
+                self._loud_run += 1
+                self._quiet_run = 0
+                if not self.in_speech and self._loud_run >= self._start_frames:
+                    self.in_speech = True
+                    events.append(SPEECH_STARTED)
+            else:
+                self._quiet_run += 1
+                self._loud_run = 0
+                if self.in_speech and self._quiet_run >= self._stop_frames:
+                    self.in_speech = False
+                    events.append(SPEECH_STOPPED)
+        return events
+
+    def reset(self):
+        self._pending = b""
+        self._loud_run = 0
+        self._quiet_run = 0
+        self.in_speech = False
+
+
+def turn_detection_config(mode: str):
+    """`turn_detection` value for session.update in the given mode."""
+    if mode == "server_vad":
+        return {
+            "type": "server_vad",
+            "threshold": VAD_SERVER_THRESHOLD,
+            "prefix_padding_ms": VAD_PREFIX_PADDING_MS,
+            "silence_duration_ms": VAD_SILENCE_MS,
+            "create_response": True,
+        }
+    # manual and local_vad: we decide when a turn ends and commit ourselves
+    return None
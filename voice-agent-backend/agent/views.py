@@ -1,3 +1,17 @@
-from django.shortcuts import render
+# agent/views.py
+from django.http import HttpResponse
 
-# Create your views here.
+from .drain import worker_drain
+from .metrics import REGISTRY
+
+
+def metrics(request):
+    # Prometheus text exposition format; this process's series only
+    return HttpResponse(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def healthz(request):
+    # 503 while draining, so the load balancer stops sending new calls here
+    if worker_drain.draining:
+        return HttpResponse("draining\n", status=503, content_type="text/plain")
+    return HttpResponse("ok\n", content_type="text/plain")
@@ -0,0 +1,35 @@
+"""
+Shared setup for benchmarks that need the Django app: a throwaway SQLite
+file (so the thread-pool DB hops see the same data) unless DB_PROFILE points
+at Postgres, the in-memory channel layer and migrations applied.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def setup_django(db_path=None, configure=None, migrate=True):
+    """configure(settings), if given, runs before django.setup()."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "voice_agent_backend.settings")
+
+    import django
+    from django.conf import settings
+
+    if settings.DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+        if db_path is None:
+            fd, db_path = tempfile.mkstemp(prefix="bench-", suffix=".sqlite3")
+            os.close(fd)
+        settings.DATABASES["default"]["NAME"] = db_path
+    if configure is not None:
+        configure(settings)
+    settings.CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+    django.setup()
+
+    from django.core.management import call_command
+
+    if migrate:
+        call_command("migrate", verbosity=0)
+    return db_path
@@ -0,0 +1,164 @@
+"""
+Per-call latency of the memory module's DB calls from the event loop:
+sync functions behind database_sync_to_async vs the same calls on the
+async ORM, under --sessions concurrent fake sessions.
+
+Each session does what a call does: upsert the user, read memories, open a
+ConversationSession, write --events events one at a time, build the
+transcript. Modes:
+
+  hop/1 thread   db_sync_to_async, thread_sensitive (DB_PROFILE=sqlite)
+  hop/pool       database_sync_to_async(thread_sensitive=False), the
+                 ASGI_THREADS pool (DB_PROFILE=postgres)
+  async ORM      the same queries on Django's async ORM (aget_or_create,
+                 async iteration, acreate) plus memory.aadd_event
+
+"sql %" is the share of call time spent executing SQL; the rest is waiting
+for a thread (saturation) and hand-off overhead. "threads" is how many
+distinct threads ran queries.
+
+    python benchmarks/bench_async_orm.py --sessions 1 10 50 --events 20
+"""
+import time
+import asyncio
+import threading
+import argparse
+import statistics
+from collections import defaultdict
+
+from _django import setup_django
+
+class SqlTimer:
+    """connection_created hook: times every query on every connection."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.threads = set()
+
+    def __call__(self, sender, connection, **kwargs):
+        if self.wrap not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self.wrap)
+
+    def wrap(self, execute, sql, params, many, context):
+        self.threads.add(threading.get_ident())
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+
+def sync_calls(thread_sensitive):
+    from channels.db import database_sync_to_async
+    from agent import memory
+
+    def hop(fn):
+        return database_sync_to_async(fn, thread_sensitive=thread_sensitive)
+
+    return {
+        "get_or_create_user": hop(memory.get_or_create_user),
+        "get_user_memories": hop(memory.get_user_memories),
+        "create_session": hop(memory.create_conversation_session),
+        "add_event": hop(memory.add_event),
+        "build_transcript": hop(memory.build_transcript),
+    }
+
+
+def async_calls():
+    from agent import memory
+    from agent.models import ConversationSession, UserMemory, UserProfile
+    from agent.transcript import format_turn, merge_turns
+
+    async def get_or_create_user(user_id):
+        user, _created = await UserProfile.objects.aget_or_create(id=user_id)
+        return user
+
+    async def get_user_memories(user_id, limit=20):
+        qs = (
+            UserMemory.objects.filter(user_id=user_id)
+            .order_by("-importance", "-updated_at")
+            .values_list("content", flat=True)[:limit]
+        )
+        return [content async for content in qs]
+
+    async def create_session(user):
+        return await ConversationSession.objects.acreate(user=user)
+
+    async def build_transcript(session):
+        events = [row async for row in session.events.order_by("seq").values_list("role", "content")]
+        return "\n".join(format_turn(role, text) for role, text in merge_turns(events))
+
+    return {
+        "get_or_create_user": get_or_create_user,
+        "get_user_memories": get_user_memories,
+        "create_session": create_session,
+        "add_event": memory.aadd_event,
+        "build_transcript": build_transcript,
+    }
+
+
+async def run_mode(calls, sessions, args, timer):
+    latencies = defaultdict(list)
+
+    async def timed(op, *a):
+        start = time.perf_counter()
+        result = await calls[op](*a)
+        latencies[op].append((time.perf_counter() - start) * 1000)
+        return result
+
+    async def session_loop(n):
+        user = await timed("get_or_create_user", f"bench-{n % args.users}")
+        await timed("get_user_memories", user.id)
+        session = await timed("create_session", user)
+        for e in range(args.events):
+            await timed("add_event", session, "user" if e % 2 == 0 else "assistant", f"turn {e}")
+        await timed("build_transcript", session)
+
+    sql_before = timer.seconds
+    timer.threads.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(session_loop(n) for n in range(sessions)))
+    wall = time.perf_counter() - start
+    call_ms = sum(sum(v) for v in latencies.values())
+    sql_share = (timer.seconds - sql_before) * 1000 / call_ms if call_ms else 0.0
+    return latencies, wall, sql_share, len(timer.threads)
+
+
+def report(label, sessions, latencies, wall, sql_share, threads):
+    add = sorted(latencies["add_event"])
+    calls = sum(len(v) for v in latencies.values())
+    print(
+        f"{label:14s} {sessions:8d} {calls / wall:9.0f} "
+        f"{statistics.median(add):8.2f} {add[int(len(add) * 0.99)]:8.2f} "
+        f"{statistics.median(latencies['get_user_memories']):8.2f} "
+        f"{sql_share * 100:6.0f} {threads:7d}"
+    )
+
+
+async def main(args):
+    from django.db.backends.signals import connection_created
+
+    timer = SqlTimer()
+    connection_created.connect(timer)
+    modes = [
+        ("hop/1 thread", lambda: sync_calls(True)),
+        ("hop/pool", lambda: sync_calls(False)),
+        ("async ORM", async_calls),
+    ]
+    print(
+        f"{'mode':14s} {'sessions':>8s} {'calls/s':>9s} {'add p50':>8s} {'add p99':>8s} "
+        f"{'mem p50':>8s} {'sql %':>6s} {'threads':>7s}   (ms)"
+    )
+    for sessions in args.sessions:
+        for label, make_calls in modes:
+            report(label, sessions, *await run_mode(make_calls(), sessions, args, timer))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--events", type=int, default=20, help="per session, written one at a time")
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    asyncio.run(main(args))
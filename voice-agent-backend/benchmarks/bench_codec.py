@@ -0,0 +1,80 @@
+"""
+Bandwidth / CPU comparison of the /ws/voice/ audio transports.
+
+Raw PCM16 @ 24 kHz vs. Opus (agent.codecs) at a few bitrates, over N seconds
+of synthetic voiced audio. Bandwidth includes a 6-byte WebSocket frame header
+per binary message so the numbers are comparable with what hits the wire.
+
+    python benchmarks/bench_codec.py --seconds 20
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.audio import UPSTREAM_SAMPLE_RATE  # noqa: E402
+from agent.codecs import OPUS_AVAILABLE, OpusSessionCodec  # noqa: E402
+
+WS_FRAME_OVERHEAD = 6
+BITRATES = (12000, 24000, 32000, 64000)
+# what the bridge typically hands us per response.audio.delta
+CHUNK_BYTES = 4800
+
+
+def synthetic_speech(seconds):
+    rate = UPSTREAM_SAMPLE_RATE
+    t = np.arange(rate * seconds) / rate
+    # a few harmonics with a syllable-rate envelope, plus a little noise
+    f0 = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)).clip(0.1)
+    noise = np.random.default_rng(0).standard_normal(len(t)) * 0.02
+    return (6000 * (voiced * envelope + noise)).astype("<i2").tobytes()
+
+
+def bench_pcm(pcm, seconds):
+    messages = -(-len(pcm) // CHUNK_BYTES)
+    wire = len(pcm) + messages * WS_FRAME_OVERHEAD
+    return wire * 8 / seconds / 1000, 0.0
+
+
+def bench_opus(pcm, seconds, bitrate):
+    codec = OpusSessionCodec(bitrate)
+    start = time.process_time()
+    packets = []
+    for i in range(0, len(pcm), CHUNK_BYTES):
+        packets.extend(codec.encode(pcm[i:i + CHUNK_BYTES]))
+    packets.extend(codec.flush()[0])
+    for p in packets:
+        codec.decode(p)
+    cpu_ms = (time.process_time() - start) * 1000 / seconds
+    wire = sum(len(p) + WS_FRAME_OVERHEAD for p in packets)
+    return wire * 8 / seconds / 1000, cpu_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=20)
+    args = parser.parse_args()
+
+    pcm = synthetic_speech(args.seconds)
+    kbps, _ = bench_pcm(pcm, args.seconds)
+    print(f"{'transport':18s} {'kbit/s':>9s} {'CPU ms/s audio':>15s}")
+    print(f"{'pcm16 24k':18s} {kbps:9.1f} {'-':>15s}")
+
+    if not OPUS_AVAILABLE:
+        print("opus: skipped (opuslib / libopus not installed)")
+        return
+    for bitrate in BITRATES:
+        kbps, cpu_ms = bench_opus(pcm, args.seconds, bitrate)
+        label = f"opus {bitrate // 1000}k"
+        print(f"{label:18s} {kbps:9.1f} {cpu_ms:15.2f}")
+
+
+if __name__ == "__main__":
+    main()
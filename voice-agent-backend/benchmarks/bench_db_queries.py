@@ -0,0 +1,155 @@
+"""
+Hot agent queries before and after migration 0004 (composite indexes and
+the per-session event seq), over a seeded dataset: --events conversation
+events spread over sessions of --events-per-session, plus --memories-per-user
+memories for --users users.
+
+The DB is migrated to 0003, seeded, measured, migrated forward (timed: it
+backfills seq for every event) and measured again. EXPLAIN plans for each
+query are printed for both states.
+
+    python benchmarks/bench_db_queries.py --events 1000000
+    python benchmarks/bench_db_queries.py --db /path/to/existing.sqlite3   # SQLite file to use
+"""
+import time
+import random
+import argparse
+import statistics
+from datetime import datetime, timedelta, timezone
+
+from _django import setup_django
+
+BEFORE = {
+    "top memories": (
+        "SELECT id, content FROM agent_usermemory WHERE user_id = %s "
+        "ORDER BY importance DESC, updated_at DESC LIMIT 20",
+        "user",
+    ),
+    "memory version": (
+        "SELECT COUNT(id), MAX(updated_at) FROM agent_usermemory WHERE user_id = %s",
+        "user",
+    ),
+    "transcript": (
+        "SELECT role, content FROM agent_conversationevent WHERE session_id = %s ORDER BY created_at",
+        "session",
+    ),
+}
+AFTER = dict(
+    BEFORE,
+    transcript=(
+        "SELECT role, content FROM agent_conversationevent WHERE session_id = %s ORDER BY seq",
+        "session",
+    ),
+    **{
+        "next seq": (
+            "SELECT MAX(seq) FROM agent_conversationevent WHERE session_id = %s",
+            "session",
+        )
+    },
+)
+
+
+def seed(args):
+    from django.db import connection, transaction
+
+    rng = random.Random(args.seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    sessions = max(1, args.events // args.events_per_session)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO agent_userprofile (id, created_at) VALUES (%s, %s)",
+            [(f"user-{u}", start) for u in range(args.users)],
+        )
+        cursor.executemany(
+            "INSERT INTO agent_usermemory (user_id, type, content, importance, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (
+                (
+                    f"user-{u}", "fact", f"memory {m} of user {u}", rng.randint(1, 10),
+                    start + timedelta(minutes=m), start + timedelta(minutes=m + rng.randint(0, 5000)),
+                )
+                for u in range(args.users)
+                for m in range(args.memories_per_user)
+            ),
+        )
+        cursor.executemany(
+            "INSERT INTO agent_conversationsession (id, user_id, started_at) VALUES (%s, %s, %s)",
+            [(s + 1, f"user-{s % args.users}", start + timedelta(hours=s)) for s in range(sessions)],
+        )
+        cursor.executemany(
+            "INSERT INTO agent_conversationevent (session_id, role, content, created_at) "
+            "VALUES (%s, %s, %s, %s)",
+            (
+                # bulk-written turns: timestamps tie within a flush
+                (s + 1, "user" if e % 2 == 0 else "assistant", f"turn {e}",
+                 start + timedelta(hours=s, seconds=e // 4))
+                for s in range(sessions)
+                for e in range(args.events_per_session)
+            ),
+        )
+    return sessions
+
+
+def explain(sql, param):
+    from django.db import connection
+
+    prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, [param])
+        rows = cursor.fetchall()
+    # sqlite: (id, parent, notused, detail); postgres: (line,)
+    return [row[-1] for row in rows]
+
+
+def measure(label, queries, args, sessions):
+    from django.db import connection
+
+    rng = random.Random(args.seed + 1)
+    keys = {
+        "user": [f"user-{rng.randrange(args.users)}" for _ in range(args.samples)],
+        "session": [rng.randrange(sessions) + 1 for _ in range(args.samples)],
+    }
+    print(f"\n== {label}")
+    for name, (sql, key) in queries.items():
+        samples = []
+        with connection.cursor() as cursor:
+            for param in keys[key]:
+                t0 = time.perf_counter()
+                cursor.execute(sql, [param])
+                cursor.fetchall()
+                samples.append((time.perf_counter() - t0) * 1000)
+        print(f"{name:15s} median {statistics.median(samples):8.3f} ms   max {max(samples):8.3f} ms")
+        for line in explain(sql, keys[key][0]):
+            print(f"{'':15s}   {line}")
+
+
+def main(args):
+    from django.core.management import call_command
+
+    call_command("migrate", "agent", "0003", verbosity=0)
+    t0 = time.perf_counter()
+    sessions = seed(args)
+    print(
+        f"seeded {args.events} events in {sessions} sessions, "
+        f"{args.users * args.memories_per_user} memories in {time.perf_counter() - t0:.1f} s"
+    )
+
+    measure("before (0003)", BEFORE, args, sessions)
+    t0 = time.perf_counter()
+    call_command("migrate", "agent", verbosity=0)
+    print(f"\nmigrate to latest (indexes + seq backfill): {time.perf_counter() - t0:.1f} s")
+    measure("after", AFTER, args, sessions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="SQLite file to use (default: a temp file)")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--events-per-session", type=int, default=100)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--memories-per-user", type=int, default=100)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    setup_django(args.db)
+    main(args)
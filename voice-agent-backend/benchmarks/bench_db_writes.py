@@ -0,0 +1,128 @@
+"""
+Event write throughput and lock errors per database profile.
+
+Runs --procs worker processes (standing in for Daphne workers sharing one
+database), each with --sessions fake sessions. Every session bootstraps
+like VoiceConsumer.connect and then writes a turn every --turn-ms through
+EventWriteBuffer, flushing every --flush-events turns, for --seconds.
+
+  sqlite-legacy  the old settings: rollback journal, deferred transactions
+  sqlite         the DB_PROFILE=sqlite defaults: WAL, busy_timeout,
+                 synchronous=NORMAL, BEGIN IMMEDIATE
+  postgres       whatever DB_PROFILE=postgres + POSTGRES_* point at
+
+    python benchmarks/bench_db_writes.py --profiles sqlite-legacy sqlite --procs 4 --sessions 25
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from _django import setup_django
+
+
+def setup_profile(profile, db_path, migrate=True):
+    def configure(settings):
+        if profile == "sqlite-legacy":
+            settings.DATABASES["default"]["OPTIONS"] = {}
+            settings.SQLITE_PRAGMAS = {}
+
+    setup_django(db_path, configure, migrate=migrate)
+
+
+async def run_sessions(args, worker):
+    from django.db import OperationalError
+    from agent.db import db_sync_to_async
+    from agent.event_buffer import EventWriteBuffer
+    from agent.memory import aadd_events, bootstrap_session
+
+    counts = {"events": 0, "lock_errors": 0, "other_errors": 0}
+    latencies = []
+
+    async def write(session, batch):
+        start = time.perf_counter()
+        try:
+            await aadd_events(session, batch)
+        except OperationalError as e:
+            counts["lock_errors" if "locked" in str(e) else "other_errors"] += 1
+            raise
+        latencies.append((time.perf_counter() - start) * 1000)
+        counts["events"] += len(batch)
+
+    async def session_loop(n):
+        try:
+            session, _ = await db_sync_to_async(bootstrap_session)(f"load-{worker}-{n}")
+        except OperationalError as e:
+            counts["lock_errors" if "locked" in str(e) else "other_errors"] += 1
+            return
+        events = EventWriteBuffer(session, write=write, max_events=args.flush_events, interval_ms=1000)
+        deadline = time.perf_counter() + args.seconds
+        turn = 0
+        while time.perf_counter() < deadline:
+            events.add("user" if turn % 2 == 0 else "assistant", f"turn {turn} " * 20)
+            turn += 1
+            await asyncio.sleep(args.turn_ms / 1000)
+        await events.drain()
+
+    await asyncio.gather(*(session_loop(n) for n in range(args.sessions)))
+    counts["latencies"] = latencies
+    return counts
+
+
+def worker_main(profile, db_path, args, worker):
+    import builtins
+
+    setup_profile(profile, db_path, migrate=False)
+    builtins.print = lambda *a, **kw: None  # EventWriteBuffer logs every failed flush
+    return asyncio.run(run_sessions(args, worker))
+
+
+def run_profile(profile, args):
+    db_path = None
+    if profile.startswith("sqlite"):
+        fd, db_path = tempfile.mkstemp(prefix=f"bench-{profile}-", suffix=".sqlite3")
+        os.close(fd)
+    # migrate once, up front, with the profile's own pragmas
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+        pool.submit(setup_profile, profile, db_path).result()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.procs, mp_context=ctx) as pool:
+        results = list(pool.map(worker_main, *zip(*[(profile, db_path, args, w) for w in range(args.procs)])))
+    elapsed = time.perf_counter() - start
+
+    events = sum(r["events"] for r in results)
+    latencies = sorted(l for r in results for l in r["latencies"]) or [0.0]
+    print(
+        f"{profile:14s} {events:8d} {events / elapsed:9.0f} "
+        f"{statistics.median(latencies):8.1f} {latencies[int(len(latencies) * 0.99)]:8.1f} "
+        f"{sum(r['lock_errors'] for r in results):7d} {sum(r['other_errors'] for r in results):7d}"
+    )
+    if db_path:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", nargs="+", default=["sqlite-legacy", "sqlite"])
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=25, help="per process")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--turn-ms", type=int, default=200)
+    parser.add_argument("--flush-events", type=int, default=1)
+    args = parser.parse_args()
+
+    print(
+        f"{args.procs} procs x {args.sessions} sessions, a turn every {args.turn_ms} ms "
+        f"for {args.seconds:.0f} s, flush every {args.flush_events}"
+    )
+    print(f"{'profile':14s} {'events':>8s} {'events/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'locked':>7s} {'other':>7s}")
+    for profile in args.profiles:
+        run_profile(profile, args)
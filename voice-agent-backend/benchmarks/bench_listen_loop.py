@@ -0,0 +1,196 @@
+"""
+Replay an upstream Realtime event stream through RealtimeBridge._listen_loop
+and report events/s and transient memory per event.
+
+The stream is --responses synthetic replies shaped like the real service
+(compact JSON, a 100 ms audio delta plus a transcript delta per chunk), or
+a recorded one: --stream file with one raw message per line (--save writes
+the synthetic stream in that format).
+
+  legacy           the old loop: json.loads, if/elif chain, print per event
+  dispatch/json    table dispatch, stdlib json, audio fast path
+  dispatch/orjson  same with orjson (if installed)
+  ... no fast path audio deltas through the JSON parser as well
+  ... recorded     with a session recorder attached (agent.recorder),
+                   writing to a temporary file
+
+"KiB/event" is the tracemalloc peak above the baseline while one message
+is handled (Python has no allocation counter), averaged over the stream.
+
+    python benchmarks/bench_listen_loop.py --responses 200
+"""
+import io
+import time
+import json
+import base64
+import tempfile
+import asyncio
+import argparse
+import tracemalloc
+import contextlib
+from unittest.mock import patch
+
+import numpy as np
+
+from _django import setup_django
+
+SAMPLE_RATE = 24000
+
+
+def synthetic_stream(responses, chunk_ms=100, chunks=20):
+    audio = (4000 * np.sin(np.arange(SAMPLE_RATE * chunk_ms // 1000) / 10)).astype("<i2").tobytes()
+    b64 = base64.b64encode(audio).decode()
+    dumps = lambda e: json.dumps(e, separators=(",", ":"))  # noqa: E731
+    out, n = [], 0
+    for r in range(responses):
+        rid, iid = f"resp_{r}", f"item_{r}"
+        ids = {"response_id": rid, "item_id": iid, "output_index": 0, "content_index": 0}
+        out.append(dumps({"type": "response.created", "event_id": f"ev_{n}", "response": {"id": rid}}))
+        for c in range(chunks):
+            n += 2
+            out.append(dumps({"type": "response.audio_transcript.delta", "event_id": f"ev_{n}", **ids, "delta": "word "}))
+            out.append(dumps({"type": "response.audio.delta", "event_id": f"ev_{n + 1}", **ids, "delta": b64}))
+        out.append(dumps({"type": "response.audio.done", **ids}))
+        out.append(dumps({"type": "response.audio_transcript.done", **ids, "transcript": "word " * chunks}))
+        out.append(dumps({"type": "rate_limits.updated", "rate_limits": []}))
+        out.append(dumps({"type": "response.done", "response": {"id": rid, "status": "completed"}}))
+    return out
+
+
+class ReplaySocket:
+    def __init__(self, messages, measure=False):
+        self._it = iter(messages)
+        self.measure = measure
+        self.peaks = []
+        self._base = 0
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.measure:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._base:
+                self.peaks.append(peak - self._base)
+            tracemalloc.reset_peak()
+            self._base = current
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+async def legacy_listen_loop(self):
+    # the loop as it was before the dispatcher (state handling trimmed to match)
+    async for msg in self.ws:
+        event = json.loads(msg)
+        etype = event.get("type")
+        print("REALTIME EVENT:", etype)
+        if etype == "response.created":
+            self.response_id = event["response"]["id"]
+            continue
+        elif etype == "response.done":
+            if self.response_id == event["response"]["id"]:
+                self.response_id = None
+            continue
+        elif self._cancelled_response_id is not None and event.get("response_id") == self._cancelled_response_id:
+            continue
+        if etype == "response.audio_transcript.delta":
+            await self.on_text(event["delta"], False)
+        elif etype == "response.audio_transcript.done":
+            await self.on_text("", True)
+        elif etype == "response.audio.delta":
+            if event.get("item_id") != self.audio_item_id:
+                self.audio_item_id = event.get("item_id")
+                self.played_bytes = 0
+            await self.on_audio_chunk(base64.b64decode(event["delta"]))
+        elif etype == "response.audio.done":
+            print("AUDIO DONE")
+            if self.on_audio_done is not None:
+                await self.on_audio_done()
+        else:
+            print("UNHANDLED EVENT:", event)
+
+
+def make_bridge():
+    from agent.realtime_bridge import RealtimeBridge
+
+    async def on_text(text, is_final):
+        pass
+
+    async def on_audio_chunk(pcm):
+        pass
+
+    return RealtimeBridge("bench", on_text=on_text, on_audio_chunk=on_audio_chunk)
+
+
+async def replay(messages, loop_fn, measure, record=False):
+    from agent.recorder import SessionRecorder
+
+    bridge = make_bridge()
+    bridge.ws = ReplaySocket(messages, measure)
+    if record:
+        bridge.recorder = SessionRecorder(tempfile.mktemp(suffix=".vrec"))
+    start = time.perf_counter()
+    # legacy prints go to a buffer, which is cheaper than a real stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        await loop_fn(bridge)
+    elapsed = time.perf_counter() - start
+    if record:
+        bridge.recorder.close()
+    return elapsed, bridge.ws.peaks
+
+
+def run_mode(label, messages, loop_fn, backend=None, fast_path=True, record=False, repeat=3):
+    from agent import fastjson, realtime_bridge
+
+    loads = {"json": json.loads}
+    if fastjson.ORJSON_AVAILABLE:
+        loads["orjson"] = fastjson.orjson.loads
+    with contextlib.ExitStack() as stack:
+        if backend is not None:
+            stack.enter_context(patch.object(fastjson, "loads", loads[backend]))
+        if not fast_path:
+            stack.enter_context(patch.object(realtime_bridge, "parse_audio_delta", lambda msg: None))
+        best = min(asyncio.run(replay(messages, loop_fn, False, record))[0] for _ in range(repeat))
+        tracemalloc.start()
+        try:
+            _, peaks = asyncio.run(replay(messages, loop_fn, True, record))
+        finally:
+            tracemalloc.stop()
+    print(f"{label:30s} {len(messages) / best:12,.0f} {sum(peaks) / len(peaks) / 1024:10.1f}")
+
+
+def main(args):
+    from agent import fastjson
+    from agent.realtime_bridge import RealtimeBridge
+
+    if args.stream:
+        with open(args.stream) as f:
+            messages = [line.rstrip("\n") for line in f if line.strip()]
+    else:
+        messages = synthetic_stream(args.responses)
+    if args.save:
+        with open(args.save, "w") as f:
+            f.writelines(m + "\n" for m in messages)
+    audio = sum('"response.audio.delta"' in m[:40] for m in messages)
+    print(f"{len(messages)} messages, {audio} audio deltas, {sum(map(len, messages)) / 1e6:.1f} MB")
+    print(f"{'loop':30s} {'events/s':>12s} {'KiB/event':>10s}")
+
+    new_loop = RealtimeBridge._listen_loop
+    run_mode("legacy", messages, legacy_listen_loop)
+    backends = ["json"] + (["orjson"] if fastjson.ORJSON_AVAILABLE else [])
+    for backend in backends:
+        run_mode(f"dispatch/{backend} no fast path", messages, new_loop, backend, fast_path=False)
+        run_mode(f"dispatch/{backend}", messages, new_loop, backend)
+        run_mode(f"dispatch/{backend} recorded", messages, new_loop, backend, record=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--responses", type=int, default=200)
+    parser.add_argument("--stream", help="recorded stream, one raw message per line")
+    parser.add_argument("--save", help="write the replayed stream here")
+    args = parser.parse_args()
+    setup_django()
+    main(args)
@@ -0,0 +1,414 @@
+"""
+Offline load test: the app under Daphne, talking to the local fake Realtime
+server (agent/fake_realtime.py, its own process), driven by --sessions
+concurrent /ws/voice/ clients. Each client streams a recorded utterance in
+real time (--pcm: .wav or raw PCM16 mono at --rate; synthetic by default),
+sends stop_speaking and takes the reply, --turns times.
+
+Reports, as JSON (stdout or --out):
+  connect_ms      socket open -> "ready"
+  first_audio_ms  stop_speaking -> first reply audio byte
+  turn_ms         stop_speaking -> final transcript delta
+  throughput      turns/s and audio bytes/s both ways
+  server          Daphne CPU and RSS (/proc, so Linux only), in total and
+                  per session; summed over the processes with --workers N
+                  (manage.py runworkers)
+  rejected        sessions turned away by admission control, by reason
+                  (agent.admission, e.g. ADMISSION_MAX_SESSIONS=20 in the
+                  environment); not failed, and not in the latencies
+  server_side_ms  mean latencies the server measured itself (from /metrics,
+                  so from one of the workers when there are several);
+                  first_audio well below the client's means time lost queueing
+                  on the way in or out rather than in the consumer or upstream
+--compare old.json prints the change of every number against an earlier run.
+
+    python benchmarks/bench_load.py --sessions 50 --turns 3 --out load.json
+    python benchmarks/bench_load.py --sessions 50 --turns 3 --compare load.json
+
+--server-url ws://host:port/ws/voice/ drives a server started elsewhere
+(pointed at the fake by OPENAI_REALTIME_URL); server stats are then left out.
+"""
+import os
+import re
+import sys
+import json
+import time
+import wave
+import signal
+import socket
+import asyncio
+import argparse
+import subprocess
+import urllib.request
+from urllib.parse import urlsplit
+
+import websockets
+
+from _django import BACKEND_DIR, setup_django
+from bench_turn_latency import synthetic_utterance
+
+FRAME_MS = 20
+# agent.admission.CLOSE_CODES
+REFUSED = {4029: "busy", 4030: "rate_limited", 4031: "user_limit"}
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def load_pcm(path, rate):
+    if path is None:
+        return synthetic_utterance(rate), rate
+    if path.endswith(".wav"):
+        with wave.open(path) as w:
+            assert w.getsampwidth() == 2 and w.getnchannels() == 1, "need 16-bit mono"
+            return w.readframes(w.getnframes()), w.getframerate()
+    with open(path, "rb") as f:
+        return f.read(), rate
+
+
+def proc_sample(*pids):
+    """(CPU seconds, RSS bytes) of processes, summed."""
+    cpu = rss = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+        with open(f"/proc/{pid}/status") as f:
+            rss += next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+    return cpu, rss
+
+
+def child_pids(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(p) for p in f.read().split()]
+
+
+def metrics_url(ws_url):
+    parts = urlsplit(ws_url)
+    return f"{'https' if parts.scheme == 'wss' else 'http'}://{parts.netloc}/metrics"
+
+
+def scrape_latencies(url):
+    """_sum and _count of the server's latency histograms, from /metrics."""
+    try:
+        text = urllib.request.urlopen(url, timeout=5).read().decode()
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        name, _, value = line.rpartition(" ")
+        if name.startswith("voice_") and name.split("{")[0].endswith(("_seconds_sum", "_seconds_count")):
+            values[name] = float(value)
+    return values
+
+
+def server_side_ms(before, after):
+    means = {}
+    for name, total in after.items():
+        if "_seconds_sum" not in name:
+            continue
+        count = name.replace("_seconds_sum", "_seconds_count")
+        n = after.get(count, 0) - before.get(count, 0)
+        if n:
+            # voice_connect_phase_seconds_sum{phase="db"} -> connect_phase.db
+            key = re.sub(r'\{\w+="([^"]*)"\}', r".\1", name.replace("voice_", "").replace("_seconds_sum", ""))
+            means[key] = round((total - before.get(name, 0)) / n * 1000, 1)
+    return means
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))]  # noqa: E731
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": round(pick(0.5), 1),
+        "p90": round(pick(0.9), 1),
+        "p99": round(pick(0.99), 1),
+        "max": round(values[-1], 1),
+    }
+
+
+class Session:
+    def __init__(self):
+        self.connect_ms = None
+        self.first_audio_ms = []
+        self.turn_ms = []
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self.error = None
+        self.rejected = None
+
+
+async def run_session(n, url, pcm, rate, args, start_at):
+    s = Session()
+    await asyncio.sleep(max(0, start_at - time.perf_counter()))
+    try:
+        opened = time.perf_counter()
+        async with websockets.connect(f"{url}?user_id=load-{n}", max_size=None) as ws:
+            await ws.send(json.dumps({"type": "start_session", "sample_rate": rate, "codec": "pcm16"}))
+            while True:
+                msg = await asyncio.wait_for(ws.recv(), args.timeout)
+                if isinstance(msg, str) and json.loads(msg).get("type") == "ready":
+                    break
+            s.connect_ms = (time.perf_counter() - opened) * 1000
+
+            frame = rate * FRAME_MS // 1000 * 2
+            for _ in range(args.turns):
+                start = time.perf_counter()
+                for i, offset in enumerate(range(0, len(pcm), frame)):
+                    await ws.send(pcm[offset:offset + frame])
+                    s.bytes_up += len(pcm[offset:offset + frame])
+                    await asyncio.sleep(max(0, start + (i + 1) * FRAME_MS / 1000 - time.perf_counter()))
+                stopped = time.perf_counter()
+                await ws.send(json.dumps({"type": "stop_speaking"}))
+                first_audio = None
+                while True:
+                    msg = await asyncio.wait_for(ws.recv(), args.timeout)
+                    if isinstance(msg, bytes):
+                        s.bytes_down += len(msg)
+                        if first_audio is None:
+                            first_audio = time.perf_counter()
+                        continue
+                    event = json.loads(msg)
+                    if event.get("type") == "ai_text_delta" and event.get("is_final"):
+                        break
+                done = time.perf_counter()
+                if first_audio is not None:
+                    s.first_audio_ms.append((first_audio - stopped) * 1000)
+                s.turn_ms.append((done - stopped) * 1000)
+                await asyncio.sleep(args.think_ms / 1000)
+    except websockets.ConnectionClosed as e:
+        if e.rcvd is not None and e.rcvd.code in REFUSED:
+            s.rejected = REFUSED[e.rcvd.code]
+        else:
+            s.error = f"{type(e).__name__}: {e}"[:200]
+    except Exception as e:
+        s.error = f"{type(e).__name__}: {e}"[:200]
+    return s
+
+
+async def sample_rss(pids, peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], proc_sample(*pids)[1])
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def drive(url, pcm, rate, args, server_pids=(), fake_pid=None):
+    peak, stop = [0], asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(server_pids, peak, stop)) if server_pids else None
+    before = proc_sample(*server_pids) if server_pids else None
+    fake_before = proc_sample(fake_pid)[0] if fake_pid else None
+    driver_before = time.process_time()
+    scraped = scrape_latencies(metrics_url(url))
+
+    wall = time.perf_counter()
+    # connects spread over --ramp-s
+    step = args.ramp_s / max(1, args.sessions - 1) if args.sessions > 1 else 0
+    sessions = await asyncio.gather(
+        *(run_session(n, url, pcm, rate, args, wall + n * step) for n in range(args.sessions))
+    )
+    wall = time.perf_counter() - wall
+    # if either of these is near 100%, the harness and not the server is the limit
+    harness = {"driver_cpu_pct_of_core": round((time.process_time() - driver_before) / wall * 100, 1)}
+    if fake_pid:
+        harness["fake_upstream_cpu_pct_of_core"] = round((proc_sample(fake_pid)[0] - fake_before) / wall * 100, 1)
+
+    harness["server_side_ms"] = server_side_ms(scraped, scrape_latencies(metrics_url(url)))
+
+    server = None
+    if server_pids:
+        stop.set()
+        await sampler
+        cpu = proc_sample(*server_pids)[0] - before[0]
+        ok = max(1, sum(s.error is None and s.rejected is None for s in sessions))
+        server = {
+            "cpu_s": round(cpu, 2),
+            "processes": len(server_pids),
+            "cpu_pct_of_core": round(cpu / wall * 100, 1),
+            "cpu_ms_per_session": round(cpu / ok * 1000, 1),
+            "rss_idle_mb": round(before[1] / 2**20, 1),
+            "rss_peak_mb": round(peak[0] / 2**20, 1),
+            "rss_kb_per_session": round((peak[0] - before[1]) / ok / 1024, 1),
+        }
+    return sessions, wall, server, harness
+
+
+def report(sessions, wall, server, harness, args):
+    ok = [s for s in sessions if s.error is None]
+    rejected = {}
+    for s in sessions:
+        if s.rejected is not None:
+            rejected[s.rejected] = rejected.get(s.rejected, 0) + 1
+    errors = {}
+    for s in sessions:
+        if s.error is not None:
+            errors[s.error] = errors.get(s.error, 0) + 1
+    turns = sum(len(s.turn_ms) for s in sessions)
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "sessions": len(sessions),
+        "failed": len(sessions) - len(ok),
+        "errors": errors,
+        "rejected": rejected,
+        "wall_s": round(wall, 2),
+        "connect_ms": percentiles([s.connect_ms for s in sessions if s.connect_ms is not None]),
+        "first_audio_ms": percentiles([v for s in sessions for v in s.first_audio_ms]),
+        "turn_ms": percentiles([v for s in sessions for v in s.turn_ms]),
+        "throughput": {
+            "turns": turns,
+            "turns_per_s": round(turns / wall, 2),
+            "audio_up_bytes_per_s": round(sum(s.bytes_up for s in sessions) / wall),
+            "audio_down_bytes_per_s": round(sum(s.bytes_down for s in sessions) / wall),
+        },
+    }
+    if server is not None:
+        result["server"] = server
+    result["server_side_ms"] = harness.pop("server_side_ms")
+    result["harness"] = harness
+    return result
+
+
+def flatten(d, prefix=""):
+    for key, value in d.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(old, new):
+    old = dict(flatten({k: v for k, v in old.items() if k != "config"}))
+    lines = []
+    for key, value in flatten({k: v for k, v in new.items() if k != "config"}):
+        if key in old and old[key]:
+            lines.append(f"{key:40s} {old[key]:>12} {value:>12} {(value - old[key]) / old[key] * 100:+7.1f}%")
+        elif key in old:
+            lines.append(f"{key:40s} {old[key]:>12} {value:>12}")
+    return "\n".join(lines)
+
+
+class Processes:
+    """The fake upstream and Daphne (or `runworkers` with --workers), each in its own process."""
+
+    def __init__(self, args, db_path):
+        self.args = args
+        self.db_path = db_path
+        self.fake = self.server = None
+        self.url = None
+        self.server_pids = []
+
+    def __enter__(self):
+        a = self.args
+        self.fake = subprocess.Popen(
+            [
+                sys.executable, "-m", "agent.fake_realtime", "--port", "0",
+                "--first-audio-ms", str(a.first_audio_ms), "--reply-ms", str(a.reply_ms),
+                "--chunk-ms", str(a.chunk_ms), "--speed", str(a.speed),
+                "--words-per-s", str(a.words_per_s),
+            ],
+            cwd=BACKEND_DIR,
+            stdout=subprocess.PIPE,
+            stderr=None if a.server_output else subprocess.DEVNULL,
+            text=True,
+        )
+        fake_url = self.fake.stdout.readline().strip()
+
+        port = free_port()
+        env = dict(
+            os.environ,
+            OPENAI_REALTIME_URL=fake_url,
+            SQLITE_PATH=self.db_path or "",
+            CHANNEL_LAYER="memory",
+            LOG_LEVEL=a.log_level,
+        )
+        if a.workers > 1:
+            command = ["manage.py", "runworkers", "--workers", str(a.workers), "--port", str(port)]
+        else:
+            command = ["-m", "daphne", "-b", "127.0.0.1", "-p", str(port), "voice_agent_backend.asgi:application"]
+        self.server = subprocess.Popen(
+            [sys.executable, *command],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=None if a.server_output else subprocess.DEVNULL,
+        )
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline or self.server.poll() is not None:
+                    self.__exit__()
+                    raise SystemExit("Daphne did not come up")
+                time.sleep(0.2)
+        if a.workers > 1:
+            while len(child_pids(self.server.pid)) < a.workers:
+                time.sleep(0.2)
+            time.sleep(2)  # the others to be listening too
+            self.server_pids = child_pids(self.server.pid)
+        else:
+            self.server_pids = [self.server.pid]
+        self.url = f"ws://127.0.0.1:{port}/ws/voice/"
+        return self
+
+    def __exit__(self, *exc):
+        for proc in (self.server, self.fake):
+            if proc is not None and proc.poll() is None:
+                proc.send_signal(signal.SIGINT)
+                proc.wait(30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=2, help="turns per session")
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="spread the connects over this long")
+    parser.add_argument("--think-ms", type=int, default=500, help="pause after each reply")
+    parser.add_argument("--pcm", help="utterance: .wav or raw PCM16 mono at --rate")
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--timeout", type=float, default=30)
+    # fake upstream pacing
+    parser.add_argument("--first-audio-ms", type=int, default=300)
+    parser.add_argument("--reply-ms", type=int, default=2000)
+    parser.add_argument("--chunk-ms", type=int, default=100)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--words-per-s", type=float, default=5)
+    # server
+    parser.add_argument("--workers", type=int, default=1, help=">1: manage.py runworkers instead of one Daphne")
+    parser.add_argument("--server-url", help="drive this server instead of starting Daphne")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--server-output", action="store_true", help="show Daphne's and the fake's stderr")
+    parser.add_argument("--out", help="write the JSON result here")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    pcm, rate = load_pcm(args.pcm, args.rate)
+    if args.server_url:
+        sessions, wall, server, harness = asyncio.run(drive(args.server_url, pcm, rate, args))
+    else:
+        db_path = setup_django()
+        with Processes(args, db_path) as procs:
+            sessions, wall, server, harness = asyncio.run(
+                drive(procs.url, pcm, rate, args, procs.server_pids, procs.fake.pid)
+            )
+    result = report(sessions, wall, server, harness, args)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            print(f"\n{'':40s} {'before':>12} {'after':>12}\n" + compare(json.load(f), result))
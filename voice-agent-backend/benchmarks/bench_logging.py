@@ -0,0 +1,145 @@
+"""
+CPU cost of per-session logging: --sessions concurrent callers through
+VoiceConsumer against the local fake upstream, each streaming --seconds of
+audio in 20 ms frames (real-time paced), asking for a reply and taking it.
+
+Reports process CPU for the run and, from cProfile, the share spent in
+print() and the logging module, plus event loop lag (how late a 10 ms
+ticker wakes up). stdout/stderr go to /dev/null (or --log-file);
+--sink-delay-ms makes every write to them take that long, standing in for
+a slow log pipe.
+
+    python benchmarks/bench_logging.py --sessions 50 --seconds 5 [--sink-delay-ms 1]
+"""
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import argparse
+import cProfile
+
+import numpy as np
+
+from _django import setup_django
+
+FRAME_MS = 20
+RATE = 16000
+
+
+async def session(n, args):
+    from channels.testing import WebsocketCommunicator
+    from agent.consumers import VoiceConsumer
+
+    comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), f"/ws/voice/?user_id=bench-{n}")
+    await comm.connect()
+    await comm.send_json_to({"type": "start_session", "sample_rate": RATE, "codec": "pcm16"})
+    while (await comm.receive_json_from(timeout=30)).get("type") != "ready":
+        pass
+
+    t = np.arange(RATE * FRAME_MS // 1000) / RATE
+    frame = (6000 * np.sin(2 * np.pi * 200 * t)).astype("<i2").tobytes()
+    start = time.perf_counter()
+    for i in range(args.seconds * 1000 // FRAME_MS):
+        await comm.send_to(bytes_data=frame)
+        await asyncio.sleep(max(0, start + (i + 1) * FRAME_MS / 1000 - time.perf_counter()))
+    await comm.send_json_to({"type": "stop_speaking"})
+
+    # the reply: audio frames until the transcript is final
+    while True:
+        out = await comm.receive_output(timeout=30)
+        if out.get("text") and '"is_final": true' in out["text"]:
+            break
+    await comm.disconnect()
+
+
+class SlowSink:
+    def __init__(self, f, delay_ms):
+        self.f = f
+        self.delay = delay_ms / 1000
+        self.writes = 0
+
+    def write(self, s):
+        self.writes += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.f.write(s)
+
+    def flush(self):
+        self.f.flush()
+
+
+async def main(args):
+    from agent import realtime_bridge
+    from agent.fake_realtime import FakeRealtimeServer
+
+    lags = []
+
+    async def ticker():
+        while True:
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - expected) * 1000)
+
+    tick = asyncio.create_task(ticker())
+    async with FakeRealtimeServer(first_audio_ms=100, reply_ms=args.reply_ms, speed=4.0) as fake:
+        realtime_bridge.REALTIME_URL = fake.url
+        await asyncio.gather(*(session(n, args) for n in range(args.sessions)))
+    tick.cancel()
+    return sorted(lags)
+
+
+def logging_share(profile):
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    total = logging_time = 0.0
+    for (filename, _, name), (_, _, tottime, _, _) in stats.stats.items():
+        total += tottime
+        if "logging" in filename or name in ("<built-in method builtins.print>",) or (
+            filename == "~" and "write" in name
+        ):
+            logging_time += tottime
+    return logging_time, total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--seconds", type=int, default=5, help="audio streamed per session")
+    parser.add_argument("--reply-ms", type=int, default=2000)
+    parser.add_argument("--log-file", default=os.devnull)
+    parser.add_argument("--sink-delay-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    report = sys.stdout
+    sink = SlowSink(open(args.log_file, "w"), args.sink_delay_ms)
+    sys.stdout = sys.stderr = sink
+    setup_django()
+
+    profile = cProfile.Profile()
+    cpu, wall = time.process_time(), time.perf_counter()
+    profile.enable()
+    try:
+        lags = asyncio.run(main(args))
+    except Exception as e:
+        # e.g. clients timing out behind a blocked event loop
+        print("run failed:", repr(e), file=report)
+        raise SystemExit(1)
+    profile.disable()
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    logging_time, total = logging_share(profile)
+    sink.flush()
+
+    frames = args.sessions * args.seconds * 1000 // FRAME_MS
+    print(f"{args.sessions} sessions, {frames} inbound frames, {wall:.1f} s wall", file=report)
+    print(f"process CPU        {cpu:8.2f} s  ({cpu / wall * 100:.0f}% of one core)", file=report)
+    print(
+        f"print + logging    {logging_time:8.2f} s  ({logging_time / total * 100:.1f}% of profiled time)",
+        file=report,
+    )
+    print(f"log writes         {sink.writes:8d}", file=report)
+    print(
+        f"event loop lag     p50 {lags[len(lags) // 2]:.1f} ms  p99 {lags[int(len(lags) * 0.99)]:.1f} ms  "
+        f"max {lags[-1]:.1f} ms",
+        file=report,
+    )
@@ -0,0 +1,143 @@
+"""
+UserMemory table growth and consolidation cost over synthetic histories.
+
+Every simulated user calls once a day for --days days. Each call "extracts"
+a few preferences/facts drawn from a small pool of paraphrases (what the
+LLM keeps re-discovering about a regular caller) plus one history summary.
+The same histories are written twice: plain inserts (the old behaviour)
+and through agent.consolidation.
+
+With --stored N, one more user starts with N distinct memories (a heavy
+user, or a table from before consolidation) and gets --days sessions;
+"plan" is the matching done before the transaction, "locked" the
+transaction that holds the DB write lock (BEGIN IMMEDIATE on SQLite).
+
+    python benchmarks/bench_memory_consolidation.py --users 20 --days 90
+    python benchmarks/bench_memory_consolidation.py --users 0 --days 20 --stored 2000
+"""
+import time
+import random
+import argparse
+import statistics
+
+from _django import setup_django
+
+PARAPHRASES = [
+    ("preference", ["Prefers short answers", "User prefers short answers.", "prefers concise, short answers"]),
+    ("preference", ["Likes jazz music", "Likes jazz music a lot", "User likes jazz music"]),
+    ("preference", ["Wants replies in English", "Wants all replies in English", "wants replies in english"]),
+    ("fact", ["Has a dog named Rex", "User has a dog named Rex", "Has a dog called Rex"]),
+    ("fact", ["Lives in Lyon", "Lives in Lyon, France", "User lives in Lyon"]),
+    ("fact", ["Works as a nurse", "Works as a nurse at night", "User works as a nurse"]),
+]
+VOCAB = (
+    "coffee tea jazz hiking running chess cooking spanish german piano guitar cycling garden sister "
+    "brother daughter train office nightshift vegan allergy kyoto berlin marathon novel podcast "
+    "budget mortgage doctor dentist yoga painting"
+).split()
+TOPICS = ["weather", "a recipe", "travel plans", "work stress", "a book", "the dog", "music", "a movie"]
+
+
+def synthetic_session(rng, day):
+    memories = []
+    for type_, variants in rng.sample(PARAPHRASES, 3):
+        memories.append({"type": type_, "content": rng.choice(variants), "importance": rng.randint(3, 8)})
+    memories.append(
+        {
+            "type": "history_summary",
+            "content": f"Day {day}: chatted about {rng.choice(TOPICS)} and {rng.choice(TOPICS)}.",
+            "importance": 4,
+        }
+    )
+    return memories
+
+
+def naive_save(user_id, memories):
+    from agent.memory import get_or_create_user
+    from agent.models import UserMemory
+
+    user = get_or_create_user(user_id)
+    for mem in memories:
+        UserMemory.objects.create(
+            user=user, type=mem["type"], content=mem["content"], importance=int(mem["importance"])
+        )
+
+
+def run(label, save, args):
+    from agent.models import UserMemory
+    from agent.memory import get_user_memories
+
+    UserMemory.objects.all().delete()
+    rng = random.Random(args.seed)
+    timings = []
+    for day in range(args.days):
+        for u in range(args.users):
+            memories = synthetic_session(rng, day)
+            start = time.perf_counter()
+            save(f"bench-{u}", memories)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    rows = UserMemory.objects.count()
+    top = get_user_memories("bench-0", 20)
+    timings.sort()
+    print(
+        f"{label:13s} {rows:8d} {rows / args.users:9.1f} {len(set(top)):7d}/20"
+        f" {statistics.median(timings):9.2f} {timings[int(len(timings) * 0.99)]:8.2f}"
+    )
+
+
+def run_stored(args):
+    from django.db import transaction
+
+    from agent.consolidation import apply_consolidation, plan_consolidation
+    from agent.memory import get_or_create_user
+    from agent.models import UserMemory
+
+    UserMemory.objects.all().delete()
+    rng = random.Random(args.seed)
+    user = get_or_create_user("bench-big")
+    UserMemory.objects.bulk_create(
+        UserMemory(
+            user=user,
+            type=rng.choice(["fact", "preference"]),
+            content=f"Note {i}: " + " ".join(rng.sample(VOCAB, 6)),
+            importance=rng.randint(1, 9),
+        )
+        for i in range(args.stored)
+    )
+    plan_ms, locked_ms = [], []
+    for day in range(args.days):
+        start = time.perf_counter()
+        plan = plan_consolidation("bench-big", synthetic_session(rng, day))
+        planned = time.perf_counter()
+        with transaction.atomic():
+            apply_consolidation(plan)
+        plan_ms.append((planned - start) * 1000)
+        locked_ms.append((time.perf_counter() - planned) * 1000)
+    print(
+        f"{args.stored} stored memories, {args.days} sessions: plan p50 {statistics.median(plan_ms):.1f} ms"
+        f" max {max(plan_ms):.1f}, locked p50 {statistics.median(locked_ms):.1f} ms max {max(locked_ms):.1f}"
+    )
+
+
+def main(args):
+    from agent.consolidation import consolidate_memories
+
+    if args.users:
+        print(f"{args.users} users x {args.days} daily calls")
+        print(f"{'writer':13s} {'rows':>8s} {'rows/user':>9s} {'distinct top':>10s} {'p50 ms':>9s} {'p99 ms':>8s}")
+        run("plain insert", naive_save, args)
+        run("consolidated", consolidate_memories, args)
+    if args.stored:
+        run_stored(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stored", type=int, default=0, help="memories already stored for one more user")
+    args = parser.parse_args()
+    setup_django()
+    main(args)
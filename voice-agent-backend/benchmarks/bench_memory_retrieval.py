@@ -0,0 +1,107 @@
+"""
+Memory retrieval: ORDER BY importance (get_user_memories, top 20) vs the
+per-user vector index (agent.retrieval, cosine top-k on what the user said).
+
+For each memory count a user gets that many synthetic memories, a few of
+which are "about" a topic the user then brings up. Reports retrieval
+latency, prompt size of the rendered memory block (~4 chars per token) and
+whether the on-topic memory made it into the prompt.
+
+    python benchmarks/bench_memory_retrieval.py --sizes 100 1000 5000
+"""
+import time
+import random
+import argparse
+import statistics
+
+from _django import setup_django
+
+SUBJECTS = ["dog", "marathon", "guitar", "allergy", "job", "trip", "sister", "car", "garden", "book"]
+ADJECTIVES = ["old", "new", "favourite", "annoying", "expensive", "weekly", "secret", "noisy"]
+TOPICS = {
+    "Is learning Japanese for a trip to Kyoto in April": "Any tips for my Kyoto trip?",
+    "Allergic to peanuts and shellfish": "Can I eat the peanut sauce at this place?",
+    "Is training for the Berlin marathon": "How far should I run before the marathon?",
+    "Has a dog named Rex who is afraid of thunder": "There's a thunderstorm and Rex is hiding",
+}
+
+
+def filler(rng, i):
+    return f"Mentioned a {rng.choice(ADJECTIVES)} {rng.choice(SUBJECTS)} (note {i})"
+
+
+def populate(user_id, n, rng):
+    from agent.models import UserMemory
+    from agent.retrieval import embed_memories
+    from agent.memory import get_or_create_user
+
+    user = get_or_create_user(user_id)
+    UserMemory.objects.filter(user=user).delete()
+    rows = [
+        UserMemory(user=user, type="fact", content=filler(rng, i), importance=rng.randint(4, 9))
+        for i in range(n - len(TOPICS))
+    ]
+    # the relevant ones are deliberately unremarkable
+    rows += [UserMemory(user=user, type="fact", content=c, importance=3) for c in TOPICS]
+    embed_memories(rows)
+    UserMemory.objects.bulk_create(rows, batch_size=1000)
+
+
+def tokens(memories):
+    from agent.prompts import render_memory_block
+
+    return len(render_memory_block(memories)) // 4
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples)
+
+
+def main(args):
+    from agent.memory import get_user_memories
+    from agent.retrieval import MEMORY_PROMPT_K, MemoryIndexStore
+
+    rng = random.Random(args.seed)
+    print(
+        f"{'memories':>8s}  {'method':18s} {'ms':>8s} {'tokens':>7s} {'on-topic hit':>12s}"
+    )
+    for n in args.sizes:
+        user_id = f"bench-{n}"
+        populate(user_id, n, rng)
+
+        ordered, ms = timed(lambda: get_user_memories(user_id, 20), args.repeat)
+        hits = sum(fact in ordered for fact in TOPICS)
+        print(f"{n:8d}  {'ORDER BY top 20':18s} {ms:8.2f} {tokens(ordered):7d} {hits:>9d}/{len(TOPICS)}")
+
+        store = MemoryIndexStore()
+        _, build_ms = timed(lambda: MemoryIndexStore().get(user_id), 1)
+        index, reuse_ms = timed(lambda: store.get(user_id), args.repeat)
+        print(f"{n:8d}  {'index build (cold)':18s} {build_ms:8.2f}")
+        print(f"{n:8d}  {'index revalidate':18s} {reuse_ms:8.2f}")
+
+        search_ms, hits, prompt_tokens = [], 0, []
+        for fact, utterance in TOPICS.items():
+            found, ms = timed(lambda: index.search(utterance, MEMORY_PROMPT_K), args.repeat)
+            search_ms.append(ms)
+            hits += fact in found
+            prompt_tokens.append(tokens(found))
+        label = f"cosine top {MEMORY_PROMPT_K}"
+        print(
+            f"{n:8d}  {label:18s} {statistics.median(search_ms):8.2f}"
+            f" {max(prompt_tokens):7d} {hits:>9d}/{len(TOPICS)}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    setup_django()
+    main(args)
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark for agent.audio.StreamingResampler.
+
+Feeds N seconds of speech-band noise through the resampler in realistic
+chunk sizes and reports CPU milliseconds spent per second of audio.
+
+    python benchmarks/bench_resample.py --seconds 30
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.audio import StreamingResampler  # noqa: E402
+
+CASES = [
+    # (label, src, dst, chunk bytes)
+    ("uplink 16k->24k (worklet frames)", 16000, 24000, 256),
+    ("uplink 16k->24k (40ms frames)", 16000, 24000, 1280),
+    ("downlink 24k->48k", 24000, 48000, 4800),
+    ("downlink 24k->44.1k", 24000, 44100, 4800),
+]
+
+
+def run_case(src, dst, chunk, seconds):
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(src * seconds) * 3000).astype("<i2").tobytes()
+    r = StreamingResampler(src, dst)
+    start = time.process_time()
+    for i in range(0, len(pcm), chunk):
+        r.process(pcm[i:i + chunk])
+    return (time.process_time() - start) * 1000 / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=int, default=30)
+    args = parser.parse_args()
+
+    for label, src, dst, chunk in CASES:
+        ms = run_case(src, dst, chunk, args.seconds)
+        print(f"{label:36s} {ms:7.3f} ms CPU / s audio  ({ms / 10:.3f}% of a core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Session capacity per worker count: for each --workers value, start the app
+with `manage.py runworkers` (and the fake upstream), then raise the number
+of concurrent bench_load sessions by --step until the p90 of stop_speaking
+-> first audio goes over --slo-ms or a session fails. Capacity is the last
+level that passed; scaling efficiency is capacity / (workers * capacity of
+one worker).
+
+Capacity can only grow with workers while there are cores for them (and
+for the driver and the fake, which share the machine): see "cpus" in the
+output and the harness CPU columns.
+
+    python benchmarks/bench_scaling.py --workers 1 2 4 --start 10 --step 10 --out scaling.json
+"""
+import os
+import json
+import asyncio
+import argparse
+
+from _django import setup_django
+from bench_load import Processes, drive, load_pcm, report
+
+
+def capacity(args, workers, pcm, rate, db_path):
+    args.workers = workers
+    levels, passed = [], 0
+    with Processes(args, db_path) as procs:
+        sessions = args.start
+        while sessions <= args.max_sessions:
+            args.sessions = sessions
+            result = report(
+                *asyncio.run(drive(procs.url, pcm, rate, args, procs.server_pids, procs.fake.pid)), args
+            )
+            p90 = result["first_audio_ms"]["p90"] if result["first_audio_ms"] else None
+            ok = result["failed"] == 0 and p90 is not None and p90 <= args.slo_ms
+            levels.append(
+                {
+                    "sessions": sessions,
+                    "ok": ok,
+                    "first_audio_p90_ms": p90,
+                    "failed": result["failed"],
+                    "server_cpu_pct_of_core": result["server"]["cpu_pct_of_core"],
+                    "driver_cpu_pct_of_core": result["harness"]["driver_cpu_pct_of_core"],
+                    "fake_cpu_pct_of_core": result["harness"]["fake_upstream_cpu_pct_of_core"],
+                }
+            )
+            print(f"workers={workers} sessions={sessions} p90={p90} ms failed={result['failed']}", flush=True)
+            if not ok:
+                break
+            passed = sessions
+            sessions += args.step
+    return passed, levels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--start", type=int, default=10)
+    parser.add_argument("--step", type=int, default=10)
+    parser.add_argument("--max-sessions", type=int, default=500)
+    parser.add_argument("--slo-ms", type=float, default=600, help="p90 stop_speaking -> first audio")
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--out")
+    cli = parser.parse_args()
+
+    # everything else as bench_load's defaults
+    args = argparse.Namespace(
+        ramp_s=2.0, think_ms=500, pcm=None, rate=16000, timeout=30,
+        first_audio_ms=300, reply_ms=2000, chunk_ms=100, speed=1.0, words_per_s=5,
+        server_url=None, log_level="WARNING", server_output=False,
+        turns=cli.turns, start=cli.start, step=cli.step, max_sessions=cli.max_sessions, slo_ms=cli.slo_ms,
+    )
+    pcm, rate = load_pcm(None, args.rate)
+    db_path = setup_django()
+
+    results = {}
+    for workers in cli.workers:
+        cap, levels = capacity(args, workers, pcm, rate, db_path)
+        results[workers] = {"capacity": cap, "levels": levels}
+    base = results[cli.workers[0]]["capacity"] / cli.workers[0] if results[cli.workers[0]]["capacity"] else 0
+    summary = {
+        "cpus": os.cpu_count(),
+        "slo_first_audio_p90_ms": cli.slo_ms,
+        "workers": {
+            w: {
+                "capacity": r["capacity"],
+                "efficiency": round(r["capacity"] / (w * base), 2) if base else None,
+                "levels": r["levels"],
+            }
+            for w, r in results.items()
+        },
+    }
+    text = json.dumps(summary, indent=2)
+    if cli.out:
+        with open(cli.out, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,72 @@
+"""
+Time-to-`ready` for new /ws/voice/ sessions, with and without the warm
+Realtime connection pool (agent.upstream_pool).
+
+The local fake upstream adds --handshake-ms before accepting each
+connection to stand in for TLS + WebSocket setup to the real service.
+
+    python benchmarks/bench_time_to_ready.py --calls 20 --handshake-ms 250
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+from _django import setup_django
+
+
+async def time_to_ready(user_id):
+    from channels.testing import WebsocketCommunicator
+    from agent.consumers import VoiceConsumer
+
+    comm = WebsocketCommunicator(VoiceConsumer.as_asgi(), f"/ws/voice/?user_id={user_id}")
+    start = time.perf_counter()
+    await comm.connect()
+    while (await comm.receive_json_from(timeout=10)).get("type") != "ready":
+        pass
+    elapsed = (time.perf_counter() - start) * 1000
+    await comm.disconnect()
+    return elapsed
+
+
+async def main(args):
+    from agent import realtime_bridge
+    from agent.fake_realtime import FakeRealtimeServer
+    from agent.prompt_cache import memory_cache
+
+    pool = realtime_bridge.realtime_pool
+
+    async with FakeRealtimeServer(handshake_ms=args.handshake_ms) as fake:
+        realtime_bridge.REALTIME_URL = fake.url
+        print(f"{'pool size':10s} {'median ms':>10s} {'p90 ms':>8s}  hits/misses")
+        for size in (0, args.pool_size):
+            pool.size = size
+            pool.start()
+            await asyncio.sleep(args.handshake_ms / 1000 * (size + 1) + 0.2)  # let it warm up
+            samples = []
+            for n in range(args.calls):
+                samples.append(await time_to_ready(f"bench-{n}"))
+                # callers arrive spaced out, giving the pool time to refill
+                await asyncio.sleep(args.gap_ms / 1000)
+            samples.sort()
+            p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+            print(
+                f"{size:<10d} {statistics.median(samples):10.1f} {p90:8.1f}  "
+                f"{pool.hits}/{pool.misses}"
+            )
+            await pool.close()
+            pool.hits = pool.misses = 0
+
+    # the second pass reconnects the same users
+    print("memory cache:", memory_cache.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--handshake-ms", type=int, default=250)
+    parser.add_argument("--gap-ms", type=int, default=400)
+    args = parser.parse_args()
+    setup_django()
+    asyncio.run(main(args))
@@ -0,0 +1,120 @@
+"""
+End-of-speech -> first-audio latency per turn-detection mode.
+
+Replays a recorded utterance (raw PCM16 mono, --rate Hz, or a synthetic one)
+in real time through VoiceConsumer, with RealtimeBridge talking to the local
+fake upstream (agent.fake_realtime), and measures the time from the end of
+speech in the recording to the first audio byte coming back.
+
+  manual      the "user" releases the button --release-ms after speech ends
+  server_vad  the fake upstream runs VAD on input_audio_buffer.append
+  local_vad   the consumer's EnergyVAD commits the turn
+
+    python benchmarks/bench_turn_latency.py --trials 5 [--pcm utterance.raw --rate 16000]
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import numpy as np
+
+from _django import setup_django
+
+FRAME_MS = 20
+
+
+def synthetic_utterance(rate, speech_ms=1500, silence_ms=1500):
+    t = np.arange(rate * speech_ms // 1000) / rate
+    voiced = 8000 * np.sin(2 * np.pi * 180 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+    silence = np.zeros(rate * silence_ms // 1000)
+    return np.concatenate((voiced, silence)).astype("<i2").tobytes()
+
+
+def speech_end_offset(pcm, rate, threshold_dbfs=-45):
+    """Byte offset just after the last loud 20 ms frame."""
+    frame = rate * FRAME_MS // 1000
+    samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+    n = len(samples) // frame
+    energy = np.mean(samples[: n * frame].reshape(n, frame) ** 2, axis=1)
+    loud = np.nonzero(energy > (32768 * 10 ** (threshold_dbfs / 20)) ** 2)[0]
+    return (int(loud[-1]) + 1) * frame * 2 if len(loud) else len(pcm)
+
+
+async def run_trial(mode, pcm, rate, release_ms):
+    from channels.testing import WebsocketCommunicator
+    from agent.consumers import VoiceConsumer
+
+    comm = WebsocketCommunicator(
+        VoiceConsumer.as_asgi(), f"/ws/voice/?user_id=bench&turn_detection={mode}"
+    )
+    await comm.connect()
+    await comm.send_json_to({"type": "start_session", "sample_rate": rate, "codec": "pcm16"})
+    while (await comm.receive_json_from(timeout=10)).get("type") != "ready":
+        pass
+
+    frame_bytes = rate * FRAME_MS // 1000 * 2
+    end_offset = speech_end_offset(pcm, rate)
+    first_audio = asyncio.get_running_loop().create_future()
+
+    async def reader():
+        while True:
+            out = await comm.receive_output(timeout=30)
+            if out.get("bytes") is not None and not first_audio.done():
+                first_audio.set_result(time.perf_counter())
+
+    reader_task = asyncio.create_task(reader())
+    start = time.perf_counter()
+    speech_end_at = None
+    for i, offset in enumerate(range(0, len(pcm), frame_bytes)):
+        if first_audio.done():
+            break
+        await comm.send_to(bytes_data=pcm[offset:offset + frame_bytes])
+        if speech_end_at is None and offset + frame_bytes >= end_offset:
+            speech_end_at = time.perf_counter()
+            if mode == "manual":
+                await asyncio.sleep(release_ms / 1000)
+                await comm.send_json_to({"type": "stop_speaking"})
+                break
+        # real-time pacing
+        await asyncio.sleep(max(0, start + (i + 1) * FRAME_MS / 1000 - time.perf_counter()))
+
+    got = await asyncio.wait_for(first_audio, timeout=10)
+    reader_task.cancel()
+    await comm.disconnect()
+    return (got - speech_end_at) * 1000
+
+
+async def main(args):
+    from agent import realtime_bridge
+    from agent.fake_realtime import FakeRealtimeServer
+
+    if args.pcm:
+        with open(args.pcm, "rb") as f:
+            pcm = f.read()
+    else:
+        pcm = synthetic_utterance(args.rate)
+
+    async with FakeRealtimeServer(first_audio_ms=args.first_audio_ms) as fake:
+        realtime_bridge.REALTIME_URL = fake.url
+        print(f"{'mode':12s} {'median ms':>10s} {'p90 ms':>8s}  (speech end -> first audio)")
+        for mode in args.modes:
+            samples = [
+                await run_trial(mode, pcm, args.rate, args.release_ms) for _ in range(args.trials)
+            ]
+            samples.sort()
+            p90 = samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+            print(f"{mode:12s} {statistics.median(samples):10.1f} {p90:8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pcm", help="raw PCM16 mono recording")
+    parser.add_argument("--rate", type=int, default=16000)
+    parser.add_argument("--trials", type=int, default=3)
+    parser.add_argument("--release-ms", type=int, default=250, help="push-to-talk release lag")
+    parser.add_argument("--first-audio-ms", type=int, default=150, help="fake model latency")
+    parser.add_argument("--modes", nargs="+", default=["manual", "server_vad", "local_vad"])
+    args = parser.parse_args()
+    setup_django()
+    asyncio.run(main(args))
@@ -13,6 +13,8 @@ django_asgi_app = get_asgi_application()
 
 # ✅ Only now import anything that touches models / routing
 from agent import routing as agent_routing
+from agent.realtime_bridge import realtime_pool
+from agent.upstream_pool import PoolStartupMiddleware
 
 
 application = ProtocolTypeRouter(
@@ -25,3 +27,7 @@ application = ProtocolTypeRouter(
         ),
     }
 )
+
+# warm Realtime connections (REALTIME_POOL_SIZE) are opened at startup, not
+# by the first call
+application = PoolStartupMiddleware(application, realtime_pool)
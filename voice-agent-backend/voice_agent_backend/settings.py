@@ -80,12 +80,62 @@ ASGI_APPLICATION = "voice_agent_backend.asgi.application"
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PROFILE=sqlite (single node, default) or postgres.
+
+# Threads serving database_sync_to_async calls. Daphne sizes its default
+# executor from the same ASGI_THREADS variable.
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+DB_PROFILE = os.getenv("DB_PROFILE", "sqlite")
+
+if DB_PROFILE == "postgres":
+    # DB_POOL=1: psycopg pool with one connection per ASGI thread (plus
+    # headroom for the management commands sharing the process);
+    # DB_POOL=0: persistent per-thread connections instead
+    DB_POOL = os.getenv("DB_POOL", "1") == "1"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "voice_agent"),
+            "USER": os.getenv("POSTGRES_USER", "voice_agent"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "127.0.0.1"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            # pooling and persistent connections are mutually exclusive
+            "CONN_MAX_AGE": 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", str(ASGI_THREADS + 2))),
+                    "timeout": float(os.getenv("DB_POOL_TIMEOUT_S", "10")),
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+    # DB calls from different sessions run in parallel on the ASGI threads
+    DB_THREAD_SENSITIVE = False
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                # take the write lock at BEGIN: a read-then-write transaction
+                # can't deadlock with another writer and fail without waiting
+                "transaction_mode": "IMMEDIATE",
+                "timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000,
+            },
+        }
+    }
+    # applied to every new connection by agent.db.configure_sqlite
+    SQLITE_PRAGMAS = {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    }
+    # one writer anyway: keep this process's DB calls on a single thread
+    DB_THREAD_SENSITIVE = True
 
 
 # Password validation
@@ -125,11 +175,34 @@ USE_TZ = True
 STATIC_URL = 'static/'
 
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            "hosts": [os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")],
+# agent.* logs go through a queue to a writer thread (agent/log.py);
+# per-frame events are summarized every LOG_FRAME_SUMMARY_S
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "agent_queue": {"()": "agent.log.QueueLogHandler"},
+    },
+    "loggers": {
+        "agent": {
+            "handlers": ["agent_queue"],
+            "level": os.getenv("LOG_LEVEL", "INFO"),
+            "propagate": False,
         },
     },
-}
\ No newline at end of file
+}
+
+
+# CHANNEL_LAYER=redis (default) or memory: single process, no Redis, e.g.
+# for benchmarks/bench_load.py
+if os.getenv("CHANNEL_LAYER", "redis") == "memory":
+    CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")],
+            },
+        },
+    }
\ No newline at end of file
@@ -17,6 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
+from agent import views as agent_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', agent_views.metrics, name='metrics'),
+    path('healthz', agent_views.healthz, name='healthz'),
 ]